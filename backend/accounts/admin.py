@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from api.search import SearchIndexAdminMixin
+from backend.routers import ReplicaChangeListMixin
 from .models import User, SignalPlan, SignalPurchaseHistory
 
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(ReplicaChangeListMixin, SearchIndexAdminMixin, UserAdmin):
     model = User
     list_display = ('id', 'username', 'email', 'full_name', 'balance', 'wallet_address', 'phone_number', 'occupation', 'is_staff', 'is_active', 'signal_strength')
     readonly_fields = ('referral_code',)  # Add this line to make it read-only
@@ -15,6 +17,7 @@ class CustomUserAdmin(UserAdmin):
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
     )
     search_fields = ('email', 'username', 'full_name')
+    search_index_lookups = {'user': 'pk'}
     ordering = ('email',)
 
 # First register the default User admin
@@ -27,8 +30,11 @@ class SignalPlanAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
 
 @admin.register(SignalPurchaseHistory)
-class SignalPurchaseHistoryAdmin(admin.ModelAdmin):
+class SignalPurchaseHistoryAdmin(ReplicaChangeListMixin, SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'plan', 'amount', 'date')
     list_filter = ('plan', 'date')
     search_fields = ('user__email', 'user__full_name')
+    search_index_lookups = {'user': 'user_id'}
     raw_id_fields = ('user',  )
+    # plan is nullable, so the admin would not join it by itself
+    list_select_related = ('user', 'plan')
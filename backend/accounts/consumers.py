@@ -2,6 +2,7 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
+from api import metrics
 
 User = get_user_model()
 
@@ -17,8 +18,10 @@ class BalanceConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        metrics.websocket_connections.inc()
     
     async def disconnect(self, close_code):
+        metrics.websocket_connections.dec()
         # Leave room group
         await self.channel_layer.group_discard(
             self.balance_group_name,
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with the work factor taken from PASSWORD_HASH_ITERATIONS. Hashes
+    made with any other iteration count are upgraded (or downgraded) the next
+    time the user logs in, see User.check_password.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
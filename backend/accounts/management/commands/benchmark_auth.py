@@ -0,0 +1,65 @@
+import time
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+from accounts.views import login_user, register_user
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure logins/sec and registrations/sec on a single core through the real views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Logins and registrations to time')
+        parser.add_argument(
+            '--iterations', type=int, action='append',
+            help='PBKDF2 iterations to try (repeatable, defaults to PASSWORD_HASH_ITERATIONS)',
+        )
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        iterations = options['iterations'] or [settings.PASSWORD_HASH_ITERATIONS]
+        self.stdout.write(f"{'iterations':>12}{'logins/sec':>14}{'registrations/sec':>20}")
+        for count in iterations:
+            with override_settings(PASSWORD_HASH_ITERATIONS=count):
+                logins, registrations = self.run_benchmark(options['requests'])
+            self.stdout.write(f"{count:>12,}{logins:>14,.1f}{registrations:>20,.1f}")
+
+    def run_benchmark(self, requests):
+        # Everything happens in one transaction that is rolled back, so no
+        # users are left behind and no welcome emails are sent
+        results = {}
+        try:
+            with transaction.atomic():
+                prefix = uuid.uuid4().hex[:8]
+                start = time.perf_counter()
+                for i in range(requests):
+                    response = self.post(register_user, {
+                        'email': f'bench-{prefix}-{i}@example.com',
+                        'full_name': 'Benchmark User',
+                        'password': 'benchmark-password',
+                    })
+                    assert response.status_code == 201, response.data
+                results['registrations'] = requests / (time.perf_counter() - start)
+
+                start = time.perf_counter()
+                for i in range(requests):
+                    response = self.post(login_user, {
+                        'email': f'bench-{prefix}-{i}@example.com',
+                        'password': 'benchmark-password',
+                    })
+                    assert response.status_code == 200, response.data
+                results['logins'] = requests / (time.perf_counter() - start)
+                raise Rollback
+        except Rollback:
+            pass
+        return results['logins'], results['registrations']
+
+    def post(self, view, data):
+        return view(self.factory.post('/', data, format='json'))
@@ -5,6 +5,7 @@ from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from accounts.models import User
+from api import metrics
 
 class Command(BaseCommand):
     help = 'Check for expired signal plans and notify users'
@@ -46,8 +47,10 @@ class Command(BaseCommand):
                     html_message=html_message,
                     fail_silently=False,
                 )
+                metrics.signal_notifications.inc(kind='expiring', outcome='sent')
                 self.stdout.write(self.style.SUCCESS(f"Expiration warning sent to {user.email}"))
             except Exception as e:
+                metrics.signal_notifications.inc(kind='expiring', outcome='failed')
                 self.stdout.write(self.style.ERROR(f"Failed to send expiration warning to {user.email}: {str(e)}"))
         
         # Send notifications for expired plans and reset them
@@ -73,8 +76,11 @@ class Command(BaseCommand):
                 user.signal_strength = 1
                 user.save()
                 
+                metrics.signal_notifications.inc(kind='expired', outcome='sent')
                 self.stdout.write(self.style.SUCCESS(f"Expiration notification sent to {user.email} and signal reset"))
             except Exception as e:
+                metrics.signal_notifications.inc(kind='expired', outcome='failed')
                 self.stdout.write(self.style.ERROR(f"Failed to process expiration for {user.email}: {str(e)}"))
         
+        metrics.signal_check_last_run.set(timezone.now().timestamp())
         self.stdout.write(self.style.SUCCESS(f"Processed {expiring_soon.count()} expiring and {just_expired.count()} expired plans")) 
\ No newline at end of file
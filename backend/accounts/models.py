@@ -1,6 +1,8 @@
 import uuid
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from backend.mixins import LoadedValuesMixin
+from transactions.money import BALANCE_CURRENCY, minor_units_field
 # from channels.layers import get_channel_layer
 # from asgiref.sync import async_to_sync
 import json
@@ -9,7 +11,7 @@ def generate_referral_code():
     """Generate a unique 8-character referral code."""
     return str(uuid.uuid4().hex[:8]).upper()
 
-class User(AbstractUser):
+class User(LoadedValuesMixin, AbstractUser):
     full_name = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
     wallet_network = models.CharField(max_length=10, blank=True, null=True)  # Store ETH, BTC, etc.
@@ -17,6 +19,7 @@ class User(AbstractUser):
     referral_code = models.CharField(max_length=10, unique=True, editable=False, default=generate_referral_code)
     transaction_pin = models.CharField(max_length=4, blank=True, null=True)
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    balance_minor = minor_units_field('balance', currency=BALANCE_CURRENCY)
     address = models.TextField(blank=True, null=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     occupation = models.CharField(max_length=255, blank=True, null=True)
@@ -43,14 +46,25 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'full_name']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Signal management filters and expiry checks
+            models.Index(fields=['signal_strength', 'signal_expires_at']),
+            models.Index(fields=['signal_expires_at']),
+        ]
+
     def __str__(self):
         return self.email
 
     def save(self, *args, **kwargs):
-        # Check if this is an update and if balance has changed
-        if self.pk is not None:
-            old_user = User.objects.get(pk=self.pk)
-            balance_changed = old_user.balance != self.balance
+        # Check if this is an update and if balance has changed, using the
+        # values the instance was loaded with when we have them
+        loaded = getattr(self, '_loaded_values', {})
+        if self.pk is not None and 'balance' in loaded:
+            balance_changed = loaded['balance'] != self.balance
+        elif self.pk is not None:
+            old_balance = User.objects.filter(pk=self.pk).values_list('balance', flat=True).first()
+            balance_changed = old_balance != self.balance
         else:
             balance_changed = False
             
@@ -1,13 +1,14 @@
 from rest_framework import serializers
+from api.profiling import ProfiledSerializerMixin
 from .models import User
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'full_name', 'email', 'referral_code', 'transaction_pin', 'balance', 'phone_number', 'address', 'occupation', 'annual_income']
         read_only_fields = ['id', 'referral_code', 'balance']
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     
     class Meta:
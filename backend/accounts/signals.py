@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from backend.routers import mark_user_write
+from .models import User
+
+
+@receiver(post_save, sender=User)
+def pin_user_to_primary(sender, instance, **kwargs):
+    """Keep the user reading from the primary right after their row changes"""
+    mark_user_write(instance.pk)
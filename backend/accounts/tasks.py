@@ -0,0 +1,6 @@
+"""Jobs run on the schedules in settings.JOB_SCHEDULES (see jobs.queue)"""
+from django.core.management import call_command
+
+
+def check_signal_expirations():
+    call_command('check_signal_expirations')
@@ -1,3 +1,183 @@
-from django.test import TestCase
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api.testing import TEST_CACHES, QueryRegressionTestCase
+from jobs.models import Job
+from transactions.models import Transaction, WalletBalance
+from .models import User, SignalPlan, SignalPurchaseHistory
 
-# Create your tests here.
+# Password checks are not what these tests measure
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def make_user(name, **extra):
+    return User.objects.create(username=name, email=f'{name}@example.com', full_name=name.title(), **extra)
+
+
+class AccountFixturesMixin:
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('owner', balance=Decimal('1000'))
+        WalletBalance.objects.create(user=self.user, currency='USDT', amount_minor=100000)
+        self.staff = make_user('staff', is_staff=True, is_superuser=True)
+        self.plan = SignalPlan.objects.create(name='Pro', price=Decimal('50'), strength_level=3, duration_days=30)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.client.force_login(self.staff)
+        self.created = 0
+
+    def grow_users(self, size):
+        """Bring the platform up to `size` extra users, each with a signal plan purchase"""
+        while self.created < size:
+            self.created += 1
+            user = make_user(
+                f'user{self.created}', signal_strength=3,
+                signal_expires_at=timezone.now() + timezone.timedelta(hours=self.created),
+            )
+            plan = SignalPlan.objects.create(
+                name=f'Plan {self.created}', price=Decimal('10'), strength_level=2, duration_days=7
+            )
+            tx = Transaction.objects.create(
+                user=user, type='signal_purchase', status='successful', amount=plan.price, currency='USD'
+            )
+            SignalPurchaseHistory.objects.create(user=user, plan=plan, amount=plan.price, transaction=tx)
+
+
+class AccountEndpointQueryTests(AccountFixturesMixin, QueryRegressionTestCase):
+    def test_balance(self):
+        url = reverse('get_user_balance')
+        # The wallet balances; the rates come from the process cache
+        self.assertNumQueriesAtSizes(1, self.grow_users, lambda: self.api.get(url))
+
+    def test_signal_strength(self):
+        url = reverse('get_signal_strength')
+        self.assertNumQueriesAtSizes(0, self.grow_users, lambda: self.api.get(url))
+
+    def test_signal_plans(self):
+        url = reverse('get_signal_plans')
+        self.assertNumQueriesAtSizes(1, self.grow_users, lambda: self.api.get(url))
+
+    def test_purchase_signal_plan(self):
+        url = reverse('purchase_signal_plan')
+        data = {'plan_id': self.plan.id}
+        # Includes picking the wallet to pay from, queueing the confirmation
+        # email job and the wallet upsert
+        self.assertNumQueriesAtSizes(20, self.grow_users, lambda: self.api.post(url, data, format='json'))
+
+    @override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+    def test_login(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('secret'))
+        url = reverse('login')
+        data = {'email': self.user.email, 'password': 'secret'}
+        self.assertNumQueriesAtSizes(1, self.grow_users, lambda: APIClient().post(url, data, format='json'))
+
+
+class AccountAdminQueryTests(AccountFixturesMixin, QueryRegressionTestCase):
+    def test_user_changelist(self):
+        url = reverse('admin:accounts_user_changelist')
+        self.assertNumQueriesAtSizes(6, self.grow_users, lambda: self.client.get(url))
+
+    def test_user_change_page(self):
+        self.grow_users(1)
+        with self.assertNumQueries(10):
+            self.client.get(reverse('admin:accounts_user_change', args=[self.user.pk]))
+
+    def test_signal_plan_changelist(self):
+        url = reverse('admin:accounts_signalplan_changelist')
+        self.assertNumQueriesAtSizes(5, self.grow_users, lambda: self.client.get(url))
+
+    def test_signal_purchase_changelist(self):
+        url = reverse('admin:accounts_signalpurchasehistory_changelist')
+        self.assertNumQueriesAtSizes(6, self.grow_users, lambda: self.client.get(url))
+
+    def test_manage_signal_strength(self):
+        url = reverse('admin_manage_signal_strength')
+        self.assertNumQueriesAtSizes(4, self.grow_users, lambda: self.client.get(url))
+
+    def test_manage_signal_strength_filtered(self):
+        url = reverse('admin_manage_signal_strength')
+        params = {'strength': '3', 'status': 'active', 'expiring_hours': '48'}
+        self.assertNumQueriesAtSizes(4, self.grow_users, lambda: self.client.get(url, params))
+
+
+@override_settings(CACHES=TEST_CACHES, PASSWORD_HASHERS=FAST_HASHERS)
+class RegistrationTests(TestCase):
+    def test_welcome_email_job_holds_no_secrets(self):
+        data = {'email': 'new@example.com', 'full_name': 'New User', 'password': 'hunter2-secret', 'transaction_pin': '4821'}
+        response = APIClient().post(reverse('register'), data, format='json')
+        self.assertEqual(response.status_code, 201)
+        # The queued job's kwargs are kept for days and shown in the admin
+        job = Job.objects.get()
+        self.assertEqual(job.kwargs['messages'][0]['to'], ['new@example.com'])
+        self.assertNotIn('hunter2-secret', str(job.kwargs))
+        self.assertNotIn('4821', str(job.kwargs))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SignalManagementTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.lapsed = make_user('lapsed', signal_strength=1, signal_expires_at=now - timezone.timedelta(days=1))
+        self.active = make_user('active', signal_strength=1, signal_expires_at=now + timezone.timedelta(days=1))
+        self.strong = make_user('strong', signal_strength=4, signal_expires_at=now - timezone.timedelta(days=1))
+        self.client.force_login(make_user('staff', is_staff=True, is_superuser=True, signal_strength=3))
+        self.url = reverse('admin_manage_signal_strength')
+
+    def post(self, **data):
+        response = self.client.post(self.url, {'bulk_action': 'set', 'bulk_days': '7', 'bulk_strength': '2', **data}, follow=True)
+        return [str(message) for message in response.context['messages']]
+
+    def strengths(self):
+        return dict(User.objects.values_list('username', 'signal_strength'))
+
+    def test_only_the_filtered_users_change(self):
+        self.assertEqual(self.post(strength='1', status='expired'), ['Signal plan updated for 1 users'])
+        self.assertEqual(self.strengths(), {'lapsed': 2, 'active': 1, 'strong': 4, 'staff': 3})
+        self.lapsed.refresh_from_db()
+        self.assertGreater(self.lapsed.signal_expires_at, timezone.now() + timezone.timedelta(days=6))
+
+    def test_every_user_needs_an_explicit_choice(self):
+        reports = self.post()
+        self.assertIn('Filter the users to update', reports[0])
+        self.assertEqual(self.strengths(), {'lapsed': 1, 'active': 1, 'strong': 4, 'staff': 3})
+
+        self.assertEqual(self.post(all_users='1'), ['Signal plan updated for 4 users'])
+        self.assertEqual(set(self.strengths().values()), {2})
+
+
+class AccountQueryPlanTests(QueryRegressionTestCase):
+    def test_login_lookup(self):
+        self.assertQueryPlan(
+            User.objects.filter(email='owner@example.com'),
+            [('SEARCH', 'accounts_user', 'sqlite_autoindex_accounts_user_2')],
+        )
+
+    def test_expiring_signals(self):
+        now = timezone.now()
+        self.assertQueryPlan(
+            User.objects.filter(
+                signal_expires_at__lt=now + timezone.timedelta(hours=24), signal_expires_at__gt=now, signal_strength__gt=1,
+            ),
+            [('SEARCH', 'accounts_user', 'accounts_us_signal__9f443a_idx')],
+        )
+
+    def test_manage_signal_strength_page(self):
+        now = timezone.now()
+        self.assertQueryPlan(
+            User.objects.filter(signal_strength=3, signal_expires_at__gte=now)
+            .order_by('signal_strength', 'signal_expires_at', 'id')[:50],
+            [('SEARCH', 'accounts_user', 'accounts_us_signal__1624fb_idx')],
+        )
+
+    def test_manage_signal_strength_expired(self):
+        now = timezone.now()
+        self.assertQueryPlan(
+            User.objects.filter(Q(signal_expires_at__isnull=True) | Q(signal_expires_at__lt=now))
+            .order_by('signal_strength', 'signal_expires_at', 'id')[:50],
+            # Walks the index in page order and stops after one page
+            [('SCAN', 'accounts_user', 'accounts_us_signal__1624fb_idx')],
+        )
@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import register_user, login_user, get_user_balance, update_user_profile, get_signal_strength, get_signal_plans, purchase_signal_plan, admin_manage_signal_strength, admin_update_user_signal
+from .views import register_user, login_user, logout_user, get_user_balance, update_user_profile, get_signal_strength, get_signal_plans, purchase_signal_plan, admin_manage_signal_strength, admin_update_user_signal
 
 urlpatterns = [
     path('register/', register_user, name='register'),
     path('login/', login_user, name='login'),
+    path('logout/', logout_user, name='logout'),
     path('balance/', get_user_balance, name='get_user_balance'),
     path('update-profile/', update_user_profile, name='update_user_profile'),
     path('signal/strength/', get_signal_strength, name='get_signal_strength'),
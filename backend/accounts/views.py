@@ -1,67 +1,82 @@
-from rest_framework.decorators import api_view, permission_classes
+import logging
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
 from .models import User, SignalPlan,  SignalPurchaseHistory
 from transactions.models import Transaction
-from django.core.mail import send_mail
+from transactions import wallets
 from django.conf import settings
 from rest_framework.permissions import IsAuthenticated
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.template.loader import render_to_string
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.utils import timezone
 from django.utils.html import strip_tags
+from django.core.paginator import Paginator
+from django.db.models import Case, F, Q, Value, When
+from django.urls import reverse
+from urllib.parse import urlencode
+from backend.routers import use_replica
+from api.search import search_available, search_filter, searchable
+from api.authentication import invalidate_user_snapshots
+from api.revocation import RefreshToken, revoke_token, revoke_user_tokens
+from api.mail import send_mail_async
+from api.throttling import AuthRateThrottle, MoneyRateThrottle
+from api.idempotency import idempotent
 
+logger = logging.getLogger(__name__)
 
 
+
+# Fields returned with a successful login
+LOGIN_USER_FIELDS = (
+    'id', 'username', 'email', 'full_name', 'balance', 'wallet_network', 'wallet_address',
+    'phone_number', 'referral_code', 'address', 'occupation', 'annual_income', 'is_staff', 'date_joined',
+)
+
 @api_view(['POST'])
+@throttle_classes([AuthRateThrottle])
 def register_user(request):
     data = request.data
-    if User.objects.filter(email=data['email']).exists():
+    # Let the unique email/username constraints reject duplicates instead of
+    # checking first, which costs a query and races with concurrent signups
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username=data['email'],
+                full_name=data['full_name'],
+                email=data['email'],
+                transaction_pin=data.get('transaction_pin', ''),
+                password=data['password'],
+            )
+    except IntegrityError:
         return Response({'error': 'Email already in use'}, status=status.HTTP_400_BAD_REQUEST)
-    user = User.objects.create_user(
-        username=data['email'],
-        full_name=data['full_name'],
-        email=data['email'],
-        transaction_pin=data.get('transaction_pin', ''),
-        password=data['password'],
-    )
-    send_mail(
+    send_mail_async(
         'Welcome to CoinEase',
-        f'Welcome {data["full_name"]} to CoinEase.\n\nYour account has been created successfully.\n\nYour username is {data["email"]} and your password is {data["password"]}. Your Transaction Pin is {data.get("transaction_pin", "")}.\n\nPlease login to your account to continue.',
+        f'Welcome {data["full_name"]} to CoinEase.\n\nYour account has been created successfully.\n\nYour username is {data["email"]}.\n\nPlease login to your account to continue.',
         settings.EMAIL_HOST_USER,
-        [data['email']],
-        fail_silently=False
+        [user.email],
+        kind='welcome',
     )
     return Response({'message': 'User registered successfully'}, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
+@throttle_classes([AuthRateThrottle])
 def login_user(request):
     data = request.data
-    user = User.objects.filter(email=data['email']).first()
+    user = User.objects.only('password', *LOGIN_USER_FIELDS).filter(email=data['email']).first()
+    # check_password also rehashes the password if PASSWORD_HASH_ITERATIONS changed
     if user and user.check_password(data['password']):
         refresh = RefreshToken.for_user(user)
         
-        # Add comprehensive user data to the response
-        user_data = {
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'full_name': user.full_name,
+        user_data = {name: getattr(user, name) for name in LOGIN_USER_FIELDS}
+        user_data.update({
             'balance': str(user.balance),
-            'wallet_network': user.wallet_network,  # Include the wallet network
-            'wallet_address': user.wallet_address,
-            'phone_number': user.phone_number if hasattr(user, 'phone_number') else None,
-            'referral_code': user.referral_code,
-            'address': user.address if hasattr(user, 'address') else None,
-            'occupation': user.occupation if hasattr(user, 'occupation') else None,
-            'annual_income': str(user.annual_income) if hasattr(user, 'annual_income') else None,
-            'is_staff': user.is_staff,
+            'annual_income': str(user.annual_income),
             'date_joined': user.date_joined.isoformat() if user.date_joined else None,
-        }
+        })
         
         return Response({
             'refresh': str(refresh),
@@ -72,11 +87,20 @@ def login_user(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@use_replica
 def get_user_balance(request):
     user = request.user
+    # Priced with the cached exchange rates, so this is one indexed query
+    valuation = wallets.valuation(user.id)
     return Response({
         'balance': str(user.balance),
-        'user_id': user.id
+        'user_id': user.id,
+        'wallets': [
+            {key: None if value is None else str(value) for key, value in wallet.items()}
+            for wallet in valuation['wallets']
+        ],
+        'valuation_currency': valuation['currency'],
+        'total_value': str(valuation['total']),
     })
 
 @api_view(['PUT'])
@@ -92,9 +116,9 @@ def update_user_profile(request):
     ]
     
     # Update fields if provided in the request
-    for field in allowed_fields:
-        if field in data:
-            setattr(user, field, data[field])
+    updated_fields = [field for field in allowed_fields if field in data]
+    for field in updated_fields:
+        setattr(user, field, data[field])
     
     # Handle transaction PIN separately with additional validation
     if 'transaction_pin' in data:
@@ -102,6 +126,7 @@ def update_user_profile(request):
         pin = data['transaction_pin']
         if pin and len(pin) == 4:
             user.transaction_pin = pin
+            updated_fields.append('transaction_pin')
         else:
             return Response(
                 {'error': 'Transaction PIN must be 4 digits'},
@@ -111,9 +136,19 @@ def update_user_profile(request):
     # Handle password change if provided
     if 'password' in data and data['password']:
         user.set_password(data['password'])
+        updated_fields.append('password')
     
-    # Save user changes
-    user.save()
+    # Save only what changed; request.user may be a cached snapshot whose
+    # balance must not be written back
+    user.save(update_fields=updated_fields)
+    
+    # A new password revokes every token issued so far, including the one
+    # used for this request, so hand back a fresh pair
+    tokens = {}
+    if 'password' in updated_fields:
+        revoke_user_tokens(user.pk, 'password_change')
+        refresh = RefreshToken.for_user(user)
+        tokens = {'refresh': str(refresh), 'access': str(refresh.access_token)}
     
     # Prepare response data
     user_data = {
@@ -132,9 +167,17 @@ def update_user_profile(request):
     
     return Response({
         'message': 'Profile updated successfully',
-        'user': user_data
+        'user': user_data,
+        **tokens
     }, status=status.HTTP_200_OK)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout_user(request):
+    """Revoke the access token used for this request"""
+    revoke_token(request.auth)
+    return Response({'message': 'Logged out successfully'}, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_signal_strength(request):
@@ -147,7 +190,7 @@ def get_signal_strength(request):
     # If expired, reset to level 1
     if is_expired and user.signal_strength > 1:
         user.signal_strength = 1
-        user.save()
+        user.save(update_fields=['signal_strength', 'signal_last_updated'])
     
     # Create response with signal information
     response = {
@@ -162,6 +205,7 @@ def get_signal_strength(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@use_replica
 def get_signal_plans(request):
     """Get all available signal plans for purchase"""
     plans = SignalPlan.objects.filter(is_active=True)
@@ -182,6 +226,8 @@ def get_signal_plans(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([MoneyRateThrottle])
+@idempotent
 def purchase_signal_plan(request):
     """Purchase a signal plan to increase signal strength"""
     user = request.user
@@ -202,18 +248,28 @@ def purchase_signal_plan(request):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Check if user has sufficient balance
-    if user.balance < plan.price:
-        return Response(
-            {'error': 'Insufficient balance for this signal plan'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
     # Calculate expiration date
     expiration_date = timezone.now() + timezone.timedelta(days=plan.duration_days)
     
     # Process purchase within a transaction
     with transaction.atomic():
+        # request.user may come from the auth cache, so check the balance
+        # on the locked row
+        user = User.objects.select_for_update().get(pk=user.pk)
+        if user.balance < plan.price:
+            return Response(
+                {'error': 'Insufficient balance for this signal plan'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Paid from one wallet, in that wallet's currency: the one asked for
+        # or else the first that covers the price
+        cost = wallets.pay_from(user.pk, plan.price, data.get('currency'))
+        if cost is None:
+            return Response(
+                {'error': 'No wallet has enough balance for this signal plan'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         # Deduct from user balance
         user.balance -= plan.price
         
@@ -227,8 +283,8 @@ def purchase_signal_plan(request):
             user=user,
             type='signal_purchase',
             status='successful',
-            amount=plan.price,
-            currency='USD',  # Assuming USD as default, modify as needed
+            amount=cost.amount,
+            currency=cost.currency,
             description=f"Purchase of {plan.name} signal plan for {plan.duration_days} days"
         )
         
@@ -251,17 +307,13 @@ def purchase_signal_plan(request):
         })
         plain_message = strip_tags(html_message)
         
-        send_mail(
-            subject,
-            plain_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            html_message=html_message,
-            fail_silently=False,
+        send_mail_async(
+            subject, plain_message, settings.DEFAULT_FROM_EMAIL, [user.email],
+            kind='signal_upgrade', html_message=html_message,
         )
-    except Exception as e:
+    except Exception:
         # Log the error but don't fail the operation
-        print(f"Failed to send signal upgrade email: {str(e)}")
+        logger.exception("Failed to queue signal upgrade email")
     
     # Return updated signal information
     return Response({
@@ -273,17 +325,110 @@ def purchase_signal_plan(request):
         'transaction_id': tx.id
     })
 
+SIGNAL_USERS_PER_PAGE = 50
+
+def _filter_signal_users(params, now):
+    """Apply the signal management filters from a GET or POST dict"""
+    users = User.objects.all()
+    filters = {}
+    
+    strength = params.get('strength')
+    if strength in ('1', '2', '3', '4'):
+        users = users.filter(signal_strength=int(strength))
+        filters['strength'] = strength
+    
+    plan_status = params.get('status')
+    if plan_status == 'expired':
+        users = users.filter(Q(signal_expires_at__isnull=True) | Q(signal_expires_at__lt=now))
+        filters['status'] = plan_status
+    elif plan_status == 'active':
+        users = users.filter(signal_expires_at__gte=now)
+        filters['status'] = plan_status
+    
+    expiring_hours = params.get('expiring_hours')
+    if expiring_hours and expiring_hours.isdigit():
+        users = users.filter(
+            signal_expires_at__gt=now,
+            signal_expires_at__lte=now + timezone.timedelta(hours=int(expiring_hours))
+        )
+        filters['expiring_hours'] = expiring_hours
+    
+    search_term = params.get('q', '').strip()
+    if search_term and searchable(search_term) and search_available():
+        users = users.filter(search_filter(search_term, {'user': 'pk'}))
+        filters['q'] = search_term
+    elif search_term:
+        users = users.filter(
+            Q(email__icontains=search_term) | Q(full_name__icontains=search_term) | Q(username__icontains=search_term)
+        )
+        filters['q'] = search_term
+    
+    return users, filters
+
+def _bulk_update_signal(users, data, now):
+    """Set or extend the signal plan of every user in the queryset with a single UPDATE"""
+    try:
+        days = int(data.get('bulk_days', 0))
+        strength = int(data['bulk_strength']) if data.get('bulk_strength') else None
+    except ValueError:
+        return None
+    if strength is not None and strength not in (1, 2, 3, 4):
+        return None
+    
+    changes = {'signal_last_updated': now}
+    if strength is not None:
+        changes['signal_strength'] = strength
+    
+    duration = timezone.timedelta(days=days)
+    if data.get('bulk_action') == 'set':
+        changes['signal_expires_at'] = now + duration
+    elif data.get('bulk_action') == 'extend' and days > 0:
+        # Same rule as admin_update_user_signal: extend active plans, restart expired ones
+        changes['signal_expires_at'] = Case(
+            When(signal_expires_at__gt=now, then=F('signal_expires_at') + duration),
+            default=Value(now + duration),
+        )
+    elif strength is None:
+        return None
+    
+    # update() skips post_save, so drop the cached auth snapshots here
+    user_ids = list(users.values_list('pk', flat=True))
+    updated = users.update(**changes)
+    invalidate_user_snapshots(user_ids)
+    return updated
+
 @staff_member_required
 def admin_manage_signal_strength(request):
     """Admin view to manage user signal strength"""
-    # Get all users, ordered by expiration date and signal strength
-    users = User.objects.all().order_by('signal_strength')
-    
-    # Include current time for template comparisons
+    # Include current time for filters and template comparisons
     now = timezone.now()
+    params = request.POST if request.method == 'POST' else request.GET
+    users, filters = _filter_signal_users(params, now)
+    filter_query = urlencode(filters)
+    
+    if request.method == 'POST':
+        # An unfiltered form covers every user, so that has to be asked for
+        if not filters and request.POST.get('all_users') != '1':
+            messages.error(request, "Filter the users to update, or confirm the update is for every user")
+            return redirect('admin_manage_signal_strength')
+        updated = _bulk_update_signal(users, request.POST, now)
+        if updated is None:
+            messages.error(request, "Choose a valid signal strength, action and number of days")
+        else:
+            messages.success(request, f"Signal plan updated for {updated} users")
+        return redirect(f"{reverse('admin_manage_signal_strength')}?{filter_query}")
+    
+    # Ordering follows the (signal_strength, signal_expires_at) index
+    users = users.only(
+        'id', 'email', 'full_name', 'signal_strength', 'signal_expires_at'
+    ).order_by('signal_strength', 'signal_expires_at', 'id')
+    page = Paginator(users, SIGNAL_USERS_PER_PAGE).get_page(request.GET.get('page'))
     
     context = {
-        'users': users,
+        'users': page.object_list,
+        'page': page,
+        'filters': filters,
+        'filter_query': filter_query,
         'now': now,
         'title': 'Manage Signal Strength'
     }
@@ -1,3 +1,19 @@
 from django.contrib import admin
+from .models import IdempotencyKey, RevokedToken
 
-# Register your models here.
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'reason', 'revoked_at', 'expires_at')
+    list_filter = ('reason',)
+    search_fields = ('key',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'status_code', 'created_at')
+    list_filter = ('status_code',)
+    search_fields = ('key',)
+    raw_id_fields = ('user',)
+    readonly_fields = ('user', 'key', 'fingerprint', 'status_code', 'response_body', 'created_at')
@@ -0,0 +1,93 @@
+"""
+JWT authentication that resolves `request.user` from a cached snapshot.
+
+simplejwt's `JWTAuthentication` loads the whole user row on every request.
+`CachedJWTAuthentication` keeps the fields API views actually read in the
+shared cache for `JWT_USER_CACHE_SECONDS` and rebuilds the user from them, so
+polling endpoints skip the lookup. The snapshot is dropped whenever the user
+row changes (see api/signals.py and the bulk update paths).
+
+Tokens are checked against the revocation filter (api.revocation) before the
+user is resolved.
+
+The rebuilt user has every other field deferred, and saving it only writes the
+snapshot fields. Views that move money must re-read the user with
+`select_for_update()` instead of trusting the snapshot balance. The
+transaction PIN is never cached; it is checked on that locked row too.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .revocation import is_revoked
+
+SNAPSHOT_FIELDS = {
+    'id', 'email', 'username', 'full_name', 'is_active', 'is_staff', 'is_superuser',
+    'balance', 'signal_strength', 'signal_expires_at', 'wallet_network', 'wallet_address',
+    'phone_number', 'address', 'occupation', 'annual_income', 'referral_code',
+}
+
+
+def _snapshot_attnames():
+    # Model.from_db expects values in concrete field order
+    return [
+        field.attname for field in get_user_model()._meta.concrete_fields
+        if field.attname in SNAPSHOT_FIELDS
+    ]
+
+
+def _snapshot_key(user_id):
+    return f'jwt_user_{user_id}'
+
+
+def _cache():
+    return caches['shared']
+
+
+def invalidate_user_snapshot(user_id):
+    _cache().delete(_snapshot_key(user_id))
+
+
+def invalidate_user_snapshots(user_ids):
+    _cache().delete_many([_snapshot_key(user_id) for user_id in user_ids])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication backed by a short-lived per-user snapshot"""
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token):
+            raise InvalidToken(_("Token has been revoked"), code="token_revoked")
+        return validated_token
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which is never cached
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        key = _snapshot_key(user_id)
+        attnames = _snapshot_attnames()
+        values = _cache().get(key)
+        if values is None:
+            user = super().get_user(validated_token)
+            _cache().set(
+                key,
+                [getattr(user, name) for name in attnames],
+                settings.JWT_USER_CACHE_SECONDS,
+            )
+            return user
+
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, attnames, values)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -0,0 +1,250 @@
+"""
+Streaming backups of the platform tables.
+
+A backup is a directory holding one `<app_label>.<model>.ndjson.gz` file per
+table in BACKUP_MODELS and a `manifest.json`, written last, with the row
+count of each. Each data file starts with a line naming the table and its
+columns, followed by one JSON array of column values per row, so neither
+side ever holds more than a chunk of a table in memory.
+
+Backups read from a snapshot: on SQLite a copy taken with the online backup
+API, which does not block writers the way one long read transaction would,
+elsewhere a repeatable-read transaction. Restores bulk insert in batches,
+a dependency level at a time so every foreign key points at rows that have
+already been committed; the tables of one level can load in parallel.
+
+Groups and the group and permission memberships of users are backed up;
+permissions themselves are not. migrate recreates them, with the same ids
+for the same code, before a restore.
+"""
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+
+FORMAT_VERSION = 1
+
+# Restore order: each level only references tables in earlier levels
+BACKUP_LEVELS = [
+    ['accounts.User', 'accounts.SignalPlan', 'transactions.InvestmentPlan', 'auth.Group'],
+    [
+        'transactions.Transaction', 'transactions.ArchivedTransaction',
+        'accounts.User_groups', 'accounts.User_user_permissions', 'auth.Group_permissions',
+    ],
+    ['transactions.Deposit', 'transactions.Withdrawal', 'transactions.Investment', 'accounts.SignalPurchaseHistory'],
+]
+BACKUP_MODELS = [label for level in BACKUP_LEVELS for label in level]
+
+MANIFEST = 'manifest.json'
+SNAPSHOT_ALIAS = 'backup_snapshot'
+
+
+
+class BackupEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds times to milliseconds
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+_encoder = BackupEncoder(separators=(',', ':'))
+
+
+class Progress:
+    """Thread-safe progress lines of the form `table: rows/total (pct), rows/s` every `every` rows"""
+
+    def __init__(self, write, every=100_000):
+        self.write = write
+        self.every = every
+        self.lock = threading.Lock()
+        self.reported = {}
+
+    def report(self, label, done, total, started, final=False):
+        last = self.reported.get(label)
+        if done == last or (not final and done - (last or 0) < self.every):
+            return
+        self.reported[label] = done
+        rate = done / max(time.monotonic() - started, 1e-6)
+        share = f'/{total} ({done / total:.0%})' if total else ''
+        with self.lock:
+            self.write(f'{label}: {done}{share} rows, {rate:,.0f} rows/s')
+
+
+def data_file(directory, label):
+    return os.path.join(directory, f'{label.lower()}.ndjson.gz')
+
+
+def columns(model):
+    # Generated columns are recomputed by the database on restore
+    return [field.attname for field in model._meta.concrete_fields if not field.generated]
+
+
+@contextmanager
+def snapshot(using='default'):
+    """Yield a database alias whose contents stay fixed while a backup reads them"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        with transaction.atomic(using=using):
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+            yield using
+        return
+
+    fd, path = tempfile.mkstemp(suffix='.sqlite3', dir=os.path.dirname(str(connection.settings_dict['NAME'])))
+    os.close(fd)
+    source = sqlite3.connect(connection.settings_dict['NAME'])
+    dest = sqlite3.connect(path)
+    try:
+        # Copied in steps so writers can interleave with a long copy
+        source.backup(dest, pages=1024)
+    finally:
+        dest.close()
+        source.close()
+    connections.settings[SNAPSHOT_ALIAS] = {**connection.settings_dict, 'NAME': path}
+    try:
+        yield SNAPSHOT_ALIAS
+    finally:
+        connections.close_all()
+        del connections.settings[SNAPSHOT_ALIAS]
+        os.remove(path)
+
+
+def dump_model(label, directory, using, chunk_size, progress):
+    """Stream every row of the model to its data file and return the row count"""
+    model = apps.get_model(label)
+    names = columns(model)
+    path = data_file(directory, label)
+    started = time.monotonic()
+    count = 0
+    try:
+        rows = model._base_manager.using(using).order_by('pk').values_list(*names).iterator(chunk_size=chunk_size)
+        with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(_encoder.encode({'table': label, 'columns': names}) + '\n')
+            for row in rows:
+                f.write(_encoder.encode(row) + '\n')
+                count += 1
+                progress.report(label, count, None, started)
+        os.replace(f'{path}.tmp', path)
+    finally:
+        connections.close_all()
+    progress.report(label, count, None, started, final=True)
+    return count
+
+
+def write_manifest(directory, counts):
+    manifest = {
+        'format': FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'tables': {label: counts[label] for label in BACKUP_MODELS},
+    }
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported backup format {manifest.get('format')!r}")
+    return manifest
+
+
+def read_rows(path):
+    """(columns, iterator of rows) of a data file"""
+    f = gzip.open(path, 'rt', encoding='utf-8')
+    header = json.loads(f.readline())
+
+    def rows():
+        with f:
+            for line in f:
+                yield json.loads(line)
+    return header['columns'], rows()
+
+
+def _converters(model, names):
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    converters = []
+    for name in names:
+        field = fields[name]
+        # Foreign keys hold the value of the field they point at
+        converters.append((field.target_field if field.is_relation else field).to_python)
+    return converters
+
+
+@contextmanager
+def keep_timestamps(model):
+    """Stop bulk_create from stamping auto_now(_add) fields over the backed-up values"""
+    fields = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def load_model(label, directory, using, batch_size, total, progress):
+    """Bulk insert a data file in batches and return the row count"""
+    model = apps.get_model(label)
+    names, rows = read_rows(data_file(directory, label))
+    converters = list(zip(names, _converters(model, names)))
+    # A user may be referred by one restored after them, so references to
+    # the same table are set once every row is in
+    self_links = [field.attname for field in model._meta.concrete_fields if field.is_relation and field.related_model is model]
+    links = []
+    started = time.monotonic()
+    count = 0
+
+    def flush(batch):
+        with transaction.atomic(using=using):
+            model._base_manager.using(using).bulk_create(batch)
+
+    try:
+        with keep_timestamps(model):
+            batch = []
+            for row in rows:
+                values = {name: None if value is None else convert(value) for (name, convert), value in zip(converters, row)}
+                for name in self_links:
+                    if values[name] is not None:
+                        links.append((values[model._meta.pk.attname], name, values[name]))
+                        values[name] = None
+                batch.append(model(**values))
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    count += len(batch)
+                    batch = []
+                    progress.report(label, count, total, started)
+            if batch:
+                flush(batch)
+                count += len(batch)
+
+        for name in self_links:
+            linked = [model(pk=pk, **{name: target}) for pk, link, target in links if link == name]
+            model._base_manager.using(using).bulk_update(linked, [name], batch_size=batch_size)
+    finally:
+        connections.close_all()
+    progress.report(label, count, total, started, final=True)
+    return count
+
+
+def reset_sequences(using):
+    """Move auto-increment sequences past the restored ids (a no-op on SQLite)"""
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), [apps.get_model(label) for label in BACKUP_MODELS])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,71 @@
+"""
+OpenAPI schema and documentation pages.
+
+API_DOCS_MODE picks how /api/schema/ is served:
+
+- `live`: drf-spectacular builds the schema from the views on every request
+  (development).
+- `prebuilt`: the JSON written at build or deploy time by `python manage.py
+  build_api_schema` is served with an ETag, so workers never load the schema
+  generator and views keep DRF's light default schema class. drf_spectacular
+  stays installed for the Swagger and Redoc templates, so its package, app
+  config and system checks are still imported at startup.
+- `off`: no schema or documentation routes at all.
+
+The Swagger and Redoc pages are imported on their first request in either of
+the first two modes.
+"""
+import hashlib
+import os
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+
+MODES = ('live', 'prebuilt', 'off')
+
+_lock = threading.Lock()
+_cached = None
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """A view that imports and builds the class-based view on its first request"""
+    view = None
+
+    @csrf_exempt
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def load_schema():
+    """
+    (content, etag) of the prebuilt schema file, or None if it has not been
+    built. Re-read only when the file changes.
+    """
+    global _cached
+    path = settings.API_SCHEMA_FILE
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    cached = _cached
+    if cached is None or cached[0] != key:
+        with _lock:
+            with open(path, 'rb') as f:
+                content = f.read()
+            cached = _cached = (key, content, f'"{hashlib.sha256(content).hexdigest()}"')
+    return cached[1], cached[2]
+
+
+def generate_schema():
+    """Generate the OpenAPI schema as JSON bytes; needs the live mode's schema class"""
+    from drf_spectacular.renderers import OpenApiJsonRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    schema = spectacular_settings.DEFAULT_GENERATOR_CLASS().get_schema(request=None, public=True)
+    return OpenApiJsonRenderer().render(schema, renderer_context={})
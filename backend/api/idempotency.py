@@ -0,0 +1,96 @@
+"""
+Idempotency-Key support for the endpoints that move money.
+
+Clients retry requests that timed out. When a request carries an
+`Idempotency-Key` header, the view runs in one database transaction that also
+inserts an IdempotencyKey row holding its response. The operation and its
+stored response therefore commit together or not at all. A retry with the
+same key finds that row with one lookup on the (user, key) index and gets the
+stored response back without the view running again, so nothing is debited
+or emailed twice.
+
+Reusing a key for a different request is rejected. 5xx responses are not
+stored, so those requests can be retried. If two requests with the same key
+race, the second one's insert violates the unique index and its whole
+transaction rolls back; it then answers with the first one's response. Keys
+are pruned after IDEMPOTENCY_KEY_TTL_HOURS.
+"""
+import hashlib
+import json
+from functools import wraps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def fingerprint(request):
+    """Hash of what the request asks for, to catch a key reused for something else"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _stored(user, key):
+    try:
+        return IdempotencyKey.objects.get(user=user, key=key)
+    except IdempotencyKey.DoesNotExist:
+        return None
+
+
+def _replay(record, request_fingerprint):
+    if record.fingerprint != request_fingerprint:
+        return Response(
+            {'error': f'This {HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(record.response_body, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+def idempotent(view_func):
+    """
+    Make a function-based API view replay its stored response for a repeated
+    Idempotency-Key. Goes below @api_view so request.user and request.data
+    are available.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_func(request, *args, **kwargs)
+        if not 0 < len(key) <= IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'error': f'{HEADER} must be 1 to 255 characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        request_fingerprint = fingerprint(request)
+        # A retry is answered from one lookup without opening a transaction
+        record = _stored(request.user, key)
+        if record is not None:
+            return _replay(record, request_fingerprint)
+        try:
+            with transaction.atomic():
+                # Looked up again now that this holds the write lock on
+                # SQLite, in case a concurrent request committed meanwhile
+                record = _stored(request.user, key)
+                if record is not None:
+                    return _replay(record, request_fingerprint)
+                response = view_func(request, *args, **kwargs)
+                if response.status_code < 500:
+                    IdempotencyKey.objects.create(
+                        user=request.user, key=key, fingerprint=request_fingerprint,
+                        status_code=response.status_code, response_body=getattr(response, 'data', None),
+                    )
+                return response
+        except IntegrityError:
+            # A concurrent request with the same key committed first
+            record = _stored(request.user, key)
+            if record is None:
+                raise
+            return _replay(record, request_fingerprint)
+    return wrapper
+
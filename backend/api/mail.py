@@ -0,0 +1,43 @@
+"""
+Email sending that stays off the request path.
+
+`send_mail_async` and `send_messages_async` enqueue a `deliver` job in the
+current database transaction, so a slow SMTP server never holds up a
+response, nothing is sent for work that rolled back and a failed send is
+retried by the jobs worker with backoff.
+"""
+from django.core.mail import EmailMultiAlternatives, get_connection
+from jobs.queue import enqueue
+from . import metrics
+
+
+def deliver(messages, kind='notification'):
+    """
+    Send messages ({'subject', 'body', 'from_email', 'to', 'html'}) over one
+    connection. Raising makes the job retry all of them.
+    """
+    emails = []
+    for message in messages:
+        email = EmailMultiAlternatives(message['subject'], message['body'], message['from_email'], message['to'])
+        if message.get('html'):
+            email.attach_alternative(message['html'], 'text/html')
+        emails.append(email)
+    try:
+        get_connection(fail_silently=False).send_messages(emails)
+    except Exception:
+        metrics.emails_failed.inc(len(emails), kind=kind)
+        raise
+    metrics.emails_sent.inc(len(emails), kind=kind)
+
+
+def send_messages_async(messages, kind='notification'):
+    """Send a batch of messages in one background job; see deliver() for their shape"""
+    return enqueue(deliver, messages=messages, kind=kind)
+
+
+def send_mail_async(subject, message, from_email, recipient_list, kind='notification', html_message=None):
+    """Queue the email for the jobs worker; it is only sent if the current transaction commits"""
+    return send_messages_async(
+        [{'subject': subject, 'body': message, 'from_email': from_email, 'to': list(recipient_list), 'html': html_message}],
+        kind=kind,
+    )
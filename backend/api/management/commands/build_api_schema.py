@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.docs import generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema into API_SCHEMA_FILE for COINEASE_API_DOCS=prebuilt'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None, help='Where to write the schema (default: API_SCHEMA_FILE)')
+
+    def handle(self, *args, **options):
+        path = options['file'] or str(settings.API_SCHEMA_FILE)
+
+        if settings.API_DOCS_MODE != 'live':
+            # Views pick their schema class when they are imported, so only
+            # a process started in live mode can introspect them
+            result = subprocess.run(
+                [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'build_api_schema', '--file', path],
+                env=dict(os.environ, COINEASE_API_DOCS='live'),
+            )
+            if result.returncode:
+                raise CommandError('Schema generation failed')
+            return
+
+        content = generate_schema()
+        # Write next to the target and swap it in, so a worker never serves half a file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self.stdout.write(self.style.SUCCESS(f'API schema written to {path} ({len(content)} bytes)'))
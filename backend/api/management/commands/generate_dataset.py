@@ -0,0 +1,249 @@
+import heapq
+import random
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import User, SignalPlan, SignalPurchaseHistory
+from api import search
+from api.backup import BACKUP_MODELS, keep_timestamps, reset_sequences
+from transactions.models import Transaction, Deposit, Withdrawal, Investment, InvestmentPlan
+from transactions.money import Money
+from transactions.rollups import rebuild_rollups
+from transactions.wallets import price_in, rebuild_wallet_balances
+
+PASSWORD = 'dataset-password'
+CENT = Decimal('0.01')
+
+FIRST_NAMES = ['Ada', 'Ben', 'Chidi', 'Dana', 'Emeka', 'Fatima', 'Grace', 'Hiro', 'Ines', 'Jamal', 'Kemi', 'Lena', 'Musa', 'Nora', 'Omar', 'Priya']
+LAST_NAMES = ['Adeyemi', 'Brown', 'Chen', 'Diaz', 'Eze', 'Fischer', 'Garcia', 'Haddad', 'Ibrahim', 'Johnson', 'Kim', 'Lopez', 'Mensah', 'Novak', 'Okafor', 'Patel']
+COUNTRIES = ['Nigeria', 'United States', 'United Kingdom', 'Ghana', 'India', 'Germany', 'Kenya', 'Canada']
+# (value, weight) pairs
+NETWORKS = [(('USDT', 'TRC20'), 50), (('USDT', 'ERC20'), 20), (('BTC', 'BTC'), 20), (('ETH', 'ETH'), 10)]
+WITHDRAWAL_METHODS = [('crypto', 80), ('bank', 15), ('paypal', 4), ('other', 1)]
+
+
+def weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def uuid7_at(when, rng):
+    """A version 7 UUID for the given time with seeded random bits, so generated ids are reproducible"""
+    ms = int(when.timestamp() * 1000)
+    value = (ms & ((1 << 48) - 1)) << 80 | 0x7 << 76 | rng.getrandbits(12) << 64 | 0b10 << 62 | rng.getrandbits(62)
+    return uuid.UUID(int=value)
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill empty tables with a seeded synthetic dataset shaped like production: power-law user activity, '
+        'investment payouts, pending deposits, withdrawals and signal purchases'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000, help='Users to create')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed gives the same dataset')
+        parser.add_argument('--days', type=int, default=365, help='Days of history')
+        parser.add_argument('--activity-alpha', type=float, default=1.3,
+                            help='Pareto shape of deposits per user; lower gives a heavier tail of very active users')
+        parser.add_argument('--max-deposits', type=int, default=1000, help='Cap on the deposits of one user')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Transactions per bulk insert and database transaction')
+
+    def handle(self, *args, **options):
+        not_empty = [label for label in BACKUP_MODELS if label not in ('accounts.SignalPlan', 'transactions.InvestmentPlan')
+                     and apps.get_model(label)._base_manager.exists()]
+        if not_empty:
+            raise CommandError(f"Generate into an empty database; these tables have rows: {', '.join(not_empty)}")
+
+        if not SignalPlan.objects.exists():
+            call_command('loaddata', 'signal_plans', verbosity=0)
+        if not InvestmentPlan.objects.exists():
+            call_command('loaddata', 'investment_plans', verbosity=0)
+        self.signal_plans = list(SignalPlan.objects.filter(is_active=True).order_by('pk'))
+        self.investment_plans = list(InvestmentPlan.objects.filter(is_active=True).order_by('min_deposit', 'pk'))
+        if not self.signal_plans or not self.investment_plans:
+            raise CommandError('Generating needs active signal and investment plans')
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.now = timezone.now()
+        # Hashing is deliberately slow, so every user shares one hash
+        self.password = make_password(PASSWORD)
+        self.referrals = []
+        self.rows = {model: [] for model in (User, Transaction, Deposit, Withdrawal, Investment, SignalPurchaseHistory)}
+        self.counts = dict.fromkeys(self.rows, 0)
+
+        started = time.monotonic()
+        for user_id in range(1, options['users'] + 1):
+            self.generate_user(user_id)
+            if len(self.rows[Transaction]) >= options['batch_size']:
+                self.flush()
+                self.stdout.write(f"{user_id}/{options['users']} users, {self.counts[Transaction]} transactions, "
+                                  f"{self.counts[Transaction] / (time.monotonic() - started):,.0f} transactions/s")
+        self.flush()
+
+        reset_sequences('default')
+        # bulk_create skips the signals that keep these up to date
+        rebuild_rollups()
+        rebuild_wallet_balances()
+        if search.search_available():
+            call_command('rebuild_search_index', stdout=self.stdout)
+
+        summary = ', '.join(f'{count} {model.__name__}' for model, count in self.counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary} in {time.monotonic() - started:.1f}s'))
+
+    def flush(self):
+        """Insert the buffered rows, parents first"""
+        with transaction.atomic():
+            for model, rows in self.rows.items():
+                with keep_timestamps(model):
+                    model.objects.bulk_create(rows, batch_size=self.options['batch_size'])
+                self.counts[model] += len(rows)
+                rows.clear()
+
+    def add_transaction(self, user, type, amount, when, status='successful', currency='USDT', description=None):
+        tx = Transaction(
+            id=uuid7_at(when, self.rng), user_id=user.id, type=type, status=status,
+            amount=amount, currency=currency, date=when, description=description,
+        )
+        self.rows[Transaction].append(tx)
+        return tx
+
+    def generate_user(self, user_id):
+        rng, now = self.rng, self.now
+        joined = now - timezone.timedelta(seconds=rng.uniform(0, self.options['days'] * 86400))
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        user = User(
+            id=user_id, username=f'user{user_id}@example.com', email=f'user{user_id}@example.com', full_name=name,
+            password=self.password, referral_code=f'GD{user_id:08d}', country=rng.choice(COUNTRIES),
+            date_joined=joined, signal_last_updated=joined,
+        )
+        # Preferential attachment: people who already referred others are the likeliest to refer again
+        if user_id > 1 and rng.random() < 0.3:
+            referrer = rng.choice(self.referrals) if self.referrals and rng.random() < 0.7 else rng.randint(1, user_id - 1)
+            user.referred_by_id = referrer
+            self.referrals.append(referrer)
+        self.rows[User].append(user)
+
+        deposits = min(int(rng.paretovariate(self.options['activity_alpha'])), self.options['max_deposits'])
+        span = (now - joined).total_seconds()
+        # User.balance, and what each currency's wallet holds; money is spent
+        # in the currency of the deposit that funds it, as the views require
+        balance = Decimal('0')
+        wallets = defaultdict(Decimal)
+        # (matures_at, currency, payout) of investments still running at the current event
+        maturing = []
+
+        for when in sorted(joined + timezone.timedelta(seconds=rng.uniform(0, span)) for _ in range(deposits)):
+            while maturing and maturing[0][0] <= when:
+                _, paid_in, payout = heapq.heappop(maturing)
+                balance += payout
+                wallets[paid_in] += payout
+
+            amount = Decimal(rng.lognormvariate(5, 1.1)).quantize(CENT) + 10
+            currency, network = weighted(rng, NETWORKS)
+            recent = (now - when).days < 3
+            if recent and rng.random() < 0.6:
+                status = 'pending'
+            else:
+                status = 'failed' if rng.random() < 0.08 else 'successful'
+            tx = self.add_transaction(user, 'deposit', amount, when, status, currency)
+            self.rows[Deposit].append(Deposit(
+                transaction_id=tx.id, wallet_address=f'{network.lower()}-{rng.getrandbits(64):016x}', wallet_network=network,
+                reviewed_at=None if status == 'pending' else when + timezone.timedelta(minutes=rng.randint(5, 2880)),
+            ))
+            if status != 'successful':
+                continue
+            balance += amount
+            wallets[currency] += amount
+
+            if rng.random() < 0.35:
+                plan, cost = self.pick_signal_plan(balance, wallets[currency], currency)
+                if plan:
+                    bought = when + timezone.timedelta(minutes=rng.randint(1, 120))
+                    tx = self.add_transaction(user, 'signal_purchase', cost, bought, currency=currency,
+                                              description=f'Purchase of {plan.name} signal plan for {plan.duration_days} days')
+                    self.rows[SignalPurchaseHistory].append(SignalPurchaseHistory(
+                        user_id=user.id, plan_id=plan.id, amount=plan.price, transaction_id=tx.id, date=bought,
+                    ))
+                    balance -= plan.price
+                    wallets[currency] -= cost
+                    user.signal_strength = plan.strength_level
+                    user.signal_expires_at = bought + timezone.timedelta(days=plan.duration_days)
+                    user.signal_last_updated = bought
+
+            if rng.random() < 0.6:
+                invested = self.invest(user, min(balance, wallets[currency]), currency,
+                                       when + timezone.timedelta(minutes=rng.randint(1, 240)), maturing)
+                balance -= invested
+                wallets[currency] -= invested
+
+            spendable = min(balance, wallets[currency])
+            if rng.random() < 0.25 and spendable > 10:
+                withdrawn = (spendable * Decimal(rng.uniform(0.2, 0.9))).quantize(CENT)
+                at = when + timezone.timedelta(hours=rng.uniform(1, 72))
+                if at > now or (now - at).days < 2 and rng.random() < 0.5:
+                    status, at = 'pending', min(at, now)
+                else:
+                    status = 'failed' if rng.random() < 0.05 else 'successful'
+                tx = self.add_transaction(user, 'withdrawal', withdrawn, at, status, currency)
+                method = weighted(rng, WITHDRAWAL_METHODS)
+                self.rows[Withdrawal].append(Withdrawal(
+                    transaction_id=tx.id, withdrawal_address=f'{method}-{rng.getrandbits(64):016x}', withdrawal_method=method,
+                    withdrawal_network='TRC20' if method == 'crypto' else None,
+                ))
+                if status != 'failed':
+                    balance -= withdrawn
+                    wallets[currency] -= withdrawn
+
+        while maturing and maturing[0][0] <= now:
+            balance += heapq.heappop(maturing)[2]
+        user.balance = balance
+
+    def pick_signal_plan(self, balance, wallet, currency):
+        """A plan affordable from both User.balance and the wallet, and its price in the wallet's currency"""
+        costs = {plan: price_in(plan.price, currency) for plan in self.signal_plans}
+        affordable = [
+            plan for plan, cost in costs.items() if plan.price <= balance and cost is not None and cost.amount <= wallet
+        ]
+        if not affordable:
+            return None, None
+        # Short, cheap plans sell most
+        plan = self.rng.choices(affordable, [1 / float(plan.price) for plan in affordable])[0]
+        return plan, costs[plan].amount
+
+    def invest(self, user, balance, currency, when, maturing):
+        """Invest part of the balance in a plan the user can afford; returns the amount invested"""
+        rng, now = self.rng, self.now
+        plans = [plan for plan in self.investment_plans if plan.min_deposit <= balance]
+        if not plans:
+            return 0
+        plan = rng.choice(plans)
+        amount = Decimal(rng.uniform(float(plan.min_deposit), float(min(balance, plan.max_deposit)))).quantize(CENT)
+        tx = self.add_transaction(user, 'investment', amount, when, currency=currency)
+        # Plan durations are days in production
+        end = when + timezone.timedelta(days=plan.duration)
+        investment = Investment(
+            user_id=user.id, plan_id=plan.id, transaction_id=tx.id, amount=amount, currency=currency,
+            start_date=when, end_date=end,
+        )
+        if end <= now:
+            principal = Money.of(amount, currency)
+            payout = (principal + principal.percent(plan.daily_roi * plan.duration)).amount
+            investment.status = 'completed'
+            investment.total_returns = payout - amount
+            investment.last_payout_date = end
+            self.add_transaction(user, 'investment_completed', payout, end, currency=currency,
+                                 description=f'Investment completed: {plan.tier} {plan.level} Plan')
+            heapq.heappush(maturing, (end, currency, payout))
+        else:
+            investment.next_payout_date = now + timezone.timedelta(minutes=1)
+        self.rows[Investment].append(investment)
+        return amount
@@ -0,0 +1,436 @@
+import asyncio
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.utils import timezone
+from accounts.models import User, SignalPlan
+from transactions.models import Transaction, InvestmentPlan, uuid7
+from transactions import rollups
+from transactions.wallets import rebuild_wallet_balances
+
+BASELINE_PATH = os.path.join(settings.BASE_DIR, 'api', 'loadtest_baseline.json')
+PASSWORD = 'loadtest-password'
+
+# (name, weight) of each step a virtual user picks from
+WORKLOAD = [
+    ('balance', 30),
+    ('history', 15),
+    ('history_filtered', 10),
+    ('transaction_detail', 6),
+    ('investments', 8),
+    ('investment_plans', 5),
+    ('signal_plans', 4),
+    ('signal_strength', 4),
+    ('deposit', 8),
+    ('investment', 6),
+    ('withdrawal', 6),
+    ('login', 4),
+]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def error_ratio(row):
+    """Share of an endpoint's requests that failed, 429s aside"""
+    return row.get('errors', 0) / row['requests'] if row.get('requests') else 0.0
+
+
+class VirtualUser:
+    def __init__(self, number, email, plan_id, rng):
+        self.email = email
+        self.plan_id = plan_id
+        self.rng = rng
+        self.token = None
+        self.transaction_ids = []
+        # A client address of its own, so per-IP throttles see distinct clients
+        self.address = f'10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}'
+
+    def next_request(self):
+        step = self.rng.choices([name for name, _ in WORKLOAD], [weight for _, weight in WORKLOAD])[0]
+        if self.token is None:
+            step = 'login'
+        elif step == 'transaction_detail' and not self.transaction_ids:
+            step = 'history'
+        return (step,) + self.request_for(step)
+
+    def request_for(self, step):
+        if step == 'login':
+            return 'POST', '/api/accounts/login/', {'email': self.email, 'password': PASSWORD}
+        if step == 'balance':
+            return 'GET', '/api/accounts/balance/', None
+        if step == 'history':
+            return 'GET', '/api/transactions/transactions/', None
+        if step == 'history_filtered':
+            kind = self.rng.choice(['deposit', 'withdrawal', 'investment', 'investment_return'])
+            return 'GET', f'/api/transactions/transactions/?type={kind}', None
+        if step == 'transaction_detail':
+            return 'GET', f'/api/transactions/transactions/{self.rng.choice(self.transaction_ids)}/', None
+        if step == 'investments':
+            return 'GET', '/api/transactions/investments/', None
+        if step == 'investment_plans':
+            return 'GET', '/api/transactions/investment-plans/', None
+        if step == 'signal_plans':
+            return 'GET', '/api/accounts/signal/plans/', None
+        if step == 'signal_strength':
+            return 'GET', '/api/accounts/signal/strength/', None
+        if step == 'deposit':
+            return 'POST', '/api/transactions/deposits/create/', {
+                'amount': '25', 'currency': 'USDT', 'wallet_address': 'loadtest-wallet', 'wallet_network': 'TRC20',
+            }
+        if step == 'investment':
+            return 'POST', '/api/transactions/investments/create/', {
+                'plan_id': self.plan_id, 'amount': '20', 'currency': 'USDT',
+            }
+        if step == 'withdrawal':
+            return 'POST', '/api/transactions/withdrawals/create/', {
+                'amount': '5', 'currency': 'USDT', 'withdrawal_address': 'loadtest-address',
+                'withdrawal_network': 'TRC20', 'transaction_pin': '1234',
+            }
+        raise ValueError(step)
+
+    def headers(self):
+        headers = {'Content-Type': 'application/json', 'X-Forwarded-For': self.address}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        return headers
+
+
+class ASGIClient:
+    """Calls the project's ASGI application in-process"""
+
+    def __init__(self):
+        from backend.asgi import application
+        self.application = application
+
+    async def request(self, method, path, headers, body):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'content-length', str(len(body)).encode())] + [
+                (k.lower().encode(), v.encode()) for k, v in headers.items()
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        delivered = False
+        response = {'status': None, 'body': []}
+
+        async def receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # The client never disconnects; Django cancels this when it is done
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+
+        await self.application(scope, receive, send)
+        return response['status'], b''.join(response['body'])
+
+
+class HTTPClient:
+    """Calls a server over HTTP from worker threads"""
+
+    def __init__(self, port):
+        self.port = port
+
+    def _request(self, method, path, headers, body):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            connection.request(method, path, body=body or None, headers={'Host': 'localhost', **headers})
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    async def request(self, method, path, headers, body):
+        return await asyncio.to_thread(self._request, method, path, headers, body)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database, drive a mixed API workload against the ASGI app and report '
+        'latency percentiles and throughput per endpoint, compared with api/loadtest_baseline.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Seeded users')
+        parser.add_argument('--history', type=int, default=100, help='Seeded transactions per user')
+        parser.add_argument('--concurrency', type=int, default=20, help='Virtual users running at once')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run the workload')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the dataset and workload')
+        parser.add_argument(
+            '--server', action='store_true',
+            help='Launch daphne on the seeded database and load it over HTTP instead of calling the app in-process',
+        )
+        parser.add_argument('--port', type=int, default=8765, help='Port for --server')
+        parser.add_argument(
+            '--keep-throttles', action='store_true',
+            help='Keep the configured throttle rates in-process; by default they are lifted so the write '
+                 'paths are measured rather than their 429s (--server always runs with the configured rates)',
+        )
+        parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline file to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help='Allowed relative regression of p95 latency and throughput before failing',
+        )
+        parser.add_argument('--write-baseline', action='store_true', help='Store this run as the new baseline')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] > options['users']:
+            raise CommandError('--concurrency cannot exceed --users; each virtual user logs in as its own user')
+
+        with tempfile.TemporaryDirectory(prefix='coinease-loadtest-') as tmp_dir:
+            # Keep every side channel (auth snapshots, throttles, metrics,
+            # emails) away from the real ones
+            isolated = override_settings(
+                CACHES={
+                    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'loadtest'},
+                    'shared': {
+                        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                        'LOCATION': os.path.join(tmp_dir, 'cache'),
+                    },
+                },
+                METRICS_DIR=os.path.join(tmp_dir, 'metrics'),
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            )
+            throttles = override_settings(REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK,
+                'DEFAULT_THROTTLE_RATES': {scope: '1000000/s' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+            })
+            db_path = os.path.join(tmp_dir, 'loadtest.sqlite3')
+            connections['default'].settings_dict.setdefault('TEST', {})['NAME'] = db_path
+            with ExitStack() as stack:
+                stack.enter_context(isolated)
+                if not options['keep_throttles'] and not options['server']:
+                    stack.enter_context(throttles)
+                old_config = setup_databases(verbosity=0, interactive=False)
+                # Per-request log lines and 4xx warnings would swamp the report
+                logging.disable(logging.CRITICAL)
+                try:
+                    self.stdout.write(f"Seeding {options['users']} users with {options['history']} transactions each")
+                    emails, plan_id = self.seed(options['users'], options['history'], options['seed'])
+                    results, elapsed = self.run_load(emails, plan_id, db_path, tmp_dir, options)
+                finally:
+                    logging.disable(logging.NOTSET)
+                    teardown_databases(old_config, verbosity=0)
+
+        report = self.summarize(results, elapsed)
+        self.print_report(report)
+        config = {key: options[key] for key in ('users', 'history', 'concurrency', 'duration', 'server', 'keep_throttles')}
+        if options['write_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump({'config': config, 'endpoints': report}, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+        else:
+            self.compare(report, config, options['baseline'], options['threshold'])
+
+    def seed(self, user_count, history, seed):
+        rng = random.Random(seed)
+        password = make_password(PASSWORD)
+        now = timezone.now()
+
+        plan = InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('1.50'),
+            min_deposit=Decimal('10'), max_deposit=Decimal('100000'), duration=1440,
+        )
+        SignalPlan.objects.bulk_create([
+            SignalPlan(name=f'Level {level}', price=Decimal(level * 25), strength_level=level, duration_days=30)
+            for level in (2, 3, 4)
+        ])
+        User.objects.bulk_create([
+            User(
+                username=f'loadtest{i}@example.com', email=f'loadtest{i}@example.com', full_name=f'Load Test {i}',
+                password=password, balance=Decimal('1000000.00'), referral_code=f'LT{i:08d}', transaction_pin='1234',
+            )
+            for i in range(user_count)
+        ])
+        users = list(User.objects.order_by('id'))
+
+        kinds = ['deposit', 'withdrawal', 'investment', 'investment_return']
+        batch = []
+        for user in users:
+            # The opening deposit behind the seeded balance funds the USDT
+            # wallet that investments and withdrawals are checked against
+            batch.append(Transaction(
+                id=uuid7(), user=user, type='deposit', status='successful', amount=user.balance, currency='USDT',
+                date=now - timezone.timedelta(days=366),
+            ))
+            for _ in range(history):
+                batch.append(Transaction(
+                    id=uuid7(), user=user, type=rng.choice(kinds), status=rng.choice(['successful', 'successful', 'pending', 'failed']),
+                    amount=Decimal(rng.randint(10, 5000)), currency='USDT',
+                    date=now - timezone.timedelta(minutes=rng.randint(1, 60 * 24 * 365)),
+                ))
+            if len(batch) >= 5000:
+                Transaction.objects.bulk_create(batch)
+                batch = []
+        Transaction.objects.bulk_create(batch)
+        rollups.rebuild_rollups()
+        rebuild_wallet_balances()
+        return [user.email for user in users], plan.id
+
+    def run_load(self, emails, plan_id, db_path, tmp_dir, options):
+        server = None
+        if options['server']:
+            server = self.start_server(db_path, tmp_dir, options['port'])
+            client = HTTPClient(options['port'])
+        else:
+            client = ASGIClient()
+        try:
+            self.stdout.write(
+                f"Running {options['concurrency']} virtual users for {options['duration']:.0f}s "
+                f"({'daphne on port %d' % options['port'] if server else 'in-process ASGI'})"
+            )
+            return asyncio.run(self.drive(client, emails, plan_id, options))
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=10)
+
+    def start_server(self, db_path, tmp_dir, port):
+        env = dict(
+            os.environ,
+            COINEASE_DB=db_path,
+            COINEASE_REPLICA_DB=os.path.join(tmp_dir, 'no-replica.sqlite3'),
+            COINEASE_CACHE_DIR=os.path.join(tmp_dir, 'cache'),
+            COINEASE_METRICS_DIR=os.path.join(tmp_dir, 'metrics'),
+            COINEASE_LOG_FILE=os.path.join(tmp_dir, 'server.log'),
+            COINEASE_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        )
+        # The seeded data has to be on disk before another process reads it
+        connections.close_all()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'backend.asgi:application'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'daphne exited: {server.stderr.read().decode()[-2000:]}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'daphne did not start listening on port {port}')
+
+    async def drive(self, client, emails, plan_id, options):
+        rng = random.Random(options['seed'])
+        virtual_users = [
+            VirtualUser(i, email, plan_id, random.Random(rng.random()))
+            for i, email in enumerate(rng.sample(emails, options['concurrency']))
+        ]
+        results = {}
+        start = time.perf_counter()
+        deadline = start + options['duration']
+
+        async def run(user):
+            while time.perf_counter() < deadline:
+                step, method, path, data = user.next_request()
+                body = json.dumps(data).encode() if data is not None else b''
+                sent = time.perf_counter()
+                status, content = await client.request(method, path, user.headers(), body)
+                latency = time.perf_counter() - sent
+                results.setdefault(step, []).append((latency, status))
+                if step == 'login' and status == 200:
+                    user.token = json.loads(content)['access']
+                elif step == 'history' and status == 200:
+                    user.transaction_ids = [item['id'] for item in json.loads(content)[:50]]
+
+        await asyncio.gather(*(run(user) for user in virtual_users))
+        return results, time.perf_counter() - start
+
+    def summarize(self, results, elapsed):
+        report = {}
+        for step, samples in sorted(results.items()):
+            latencies = sorted(latency * 1000 for latency, _ in samples)
+            report[step] = {
+                'requests': len(samples),
+                'errors': sum(1 for _, status in samples if status >= 400 and status != 429),
+                'throttled': sum(1 for _, status in samples if status == 429),
+                'rps': round(len(samples) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'p99_ms': round(percentile(latencies, 0.99), 2),
+            }
+        return report
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"\n{'endpoint':<18}{'requests':>9}{'errors':>8}{'429s':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        )
+        for step, row in report.items():
+            self.stdout.write(
+                f"{step:<18}{row['requests']:>9}{row['errors']:>8}{row['throttled']:>7}{row['rps']:>9.1f}"
+                f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+            )
+
+    def compare(self, report, config, baseline_path, threshold):
+        if not os.path.exists(baseline_path):
+            self.stdout.write(self.style.WARNING(f'No baseline at {baseline_path}; run with --write-baseline to create one'))
+            return
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded with {baseline.get('config')}, this run used {config}"
+            ))
+
+        regressions = []
+        self.stdout.write(f"\nCompared with {baseline_path} (threshold {threshold:.0%})")
+        for step, row in report.items():
+            base = baseline['endpoints'].get(step)
+            if base is None:
+                continue
+            p95_change = row['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0
+            rps_change = row['rps'] / base['rps'] - 1 if base['rps'] else 0
+            # An endpoint that starts failing fast must not pass as faster
+            error_rate = error_ratio(row)
+            base_error_rate = error_ratio(base)
+            regressed = p95_change > threshold or rps_change < -threshold or error_rate > base_error_rate
+            if regressed:
+                regressions.append(step)
+            style = self.style.ERROR if regressed else self.style.SUCCESS
+            self.stdout.write(style(
+                f"{step:<18} p95 {p95_change:+7.1%}   req/s {rps_change:+7.1%}   "
+                f"errors {error_rate:.1%} (baseline {base_error_rate:.1%})"
+            ))
+        if regressions:
+            raise CommandError(f"Performance regressed for: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,102 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PHASES = ('settings', 'apps', 'urls', 'warm-up')
+
+# Boots Django one phase at a time in a fresh interpreter, marking on stderr
+# where each phase ends so the -X importtime lines can be attributed to it
+BOOT_SCRIPT = """
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+timings = {}
+def phase(name, start):
+    timings[name] = time.perf_counter() - start
+    sys.stderr.write(f'phase: {name}\\n')
+    sys.stderr.flush()
+start = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+phase('settings', start)
+start = time.perf_counter()
+django.setup(set_prefix=False)
+phase('apps', start)
+start = time.perf_counter()
+from api import warmup
+warmup.warm_urls()
+phase('urls', start)
+start = time.perf_counter()
+warmup.warm_up()
+phase('warm-up', start)
+print(json.dumps(timings))
+"""
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|(?P<indent> *)(?P<name>\S+)$')
+
+
+def parse_importtime(stderr):
+    """{phase: [(module, self_us, cumulative_us, depth)]} from -X importtime output with phase markers"""
+    imports = {name: [] for name in PHASES}
+    pending = []
+    for line in stderr.splitlines():
+        if line.startswith('phase: '):
+            imports[line[len('phase: '):]].extend(pending)
+            pending = []
+            continue
+        match = _IMPORT_LINE.match(line)
+        if match:
+            depth = (len(match.group('indent')) - 1) // 2
+            pending.append((match.group('name'), int(match.group('self')), int(match.group('cumulative')), depth))
+    return imports
+
+
+class Command(BaseCommand):
+    help = 'Report where worker start-up time goes: settings, app loading, URLconf and warm-up, with the slowest imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=15, help='Imports listed per phase')
+        parser.add_argument(
+            '--sort', choices=['cumulative', 'self', 'package'], default='cumulative',
+            help='Rank top-level imports by time including their own imports, each module by its own time, '
+                 'or each top-level package by the own time of all its modules',
+        )
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')),
+        )
+        if result.returncode:
+            raise CommandError(f'Start-up failed:\n{result.stderr[-2000:]}')
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        imports = parse_importtime(result.stderr)
+
+        total = sum(timings.values())
+        self.stdout.write(f'Start-up {total * 1000:.0f} ms')
+        for phase in PHASES:
+            entries = imports[phase]
+            import_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+            self.stdout.write(
+                f'\n{phase}: {timings[phase] * 1000:.0f} ms, '
+                f'{len(entries)} modules imported in {import_us / 1000:.0f} ms'
+            )
+            if options['sort'] == 'package':
+                packages = {}
+                for name, self_us, _, _ in entries:
+                    package = name.split('.')[0]
+                    packages[package] = packages.get(package, 0) + self_us
+                for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['limit']]:
+                    self.stdout.write(f'  {self_us / 1000:8.1f} ms  {name}')
+                continue
+            if options['sort'] == 'self':
+                ranked = sorted(entries, key=lambda entry: entry[1], reverse=True)
+            else:
+                ranked = sorted((entry for entry in entries if entry[3] == 0), key=lambda entry: entry[2], reverse=True)
+            for name, self_us, cumulative_us, _ in ranked[:options['limit']]:
+                self.stdout.write(f'  {cumulative_us / 1000:8.1f} ms  {self_us / 1000:7.1f} ms self  {name}')
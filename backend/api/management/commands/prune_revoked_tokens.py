@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.tasks import prune_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete revocation records whose tokens have all expired'
+
+    def handle(self, *args, **options):
+        deleted = prune_revoked_tokens()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired revocation records'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from api import search
+from transactions.models import Transaction, Deposit, Withdrawal
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the admin full-text search index from the user and transaction tables'
+
+    def handle(self, *args, **options):
+        search.create_search_table()
+        if not search.search_available():
+            raise CommandError('This database does not support the FTS5 search index')
+
+        sources = [
+            ('user', User.objects.only(*search.USER_FIELDS), search.user_content),
+            ('transaction', Transaction.objects.only('id', 'description'), search.transaction_content),
+            ('deposit', Deposit.objects.only('id', 'wallet_address', 'wallet_network'), search.deposit_content),
+            ('withdrawal', Withdrawal.objects.only('id', 'withdrawal_address', 'withdrawal_network'), search.withdrawal_content),
+        ]
+        for kind, queryset, content in sources:
+            count = search.bulk_index(kind, queryset.order_by().iterator(chunk_size=2000), content)
+            self.stdout.write(f'Indexed {count} {kind} documents')
+
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the search index'))
@@ -0,0 +1,32 @@
+import os
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Refresh the read replica from the primary database using the SQLite backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024, help='Pages copied per backup step')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('The replica refresh only supports a SQLite primary')
+
+        target = settings.REPLICA_DATABASE_PATH
+        tmp_path = f"{target}.tmp"
+
+        # Copy into a temporary file first so readers never see a partial copy.
+        # Copying in steps lets payout writers interleave with a long backup.
+        source = sqlite3.connect(primary['NAME'])
+        dest = sqlite3.connect(tmp_path)
+        try:
+            source.backup(dest, pages=options['pages'])
+        finally:
+            dest.close()
+            source.close()
+        os.replace(tmp_path, target)
+
+        self.stdout.write(self.style.SUCCESS(f'Replica refreshed at {target}'))
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from api import search
+from api.backup import BACKUP_LEVELS, Progress, load_model, read_manifest, reset_sequences
+from transactions.rollups import rebuild_rollups
+from transactions.wallets import rebuild_wallet_balances
+
+
+class Command(BaseCommand):
+    help = 'Restore a backup written by backup_db into empty tables with batched bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Backup directory written by backup_db')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk insert and transaction')
+        parser.add_argument('--jobs', type=int, default=1, help='Tables of the same dependency level loaded in parallel')
+        parser.add_argument('--progress-every', type=int, default=100_000, help='Rows between progress lines')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        try:
+            manifest = read_manifest(directory)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Not a usable backup: {e}')
+        totals = manifest['tables']
+
+        not_empty = [label for level in BACKUP_LEVELS for label in level if apps.get_model(label)._base_manager.exists()]
+        if not_empty:
+            raise CommandError(f"Restore into an empty database; these tables have rows: {', '.join(not_empty)}")
+
+        progress = Progress(self.stdout.write, options['progress_every'])
+
+        def load(label):
+            return load_model(label, directory, 'default', options['batch_size'], totals[label], progress)
+
+        counts = {}
+        with ThreadPoolExecutor(max_workers=options['jobs']) as executor:
+            for level in BACKUP_LEVELS:
+                counts.update(zip(level, executor.map(load, level)))
+
+        mismatched = [label for label, count in counts.items() if count != totals[label]]
+        if mismatched:
+            raise CommandError(f"Row counts differ from the manifest for: {', '.join(mismatched)}")
+
+        reset_sequences('default')
+        # bulk_create skips the signals that keep these up to date
+        rebuild_rollups()
+        rebuild_wallet_balances()
+        if search.search_available():
+            call_command('rebuild_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Restored {sum(counts.values())} rows from {manifest['created_at']} backup"))
@@ -0,0 +1,305 @@
+"""
+Process-local metrics with cross-process aggregation.
+
+Counters, gauges and fixed-bucket histograms are plain dict updates under a
+lock, cheap enough for request paths. A background thread writes this
+process's values to `<METRICS_DIR>/<pid>.json` every METRICS_FLUSH_SECONDS
+(and at exit, which covers management commands). The staff-only metrics
+endpoint merges every file and renders the Prometheus text format: counters
+and histograms are summed, files left by processes that have exited are
+folded into `aggregate.json`, and gauges are combined per gauge as the sum
+over live processes or the latest value of any process.
+
+All metrics are declared in this module so the process serving the
+endpoint knows the type of everything it reads. Folding files into the
+aggregate happens under an flock; without fcntl (Windows) only scrapes in the
+same process are serialized.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_lock = threading.Lock()
+_collect_lock = threading.Lock()
+_registry = {}
+_flusher = None
+
+
+def _label_key(labels):
+    return json.dumps(sorted(labels.items())) if labels else '[]'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        _registry[name] = self
+
+    def snapshot(self):
+        return dict(self.values)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _ensure_flusher()
+
+
+class Gauge(Metric):
+    """`merge` is 'livesum' (summed over running processes) or 'latest' (most recently set)"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, merge='livesum'):
+        super().__init__(name, help_text)
+        self.merge = merge
+
+    def set(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = [value, time.time()]
+        _ensure_flusher()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            value = self.values.get(key, [0, 0])[0]
+            self.values[key] = [value + amount, time.time()]
+        _ensure_flusher()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            # Per-bucket (not cumulative) counts, then the sum
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+        _ensure_flusher()
+
+    def snapshot(self):
+        return {key: list(counts) for key, counts in self.values.items()}
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+http_requests = Counter('coinease_http_requests_total', 'HTTP requests by view, method and status')
+http_request_duration = Histogram(
+    'coinease_http_request_duration_seconds', 'HTTP request latency by view', LATENCY_BUCKETS
+)
+emails_sent = Counter('coinease_emails_sent_total', 'Emails handed to the mail server, by kind')
+emails_failed = Counter('coinease_emails_failed_total', 'Emails that could not be sent, by kind')
+websocket_connections = Gauge('coinease_websocket_connections', 'Open balance WebSocket connections')
+investment_payouts = Counter('coinease_investment_payouts_total', 'Investments paid out by process_investments')
+investment_run_duration = Histogram(
+    'coinease_process_investments_duration_seconds', 'process_investments run time', (1, 5, 15, 30, 60, 120, 300)
+)
+investment_last_run = Gauge(
+    'coinease_process_investments_last_run_timestamp', 'When process_investments last finished', merge='latest'
+)
+signal_notifications = Counter(
+    'coinease_signal_notifications_total', 'check_signal_expirations notifications by kind and outcome'
+)
+signal_check_last_run = Gauge(
+    'coinease_check_signal_expirations_last_run_timestamp', 'When check_signal_expirations last finished', merge='latest'
+)
+job_runs = Counter('coinease_jobs_total', 'Job attempts by task and outcome (succeeded, retried or failed)')
+job_duration = Histogram(
+    'coinease_job_duration_seconds', 'Job run time by task', (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300)
+)
+job_queue_delay = Histogram(
+    'coinease_job_queue_delay_seconds', 'Time from a job being due to a worker starting it, by task',
+    (0.1, 0.5, 1, 5, 15, 60, 300, 900)
+)
+
+
+def _collect_payout_backlog():
+    # Imported here so this module can be loaded before the app registry
+    from transactions.models import Investment
+    backlog = Investment.objects.filter(status__in=['ongoing', 'halfway'], end_date__lt=timezone.now()).count()
+    return [('coinease_payout_backlog', 'gauge', 'Investments past their end date that are not paid out', {'[]': backlog})]
+
+
+# Computed from the database when scraped
+COLLECTORS = [_collect_payout_backlog]
+
+
+def _path(name):
+    return os.path.join(settings.METRICS_DIR, name)
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def flush():
+    """Write this process's values to its file"""
+    with _lock:
+        data = {name: metric.snapshot() for name, metric in _registry.items() if metric.values}
+    if not data:
+        return
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    _write_json(_path(f'{os.getpid()}.json'), data)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_forever, name='metrics-flush', daemon=True)
+                _flusher.start()
+                atexit.register(flush)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge_into(total, data, live):
+    for name, values in data.items():
+        metric = _registry.get(name)
+        if metric is None:
+            continue
+        merged = total.setdefault(name, {})
+        for key, value in values.items():
+            if metric.kind == 'counter':
+                merged[key] = merged.get(key, 0) + value
+            elif metric.kind == 'histogram':
+                if len(value) != len(metric.buckets) + 2:
+                    continue
+                current = merged.get(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(current, value)]
+            elif metric.merge == 'latest':
+                if key not in merged or value[1] > merged[key][1]:
+                    merged[key] = value
+            elif live:
+                merged[key] = [merged.get(key, [0, 0])[0] + value[0], max(merged.get(key, [0, 0])[1], value[1])]
+
+
+@contextmanager
+def _aggregate_lock():
+    with _collect_lock, open(_path('.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def collect():
+    """Merge the files of every process, folding exited processes into the aggregate"""
+    flush()
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    with _aggregate_lock():
+        aggregate = {}
+        if os.path.exists(_path('aggregate.json')):
+            with open(_path('aggregate.json')) as f:
+                aggregate = json.load(f)
+
+        total = {}
+        _merge_into(total, aggregate, live=False)
+        dead = []
+        for filename in os.listdir(settings.METRICS_DIR):
+            stem, ext = os.path.splitext(filename)
+            if ext != '.json' or not stem.isdigit():
+                continue
+            try:
+                with open(_path(filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            live = _pid_alive(int(stem))
+            _merge_into(total, data, live)
+            if not live:
+                _merge_into(aggregate, data, live=False)
+                dead.append(filename)
+
+        if dead:
+            _write_json(_path('aggregate.json'), aggregate)
+            for filename in dead:
+                os.remove(_path(filename))
+    return total
+
+
+def _format_labels(key, extra=()):
+    pairs = [tuple(pair) for pair in json.loads(key)] + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus():
+    """Everything in the Prometheus text exposition format"""
+    total = collect()
+    lines = []
+    for name, metric in _registry.items():
+        values = total.get(name, {})
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(values.items()):
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_format_labels(key)} {value}')
+            elif metric.kind == 'gauge':
+                lines.append(f'{name}{_format_labels(key)} {value[0]}')
+            else:
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(key)} {value[-1]}')
+                lines.append(f'{name}_count{_format_labels(key)} {cumulative}')
+    for collector in COLLECTORS:
+        for name, kind, help_text, values in collector():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, value in values.items():
+                lines.append(f'{name}{_format_labels(key)} {value}')
+    return '\n'.join(lines) + '\n'
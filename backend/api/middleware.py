@@ -0,0 +1,167 @@
+"""
+Request metrics and per-request profiling.
+
+`MetricsMiddleware` records the latency and outcome of every request in the
+metrics registry (api.metrics).
+
+`ProfilingMiddleware` counts and times every SQL query a request runs. A
+request is profiled in full when a staff user sends `X-Profile: 1` (or
+`X-Profile: cprofile` to also dump a cProfile file into PROFILING_CPROFILE_DIR)
+or when it is picked by PROFILING_SAMPLE_RATE. A full profile records the
+SQL time, time spent in serializers that use api.profiling's mixin, repeated
+statements (the usual N+1 signature) and the total time. The summary is
+logged as structured fields to the `coinease.profiling` logger and, for
+staff, sent back in a `Server-Timing` header.
+
+Views with an entry in QUERY_BUDGETS (keyed by URL name) log a warning
+whenever a request runs more queries than its budget, profiled or not.
+"""
+import cProfile
+import logging
+import os
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException
+from . import metrics
+from .authentication import CachedJWTAuthentication
+from .profiling import current_profile
+
+logger = logging.getLogger('coinease.profiling')
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+
+class RequestProfile:
+    def __init__(self, detailed):
+        self.detailed = detailed
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            if self.detailed:
+                self.statements[sql] += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        # Unmatched paths share one label so scanners cannot blow up the series
+        view = match.url_name or match.view_name if match else 'unmatched'
+        metrics.http_request_duration.observe(duration, view=view)
+        metrics.http_requests.inc(view=view, method=request.method, status=f'{response.status_code // 100}xx')
+        return response
+
+
+def _is_staff(request):
+    """
+    Whether the request comes from a staff user, by session or by access
+    token. Runs before the view, so a profile header from anyone else costs
+    nothing beyond this check.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        authenticated = CachedJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return bool(authenticated and authenticated[0].is_staff)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = request.META.get(PROFILE_HEADER, '')
+        # The header is only honoured for staff
+        is_staff = bool(requested) and _is_staff(request)
+        if not is_staff:
+            requested = ''
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        profile = RequestProfile(detailed=bool(requested) or sampled)
+        profiler = cProfile.Profile() if requested == 'cprofile' and settings.PROFILING_CPROFILE_DIR else None
+
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in settings.DATABASES:
+                    stack.enter_context(connections[alias].execute_wrapper(profile))
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+        finally:
+            current_profile.reset(token)
+        total_time = time.perf_counter() - start
+
+        match = request.resolver_match
+        view_name = match.url_name if match else None
+
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is not None and profile.queries > budget:
+            logger.warning('query budget exceeded', extra={
+                'view': view_name,
+                'path': request.path,
+                'queries': profile.queries,
+                'budget': budget,
+            })
+
+        if sampled or requested:
+            summary = self.summary(request, response, view_name, profile, total_time)
+            if profiler:
+                summary['cprofile'] = self.dump(profiler, view_name)
+            logger.info('request profile', extra=summary)
+            if requested:
+                response['Server-Timing'] = ', '.join([
+                    f'db;desc="{profile.queries} queries";dur={profile.sql_time * 1000:.1f}',
+                    f'serialize;dur={profile.serializer_time * 1000:.1f}',
+                    f'total;dur={total_time * 1000:.1f}',
+                ])
+        return response
+
+    def summary(self, request, response, view_name, profile, total_time):
+        repeated = [(sql, count) for sql, count in profile.statements.most_common(3) if count > 1]
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': profile.queries,
+            'sql_ms': round(profile.sql_time * 1000, 2),
+            'serializer_ms': round(profile.serializer_time * 1000, 2),
+            'total_ms': round(total_time * 1000, 2),
+            'repeated_queries': [{'sql': sql, 'count': count} for sql, count in repeated],
+        }
+
+    def dump(self, profiler, view_name):
+        os.makedirs(settings.PROFILING_CPROFILE_DIR, exist_ok=True)
+        path = os.path.join(
+            settings.PROFILING_CPROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{view_name or 'unknown'}.prof"
+        )
+        profiler.dump_stats(path)
+        return path
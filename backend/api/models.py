@@ -1,3 +1,51 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
 
-# Create your models here.
+class SearchDocument(models.Model):
+    """An object in the admin full-text search index; its id is the FTS rowid (see api.search)"""
+    kind = models.CharField(max_length=20)
+    ref = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('kind', 'ref')
+
+    def __str__(self):
+        return f"{self.kind} {self.ref}"
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked access token ('jti:<jti>') or every token a user was issued
+    before `revoked_at` ('user:<id>'). Checked through the in-process Bloom
+    filter in api.revocation.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    reason = models.CharField(max_length=20)
+    revoked_at = models.DateTimeField()
+    # Once every token it covers has expired the row can be pruned
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class IdempotencyKey(models.Model):
+    """
+    The response a money-moving request returned, stored under the client's
+    Idempotency-Key in the same transaction as its writes (see api.idempotency)
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    # Hash of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
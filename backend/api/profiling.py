@@ -0,0 +1,30 @@
+"""
+Serializer timing for profiled requests.
+
+`ProfilingMiddleware` puts the profile of the request it is handling in
+`current_profile`. Serializers that include `ProfiledSerializerMixin` add the
+time they spend in `to_representation` to that profile when it is a full
+profile, and do nothing extra otherwise, so unprofiled requests and anything
+outside a request (jobs, the shell) pay only a context variable read.
+"""
+import time
+from contextvars import ContextVar
+
+current_profile = ContextVar('request_profile', default=None)
+
+
+class ProfiledSerializerMixin:
+    def to_representation(self, instance):
+        profile = current_profile.get()
+        if profile is None or not profile.detailed or profile.serializer_depth:
+            return super().to_representation(instance)
+        # Only the outermost serializer is timed; SQL run by lazy relations
+        # inside it is counted both here and as SQL time. A list is timed
+        # item by item, so fetching its rows counts as SQL time only.
+        profile.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            profile.serializer_time += time.perf_counter() - start
+            profile.serializer_depth -= 1
@@ -0,0 +1,186 @@
+"""
+Access token revocation.
+
+Revocations (logout, password change, deactivation) are recorded as
+`RevokedToken` rows. Each process keeps a Bloom filter of the keys of every
+unexpired revocation, so checking a token that was not revoked, which is
+almost every request, is a few bit probes in memory. Only a filter hit goes to
+the database to confirm.
+
+The filter picks up new rows every `TOKEN_REVOCATION_REFRESH_SECONDS` and is
+rebuilt from scratch every `TOKEN_REVOCATION_REBUILD_SECONDS` to drop expired
+entries. A token revoked in another process may therefore keep working for up
+to one refresh interval. Expired rows are deleted by the `prune_revoked_tokens`
+job.
+
+A user-wide revocation covers the tokens issued before it. The views issue
+`RefreshToken`s from this module, whose `iat` keeps its fraction of a second
+(RFC 7519 NumericDates may have one), so a token from the same second as a
+password change is still told apart from the pair handed back after it.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_to_epoch
+from .models import RevokedToken
+
+
+class PreciseIssuedAtMixin:
+    def set_iat(self, claim='iat', at_time=None):
+        if at_time is None:
+            at_time = self.current_time
+        self.payload[claim] = datetime_to_epoch(at_time) + at_time.microsecond / 1_000_000
+
+
+class AccessToken(PreciseIssuedAtMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(PreciseIssuedAtMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def token_key(jti):
+    return f'jti:{jti}'
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+class RevocationFilter:
+    """Process-wide filter of revoked keys, refreshed lazily from the database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._refreshed = 0.0
+        self._rebuilt = 0.0
+
+    def _rebuild(self, now):
+        rows = list(
+            RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list('id', 'key')
+        )
+        capacity = max(settings.TOKEN_REVOCATION_BLOOM_CAPACITY, 2 * len(rows))
+        bloom = BloomFilter(capacity, settings.TOKEN_REVOCATION_BLOOM_ERROR_RATE)
+        for _, key in rows:
+            bloom.add(key)
+        self._filter = bloom
+        self._last_id = max((pk for pk, _ in rows), default=self._last_id)
+        self._rebuilt = self._refreshed = now
+
+    def _refresh(self, now):
+        # Only rows inserted since the last look; re-revoking a key inserts
+        # a new row (see _revoke), so it is picked up here too
+        rows = RevokedToken.objects.filter(pk__gt=self._last_id).values_list('id', 'key')
+        for pk, key in rows:
+            self._filter.add(key)
+            self._last_id = max(self._last_id, pk)
+        self._refreshed = now
+
+    def current(self):
+        now = time.monotonic()
+        if (
+            self._filter is None
+            or now - self._rebuilt >= settings.TOKEN_REVOCATION_REBUILD_SECONDS
+            or self._filter.count >= self._filter.capacity
+        ):
+            with self._lock:
+                self._rebuild(now)
+        elif now - self._refreshed >= settings.TOKEN_REVOCATION_REFRESH_SECONDS:
+            with self._lock:
+                self._refresh(now)
+        return self._filter
+
+    def add(self, key):
+        """Make a revocation made by this process visible to it immediately"""
+        if self._filter is not None:
+            with self._lock:
+                self._filter.add(key)
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._last_id = 0
+
+
+revocations = RevocationFilter()
+
+
+def _revoke(key, user_id, reason, expires_at):
+    # Replaced rather than updated, so the row gets a new id that the other
+    # processes' refreshes see even if their filters dropped the old one
+    with transaction.atomic():
+        RevokedToken.objects.filter(key=key).delete()
+        RevokedToken.objects.create(
+            key=key, user_id=user_id, reason=reason, revoked_at=timezone.now(), expires_at=expires_at,
+        )
+    revocations.add(key)
+
+
+def revoke_token(token, reason='logout'):
+    """Revoke a single validated access token"""
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    _revoke(token_key(token[api_settings.JTI_CLAIM]), token.get(api_settings.USER_ID_CLAIM), reason, expires_at)
+
+
+def revoke_user_tokens(user_id, reason):
+    """Revoke every access token issued to the user up to now"""
+    expires_at = timezone.now() + api_settings.ACCESS_TOKEN_LIFETIME
+    _revoke(user_key(user_id), user_id, reason, expires_at)
+
+
+def is_revoked(token):
+    bloom = revocations.current()
+    jti_key = token_key(token.get(api_settings.JTI_CLAIM))
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    candidates = [key for key in (jti_key, user_key(user_id)) if key in bloom]
+    if not candidates:
+        return False
+
+    # Filter hit: confirm against the table
+    for key, revoked_at in RevokedToken.objects.filter(
+        key__in=candidates, expires_at__gt=timezone.now()
+    ).values_list('key', 'revoked_at'):
+        if key == jti_key:
+            return True
+        # Tokens issued elsewhere may have a whole-second iat; rounded down,
+        # one from the second of the revocation counts as issued before it
+        if token.get('iat', 0) < revoked_at.timestamp():
+            return True
+    return False
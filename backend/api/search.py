@@ -0,0 +1,184 @@
+"""
+Full-text search index for the admin.
+
+Users, transactions, deposits and withdrawals are indexed into an SQLite FTS5
+table using the trigram tokenizer, so substring searches on emails, names,
+wallet addresses, descriptions and transaction ids become index lookups
+instead of `LIKE '%x%'` scans. `SearchDocument` maps each FTS rowid back to the
+object it describes. The admin filters its changelists with the index as a
+subquery (`search_filter`), so every match is listed and counted. Databases
+without FTS5 fall back to the admin's normal `search_fields`.
+"""
+from django.db import connection, connections, router, transaction as db_transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import SearchDocument
+
+FTS_TABLE = 'api_search_index'
+
+# Trigram matching needs at least three characters per term
+MIN_TERM_LENGTH = 3
+
+# Default bound on the refs `search` returns as a list
+MAX_RESULTS = 1000
+
+# User fields feeding the user document
+USER_FIELDS = ('email', 'username', 'full_name', 'wallet_address', 'phone_number')
+
+_available = {}
+
+
+def create_search_table(using='default'):
+    """Create the FTS5 table next to SearchDocument (run from post_migrate)"""
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(content, tokenize='trigram')"
+        )
+    _available.pop(using, None)
+
+
+def search_available(using='default'):
+    if using not in _available:
+        conn = connections[using]
+        _available[using] = conn.vendor == 'sqlite' and FTS_TABLE in conn.introspection.table_names()
+    return _available[using]
+
+
+def user_content(user):
+    return ' '.join(filter(None, [getattr(user, name) for name in USER_FIELDS]))
+
+
+def transaction_content(tx):
+    return ' '.join(filter(None, [str(tx.id), tx.id.hex, tx.description]))
+
+
+def deposit_content(deposit):
+    return ' '.join(filter(None, [deposit.wallet_address, deposit.wallet_network]))
+
+
+def withdrawal_content(withdrawal):
+    return ' '.join(filter(None, [withdrawal.withdrawal_address, withdrawal.withdrawal_network]))
+
+
+def _ref(pk):
+    return pk.hex if hasattr(pk, 'hex') else str(pk)
+
+
+def index_document(kind, pk, content):
+    """Insert or replace the indexed text for one object"""
+    if not search_available():
+        return
+    with db_transaction.atomic():
+        document, _ = SearchDocument.objects.get_or_create(kind=kind, ref=_ref(pk))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [document.pk])
+            cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, content) VALUES (%s, %s)", [document.pk, content])
+
+
+def remove_document(kind, pk):
+    if not search_available():
+        return
+    document = SearchDocument.objects.filter(kind=kind, ref=_ref(pk)).first()
+    if document is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [document.pk])
+    document.delete()
+
+
+def bulk_index(kind, objects, content):
+    """Index many objects at once, replacing whatever was indexed for this kind"""
+    with db_transaction.atomic():
+        existing = SearchDocument.objects.filter(kind=kind)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT id FROM {SearchDocument._meta.db_table} WHERE kind = %s)",
+                [kind],
+            )
+        existing.delete()
+
+        count = 0
+        batch = []
+        for obj in objects:
+            batch.append((obj, content(obj)))
+            if len(batch) >= 1000:
+                count += _insert_batch(kind, batch)
+                batch = []
+        if batch:
+            count += _insert_batch(kind, batch)
+    return count
+
+
+def _insert_batch(kind, batch):
+    documents = SearchDocument.objects.bulk_create([SearchDocument(kind=kind, ref=_ref(obj.pk)) for obj, _ in batch])
+    if documents and documents[0].pk is None:
+        # Backends without RETURNING need the ids looked up
+        ids = dict(
+            SearchDocument.objects.filter(kind=kind, ref__in=[d.ref for d in documents]).values_list('ref', 'id')
+        )
+        for document in documents:
+            document.pk = ids[document.ref]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, content) VALUES (%s, %s)",
+            [(document.pk, text) for document, (_, text) in zip(documents, batch)],
+        )
+    return len(documents)
+
+
+def searchable(search_term):
+    terms = search_term.split()
+    return bool(terms) and all(len(term) >= MIN_TERM_LENGTH for term in terms)
+
+
+def _match_expression(search_term):
+    # Every whitespace separated term must appear as a substring
+    return ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in search_term.split())
+
+
+def _matches_sql():
+    return (
+        f"SELECT d.ref FROM {FTS_TABLE} AS s "
+        f"JOIN {SearchDocument._meta.db_table} AS d ON d.id = s.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s AND d.kind = %s"
+    )
+
+
+def search(kind, search_term, limit=MAX_RESULTS):
+    """Refs (as stored strings) of up to `limit` objects of this kind whose indexed text contains every term"""
+    using = router.db_for_read(SearchDocument)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"{_matches_sql()} LIMIT %s", [_match_expression(search_term), kind, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_filter(search_term, lookups):
+    """
+    Q object matching objects whose own or related documents contain the terms.
+    `lookups` maps a document kind to the lookup holding that object's pk, e.g.
+    {'transaction': 'pk', 'user': 'user_id'}. Each kind is an uncapped
+    subquery on the index, so the filtered queryset counts every match.
+    """
+    condition = Q(pk__in=[])
+    for kind, lookup in lookups.items():
+        # Refs are stored as text; SQLite compares them with integer keys
+        # numerically and with UUID keys as the same hex strings
+        condition |= Q(**{f'{lookup}__in': RawSQL(_matches_sql(), (_match_expression(search_term), kind))})
+    return condition
+
+
+class SearchIndexAdminMixin:
+    """
+    ModelAdmin mixin answering the changelist search box from the FTS index.
+    Set `search_index_lookups` to the kinds to search and the lookup for each.
+    """
+    search_index_lookups = {}
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not searchable(search_term) or not search_available(router.db_for_read(queryset.model)):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(search_filter(search_term, self.search_index_lookups)), False
@@ -0,0 +1,69 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction as db_transaction
+from django.dispatch import receiver
+from accounts.models import User
+from transactions.models import Transaction, Deposit, Withdrawal
+from . import search
+from .authentication import invalidate_user_snapshot
+from .revocation import revoke_user_tokens
+
+def _changed(instance, fields, created):
+    """Saves that change none of the indexed fields (e.g. balance updates) skip the index"""
+    if created:
+        return True
+    loaded = getattr(instance, '_loaded_values', {})
+    return any(loaded.get(name) != getattr(instance, name) for name in fields)
+
+
+def create_search_table(sender, using='default', **kwargs):
+    search.create_search_table(using)
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, created, raw=False, **kwargs):
+    if not raw and _changed(instance, search.USER_FIELDS, created):
+        search.index_document('user', instance.pk, search.user_content(instance))
+
+
+@receiver(post_save, sender=Transaction)
+def index_transaction(sender, instance, created, raw=False, **kwargs):
+    if not raw and _changed(instance, ('description',), created):
+        search.index_document('transaction', instance.pk, search.transaction_content(instance))
+
+
+@receiver(post_save, sender=Deposit)
+def index_deposit(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_document('deposit', instance.pk, search.deposit_content(instance))
+
+
+@receiver(post_save, sender=Withdrawal)
+def index_withdrawal(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_document('withdrawal', instance.pk, search.withdrawal_content(instance))
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Deposit)
+@receiver(post_delete, sender=Withdrawal)
+def unindex(sender, instance, **kwargs):
+    search.remove_document(sender._meta.model_name, instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_user_snapshot(sender, instance, **kwargs):
+    """Forget the cached auth snapshot now and again once the change is committed"""
+    invalidate_user_snapshot(instance.pk)
+    db_transaction.on_commit(lambda: invalidate_user_snapshot(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_deactivation(sender, instance, created, raw=False, **kwargs):
+    """Deactivating a user (e.g. from the admin) revokes the tokens they hold"""
+    if raw or created:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if loaded.get('is_active') and not instance.is_active:
+        revoke_user_tokens(instance.pk, 'deactivated')
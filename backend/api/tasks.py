@@ -0,0 +1,16 @@
+"""Jobs run on the schedules in settings.JOB_SCHEDULES (see jobs.queue)"""
+from django.conf import settings
+from django.utils import timezone
+from .models import IdempotencyKey, RevokedToken
+
+
+def prune_idempotency_keys():
+    """Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS"""
+    cutoff = timezone.now() - timezone.timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+
+
+def prune_revoked_tokens():
+    """Delete revocations whose tokens have all expired; returns how many"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,93 @@
+"""
+Helpers for the query-count and query-plan regression tests.
+
+`QueryRegressionTestCase.assertNumQueriesAtSizes` runs a request against the
+same fixtures grown to several sizes and pins its query count at each one, so
+an N+1 shows up as a count that grows with the data. `assertQueryPlan`
+compares the `EXPLAIN QUERY PLAN` of a queryset with a snapshot of the tables
+and indexes it is expected to use and fails on any full table scan.
+"""
+import re
+from django.core.cache import caches
+from django.db import connections
+from django.test import TestCase, override_settings
+
+# Row counts each query-count test is repeated at
+DATA_SIZES = (1, 5, 20)
+
+_PLAN_STEP = re.compile(
+    r'^(?P<op>SCAN|SEARCH)( TABLE)? (?P<table>\w+)(?: AS \w+)?'
+    r'(?: USING (?:COVERING |INTEGER PRIMARY KEY|PRIMARY KEY)?(?:INDEX (?P<index>\w+))?'
+    r'| VIRTUAL TABLE INDEX (?P<virtual>\S+))?'
+)
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+}
+
+
+def query_plan(query, params=(), using='default'):
+    """
+    (operation, table, index) for every table access in the plan of a
+    queryset or raw SQL, and ('SORT', purpose, None) for every temp b-tree.
+    index is None for a full scan, 'pk' for a primary key lookup and
+    'virtual <idxNum:idxStr>' for a virtual table such as the FTS index.
+    Tables aliased in the query show up under their alias (U0, ...).
+    """
+    if not isinstance(query, str):
+        using = query.db
+        query, params = query.query.get_compiler(using=using).as_sql()
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)
+        details = [row[-1] for row in cursor.fetchall()]
+
+    steps = []
+    for detail in details:
+        if detail.startswith('USE TEMP B-TREE FOR '):
+            # A sort the indexes could not avoid
+            steps.append(('SORT', detail[len('USE TEMP B-TREE FOR '):], None))
+            continue
+        match = _PLAN_STEP.match(detail)
+        if not match:
+            # Subquery and compound markers
+            continue
+        index = match.group('index')
+        if match.group('virtual'):
+            index = f"virtual {match.group('virtual')}"
+        elif index is None and 'PRIMARY KEY' in detail:
+            index = 'pk'
+        steps.append((match.group('op'), match.group('table'), index))
+    return steps
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryRegressionTestCase(TestCase):
+    data_sizes = DATA_SIZES
+
+    def setUp(self):
+        super().setUp()
+        # Auth snapshots and throttle buckets must not leak between tests
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def assertNumQueriesAtSizes(self, expected, grow, request, sizes=None):
+        """
+        For each size, call grow(size) to bring the fixtures up to that many
+        rows and assert request() runs exactly `expected` queries. request may
+        return a response, which must not be an error, or None.
+        """
+        for size in sizes or self.data_sizes:
+            grow(size)
+            with self.subTest(rows=size):
+                with self.assertNumQueries(expected):
+                    response = request()
+                if response is not None:
+                    self.assertLess(response.status_code, 400, getattr(response, 'data', response))
+
+    def assertQueryPlan(self, query, expected, params=()):
+        """Assert the plan matches the snapshot and never scans a whole table"""
+        steps = query_plan(query, params)
+        full_scans = [table for op, table, index in steps if op == 'SCAN' and index is None]
+        self.assertEqual(full_scans, [], f'full table scan in plan {steps}')
+        self.assertEqual(steps, expected)
@@ -1,3 +1,594 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import User
+from jobs.models import Job
+from accounts.models import SignalPlan, SignalPurchaseHistory
+from transactions.models import Transaction, Deposit, Investment, InvestmentPlan, DashboardCounter, WalletBalance
+from transactions.serializers import TransactionSerializer
+from .management.commands import loadtest
+from .backup import BACKUP_LEVELS, BACKUP_MODELS, Progress, dump_model, load_model
+from . import idempotency, search
+from .middleware import RequestProfile
+from .profiling import current_profile
+from .throttling import MoneyRateThrottle
+from .models import IdempotencyKey, RevokedToken, SearchDocument
+from .tasks import prune_idempotency_keys, prune_revoked_tokens
+from .revocation import RefreshToken, RevocationFilter, revocations, revoke_user_tokens, user_key
+from .search import FTS_TABLE, _match_expression, search_available
+from .testing import TEST_CACHES, QueryRegressionTestCase
+from .views import prebuilt_schema_view
+from .warmup import STEPS, warm_up
 
-# Create your tests here.
+
+def make_user(name, **extra):
+    return User.objects.create(username=name, email=f'{name}@example.com', full_name=name.title(), **extra)
+
+
+# Keep the revocation filter from refreshing in the middle of a measurement
+@override_settings(TOKEN_REVOCATION_REFRESH_SECONDS=3600)
+class JWTAuthenticationQueryTests(QueryRegressionTestCase):
+    def setUp(self):
+        super().setUp()
+        revocations.reset()
+        self.addCleanup(revocations.reset)
+        self.user = make_user('owner', balance=Decimal('10'))
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.created = 0
+
+    def grow_users(self, size):
+        while self.created < size:
+            self.created += 1
+            make_user(f'user{self.created}')
+
+    def test_cached_user_costs_no_queries(self):
+        url = reverse('get_user_balance')
+        # Revocation filter build and user snapshot miss, then the view's wallet query
+        with self.assertNumQueries(3):
+            self.api.get(url)
+        self.assertNumQueriesAtSizes(1, self.grow_users, lambda: self.api.get(url))
+
+    def test_other_users_revocations_cost_nothing(self):
+        url = reverse('get_user_balance')
+        self.api.get(url)
+        other = make_user('other')
+        revoke_user_tokens(other.pk, 'password_change')
+        # Only the other user's key is in the filter, so the owner's token
+        # still misses it without touching the table; the one query is the view's
+        with self.assertNumQueries(1):
+            self.api.get(url)
+
+    def test_withdrawals_check_the_pin_on_the_row(self):
+        User.objects.filter(pk=self.user.pk).update(transaction_pin='1234')
+        WalletBalance.objects.create(user=self.user, currency='USDT', amount_minor=1000)
+        self.api.get(reverse('get_user_balance'))
+        # A queryset update leaves the cached snapshot in place
+        User.objects.filter(pk=self.user.pk).update(transaction_pin='9876')
+
+        def withdraw(pin):
+            return self.api.post(reverse('create_withdrawal'), {
+                'amount': '1', 'currency': 'USDT', 'withdrawal_address': 'address',
+                'withdrawal_network': 'TRC20', 'transaction_pin': pin,
+            }, format='json')
+
+        response = withdraw('1234')
+        self.assertEqual((response.status_code, response.data), (400, {'error': 'Invalid transaction PIN'}))
+        self.assertEqual(withdraw('9876').status_code, 201)
+
+
+@override_settings(CACHES=TEST_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RevocationTests(TestCase):
+    def setUp(self):
+        revocations.reset()
+        self.addCleanup(revocations.reset)
+        self.user = make_user('owner')
+        self.user.set_password('old-password')
+        self.user.save()
+
+    def client_for(self, token):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return api
+
+    def balance_status(self, token):
+        return self.client_for(token).get(reverse('get_user_balance')).status_code
+
+    def test_logged_out_token_is_rejected(self):
+        login = APIClient().post(reverse('login'), {'email': self.user.email, 'password': 'old-password'}, format='json')
+        token = login.data['access']
+        self.assertEqual(self.balance_status(token), 200)
+        self.assertEqual(self.client_for(token).post(reverse('logout')).status_code, 200)
+        self.assertEqual(self.balance_status(token), 401)
+        # Only that token is revoked
+        self.assertEqual(self.balance_status(RefreshToken.for_user(self.user).access_token), 200)
+
+    def test_password_change_rejects_earlier_tokens(self):
+        before = RefreshToken.for_user(self.user).access_token
+        response = self.client_for(before).put(reverse('update_user_profile'), {'password': 'new-password'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balance_status(before), 401)
+        self.assertEqual(self.balance_status(response.data['access']), 200)
+
+        # A token from the same second, with a whole-second iat, was issued before the change
+        revoked_at = RevokedToken.objects.get(key=f'user:{self.user.pk}').revoked_at
+        same_second = AccessToken.for_user(self.user)
+        same_second['iat'] = int(revoked_at.timestamp())
+        self.assertEqual(self.balance_status(same_second), 401)
+
+    @override_settings(TOKEN_REVOCATION_REFRESH_SECONDS=0)
+    def test_revoking_an_expired_key_again_reaches_other_processes(self):
+        revoke_user_tokens(self.user.pk, 'password_change')
+        RevokedToken.objects.update(expires_at=timezone.now() - timezone.timedelta(minutes=1))
+        revoke_user_tokens(make_user('other').pk, 'deactivated')
+        # Another process builds its filter without the expired row
+        elsewhere = RevocationFilter()
+        self.assertNotIn(user_key(self.user.pk), elsewhere.current())
+
+        revoke_user_tokens(self.user.pk, 'password_change')
+        self.assertIn(user_key(self.user.pk), elsewhere.current())
+
+    def test_expired_revocations_are_pruned(self):
+        revoke_user_tokens(self.user.pk, 'password_change')
+        RevokedToken.objects.update(expires_at=timezone.now() - timezone.timedelta(minutes=1))
+        revoke_user_tokens(make_user('other').pk, 'deactivated')
+        self.assertEqual(prune_revoked_tokens(), 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('reason', flat=True)), ['deactivated'])
+
+
+class IdempotencyTests(QueryRegressionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('owner', balance=Decimal('100'), transaction_pin='1234')
+        WalletBalance.objects.create(user=self.user, currency='USDT', amount_minor=10000)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.withdrawal = {
+            'amount': '40', 'currency': 'USDT', 'withdrawal_address': 'address',
+            'withdrawal_network': 'TRC20', 'transaction_pin': '1234',
+        }
+
+    def withdraw(self, key, data=None):
+        return self.api.post(reverse('create_withdrawal'), data or self.withdrawal, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.withdraw('retry-1')
+        self.assertEqual(first.status_code, 201)
+        # One lookup on the (user, key) index and nothing else
+        with self.assertNumQueries(1):
+            retry = self.withdraw('retry-1')
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('60'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        self.withdraw('retry-2')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('20'))
+
+    def test_retried_deposit_emails_once(self):
+        data = {'amount': '50', 'currency': 'USDT', 'wallet_address': 'wallet'}
+        for _ in range(2):
+            self.api.post(reverse('create_deposit'), data, format='json', HTTP_IDEMPOTENCY_KEY='deposit')
+        self.assertEqual((Deposit.objects.count(), Job.objects.count()), (1, 1))
+
+    def test_errors_are_replayed_too(self):
+        self.assertEqual(self.withdraw('big', {**self.withdrawal, 'amount': '500'}).status_code, 400)
+        self.user.balance = Decimal('1000')
+        self.user.save()
+        self.assertEqual(self.withdraw('big', {**self.withdrawal, 'amount': '500'}).status_code, 400)
+
+    def test_key_reused_for_another_request(self):
+        self.withdraw('reused')
+        response = self.withdraw('reused', {**self.withdrawal, 'amount': '10'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_requests_without_a_key_are_not_recorded(self):
+        self.api.post(reverse('create_withdrawal'), self.withdrawal, format='json')
+        self.api.post(reverse('create_withdrawal'), self.withdrawal, format='json')
+        self.assertEqual((Transaction.objects.count(), IdempotencyKey.objects.count()), (2, 0))
+
+    def test_losing_a_race_rolls_the_operation_back(self):
+        first = self.withdraw('race')
+        real_stored = idempotency._stored
+        # The second request looks before the first has committed its key
+        with mock.patch.object(idempotency, '_stored', side_effect=[None, None, real_stored(self.user, 'race')]):
+            retry = self.withdraw('race')
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('60'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_KEY_TTL_HOURS=1)
+    def test_prune(self):
+        self.withdraw('old')
+        self.withdraw('recent', {**self.withdrawal, 'amount': '1'})
+        IdempotencyKey.objects.filter(key='old').update(created_at=timezone.now() - timezone.timedelta(hours=2))
+        prune_idempotency_keys()
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['recent'])
+
+
+@override_settings(CACHES=TEST_CACHES, PROFILING_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILING_CPROFILE_DIR=directory.name))
+        revocations.reset()
+        self.addCleanup(revocations.reset)
+        self.url = reverse('get_user_balance')
+
+    def get(self, user):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        with mock.patch('api.middleware.cProfile.Profile') as profiler:
+            response = api.get(self.url, HTTP_X_PROFILE='cprofile')
+        return response, profiler
+
+    def test_header_is_ignored_for_other_users(self):
+        response, profiler = self.get(make_user('owner'))
+        profiler.assert_not_called()
+        self.assertNotIn('Server-Timing', response)
+
+    def test_staff_get_a_profile(self):
+        response, profiler = self.get(make_user('staff', is_staff=True))
+        profiler.assert_called_once()
+        self.assertIn('db;desc=', response['Server-Timing'])
+
+    def test_serializers_are_timed_only_in_full_profiles(self):
+        # DRF's own serializers are left alone
+        self.assertEqual(BaseSerializer.data.fget.__module__, 'rest_framework.serializers')
+        user = make_user('owner')
+        for amount in ('5', '10', '15'):
+            Transaction.objects.create(user=user, type='deposit', amount=Decimal(amount), currency='USDT')
+        transactions = list(Transaction.objects.select_related('deposit_details', 'withdrawal_details'))
+
+        for detailed in (False, True):
+            profile = RequestProfile(detailed)
+            token = current_profile.set(profile)
+            try:
+                self.assertEqual(len(TransactionSerializer(transactions, many=True).data), 3)
+            finally:
+                current_profile.reset(token)
+            self.assertEqual(profile.serializer_time > 0, detailed)
+            self.assertEqual(profile.serializer_depth, 0)
+
+
+class MetricsQueryTests(QueryRegressionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(make_user('staff', is_staff=True))
+        self.plan = InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('1'),
+            min_deposit=Decimal('10'), max_deposit=Decimal('1000'), duration=60,
+        )
+        self.created = 0
+
+    def grow_overdue_investments(self, size):
+        while self.created < size:
+            self.created += 1
+            user = make_user(f'investor{self.created}')
+            transaction = Transaction.objects.create(
+                user=user, type='investment', status='successful', amount=Decimal('100'), currency='USDT'
+            )
+            Investment.objects.create(
+                user=user, plan=self.plan, transaction=transaction, amount=Decimal('100'),
+                end_date=timezone.now() - timezone.timedelta(minutes=1),
+            )
+
+    def test_metrics_scrape(self):
+        url = reverse('metrics')
+        # Session, staff user and the payout backlog collector
+        self.assertNumQueriesAtSizes(3, self.grow_overdue_investments, lambda: self.client.get(url))
+
+
+class AdminSearchQueryTests(QueryRegressionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(make_user('staff', is_staff=True, is_superuser=True))
+        self.created = 0
+
+    def grow_users(self, size):
+        while self.created < size:
+            self.created += 1
+            user = make_user(f'searchable{self.created}')
+            Transaction.objects.create(user=user, type='deposit', amount=Decimal('5'), currency='USDT')
+
+    def test_user_search(self):
+        url = reverse('admin:accounts_user_changelist')
+        # The index lookups are subqueries of the changelist's own queries
+        self.assertNumQueriesAtSizes(6, self.grow_users, lambda: self.client.get(url, {'q': 'searchable'}))
+
+    def test_transaction_search(self):
+        url = reverse('admin:transactions_transaction_changelist')
+        self.assertNumQueriesAtSizes(6, self.grow_users, lambda: self.client.get(url, {'q': 'searchable'}))
+
+    def test_search_lists_and_counts_every_match(self):
+        count = search.MAX_RESULTS + 5
+        User.objects.bulk_create([
+            User(username=f'bulk{n}', email=f'bulk{n}@gmail.com', full_name=f'Bulk {n}') for n in range(count)
+        ])
+        make_user('other')
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.client.get(reverse('admin:accounts_user_changelist'), {'q': 'gmail.com'})
+        self.assertEqual(response.context['cl'].result_count, count)
+
+
+class PrebuiltSchemaTests(QueryRegressionTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'openapi.json'
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        with override_settings(API_SCHEMA_FILE=self.path):
+            return prebuilt_schema_view(self.factory.get('/api/schema/', headers=headers))
+
+    def test_missing_schema(self):
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_serves_and_revalidates_without_queries(self):
+        self.path.write_bytes(b'{"openapi": "3.0.3"}')
+        with self.assertNumQueries(0):
+            response = self.get()
+        self.assertEqual(response.content, b'{"openapi": "3.0.3"}')
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 304)
+        # A rebuilt file gets a new ETag
+        self.path.write_bytes(b'{"openapi": "3.1.0", "info": {}}')
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 200)
+
+    def test_startup_skips_the_schema_generator(self):
+        # A fresh interpreter, since this one runs in live mode
+        script = (
+            'import sys, django; django.setup(); import backend.urls; '
+            'print(" ".join(sorted(name for name in sys.modules if name.startswith("drf_spectacular"))))'
+        )
+        env = {**os.environ, 'COINEASE_API_DOCS': 'prebuilt', 'DJANGO_SETTINGS_MODULE': 'backend.settings'}
+        loaded = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout.split()
+        self.assertIn('drf_spectacular.apps', loaded)
+        for module in ('drf_spectacular.generators', 'drf_spectacular.openapi', 'drf_spectacular.views'):
+            self.assertNotIn(module, loaded)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class WarmUpTests(TestCase):
+    def test_every_step_runs(self):
+        with self.assertLogs('api.warmup', 'INFO') as logs:
+            timings = warm_up()
+        self.assertEqual(list(timings), [name for name, _ in STEPS])
+        self.assertEqual(len(logs.records), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BackupRoundTripTests(TestCase):
+    def test_restore_reproduces_every_row(self):
+        referrer = make_user('referrer')
+        # Restored before the user who referred them
+        referred = make_user('referred')
+        referred.referred_by = make_user('late')
+        referred.save()
+        plan = InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('1.25'),
+            min_deposit=Decimal('10'), max_deposit=Decimal('1000'), duration=60,
+        )
+        signal_plan = SignalPlan.objects.create(name='Pro', price=Decimal('5'), strength_level=3, duration_days=7)
+        deposit = Transaction.objects.create(user=referrer, type='deposit', amount=Decimal('12.5'), currency='USDT')
+        Deposit.objects.create(transaction=deposit, wallet_address='wallet', reviewed_by=referrer)
+        investment = Transaction.objects.create(user=referrer, type='investment', amount=Decimal('100'), currency='USDT')
+        Investment.objects.create(
+            user=referrer, plan=plan, transaction=investment, amount=Decimal('100'),
+            end_date=timezone.now() + timezone.timedelta(days=1),
+        )
+        SignalPurchaseHistory.objects.create(user=referrer, plan=signal_plan, amount=Decimal('5'), transaction=deposit)
+        reviewers = Group.objects.create(name='reviewers')
+        reviewers.permissions.set(Permission.objects.filter(codename__in=['change_deposit', 'view_deposit']))
+        referrer.groups.add(reviewers)
+        referred.user_permissions.add(Permission.objects.get(codename='view_transaction'))
+
+        def rows():
+            return {label: list(apps.get_model(label).objects.order_by('pk').values()) for label in BACKUP_MODELS}
+
+        before = rows()
+        progress = Progress(lambda line: None)
+        with tempfile.TemporaryDirectory() as directory:
+            counts = {label: dump_model(label, directory, 'default', 2, progress) for label in BACKUP_MODELS}
+            User.objects.all().delete()
+            SignalPlan.objects.all().delete()
+            InvestmentPlan.objects.all().delete()
+            Group.objects.all().delete()
+            for level in BACKUP_LEVELS:
+                for label in level:
+                    self.assertEqual(load_model(label, directory, 'default', 2, counts[label], progress), counts[label])
+        self.assertEqual(rows(), before)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class GenerateDatasetTests(TestCase):
+    def generate(self, seed):
+        call_command('generate_dataset', users=40, seed=seed, batch_size=50, stdout=StringIO())
+        return list(Transaction.objects.order_by('user_id', 'date').values_list('user_id', 'type', 'status', 'amount'))
+
+    def test_generated_data_is_consistent(self):
+        rows = self.generate(seed=7)
+        self.assertEqual(User.objects.count(), 40)
+        self.assertTrue(SignalPlan.objects.exists())
+        self.assertFalse(User.objects.filter(balance__lt=0).exists())
+        self.assertTrue(WalletBalance.objects.exists())
+        self.assertFalse(WalletBalance.objects.filter(amount_minor__lt=0).exists())
+        self.assertEqual(Deposit.objects.count(), Transaction.objects.filter(type='deposit').count())
+        self.assertEqual(Investment.objects.count(), Transaction.objects.filter(type='investment').count())
+        self.assertEqual(
+            Investment.objects.filter(status='completed').count(),
+            Transaction.objects.filter(type='investment_completed').count(),
+        )
+        self.assertEqual(SignalPurchaseHistory.objects.count(), Transaction.objects.filter(type='signal_purchase').count())
+        self.assertEqual(DashboardCounter.objects.get(key='user_balances').total, sum(User.objects.values_list('balance', flat=True)))
+
+        # The same seed gives the same dataset
+        User.objects.all().delete()
+        self.assertEqual(self.generate(seed=7), rows)
+
+    def test_refuses_a_populated_database(self):
+        make_user('existing')
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', users=1, stdout=StringIO())
+
+
+def spend_tokens(location, attempts, results):
+    """Run in a forked worker: try to spend `attempts` tokens from one file-cached bucket"""
+    with override_settings(CACHES={**TEST_CACHES, 'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+    }}):
+        throttle = MoneyRateThrottle()
+        request = RequestFactory().post('/')
+        request.user = mock.Mock(is_authenticated=True, pk=1)
+        results.put(sum(throttle.allow_request(request, None) for _ in range(attempts)))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'money': '30/min', 'auth': '2/min'}})
+    def test_an_empty_bucket_answers_429_with_retry_after(self):
+        data = {'email': 'nobody@example.com', 'password': 'wrong'}
+        statuses = [APIClient().post(reverse('login'), data, format='json').status_code for _ in range(3)]
+        self.assertEqual(statuses, [400, 400, 429])
+        response = APIClient().post(reverse('login'), data, format='json')
+        # One token comes back every 30 seconds
+        self.assertTrue(0 < int(response['Retry-After']) <= 30, response['Retry-After'])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'money': '40/d', 'auth': '10/min'}})
+    def test_workers_sharing_a_file_cache_spend_each_token_once(self):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        with tempfile.TemporaryDirectory() as location:
+            workers = [context.Process(target=spend_tokens, args=(location, 30, results)) for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            allowed = sum(results.get(timeout=30) for _ in workers)
+            for worker in workers:
+                worker.join()
+        self.assertEqual(allowed, 40)
+
+
+class LoadTestCompareTests(TestCase):
+    def compare(self, row):
+        base = {'requests': 100, 'errors': 0, 'rps': 10.0, 'p95_ms': 50.0}
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'config': {}, 'endpoints': {'deposit': base}}, f)
+            f.flush()
+            loadtest.Command(stdout=StringIO()).compare({'deposit': {**base, **row}}, {}, f.name, 0.2)
+
+    def test_faster_but_failing_is_a_regression(self):
+        self.compare({'p95_ms': 5.0, 'rps': 40.0})
+        with self.assertRaisesMessage(CommandError, 'deposit'):
+            self.compare({'p95_ms': 5.0, 'rps': 40.0, 'requests': 400, 'errors': 300})
+
+
+@override_settings(CACHES=TEST_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoadTestSeedTests(TestCase):
+    def test_every_scenario_succeeds_on_the_seeded_data(self):
+        emails, plan_id = loadtest.Command(stdout=StringIO()).seed(2, 5, seed=1)
+        user = loadtest.VirtualUser(0, emails[0], plan_id, random.Random(1))
+        api = APIClient()
+        statuses = {}
+        for step in ['login', 'history'] + [name for name, _ in loadtest.WORKLOAD]:
+            method, path, data = user.request_for(step)
+            response = api.generic(method, path, json.dumps(data) if data else '', content_type='application/json')
+            statuses[step] = response.status_code
+            if step == 'login':
+                api.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+            elif step == 'history':
+                user.transaction_ids = [item['id'] for item in response.json()]
+        self.assertEqual({step: code for step, code in statuses.items() if not 200 <= code < 300}, {})
+
+
+class ApiQueryPlanTests(QueryRegressionTestCase):
+    def test_revocation_refresh(self):
+        self.assertQueryPlan(
+            RevokedToken.objects.filter(pk__gt=10).values_list('id', 'key'),
+            [('SEARCH', 'api_revokedtoken', 'pk')],
+        )
+
+    def test_revocation_rebuild(self):
+        self.assertQueryPlan(
+            RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list('id', 'key'),
+            [('SEARCH', 'api_revokedtoken', 'api_revokedtoken_expires_at_83d94a28')],
+        )
+
+    def test_idempotency_key_lookup(self):
+        self.assertQueryPlan(
+            IdempotencyKey.objects.filter(user_id=1, key='retry'),
+            [('SEARCH', 'api_idempotencykey', 'api_idempotencykey_user_id_key_be5a5fc7_uniq')],
+        )
+
+    def test_idempotency_key_prune(self):
+        self.assertQueryPlan(
+            IdempotencyKey.objects.filter(created_at__lt=timezone.now()),
+            [('SEARCH', 'api_idempotencykey', 'api_idempotencykey_created_at_bf12046a')],
+        )
+
+    def test_revocation_confirmation(self):
+        self.assertQueryPlan(
+            RevokedToken.objects.filter(key__in=['jti:a', 'user:1'], expires_at__gt=timezone.now())
+            .values_list('key', 'revoked_at'),
+            [('SEARCH', 'api_revokedtoken', 'sqlite_autoindex_api_revokedtoken_1')],
+        )
+
+    def test_payout_backlog(self):
+        self.assertQueryPlan(
+            Investment.objects.filter(status__in=['ongoing', 'halfway'], end_date__lt=timezone.now()),
+            [('SEARCH', 'transactions_investment', 'transaction_status_3b33c1_idx')],
+        )
+
+    def test_search_index(self):
+        self.assertTrue(search_available())
+        self.assertQueryPlan(
+            f"SELECT d.ref FROM {FTS_TABLE} AS s "
+            f"JOIN {SearchDocument._meta.db_table} AS d ON d.id = s.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND d.kind = %s LIMIT %s",
+            [
+                ('SEARCH', 'd', 'api_searchdocument_kind_ref_e6ddc7b0_uniq'),
+                # Answered by the trigram index through MATCH
+                ('SCAN', 's', 'virtual 0:=M1'),
+            ],
+            params=[_match_expression('owner'), 'user', 1000],
+        )
+        # The admin filter runs the same lookup as an uncapped subquery
+        self.assertQueryPlan(
+            User.objects.filter(search.search_filter('owner', {'user': 'pk'})),
+            [
+                ('SEARCH', 'accounts_user', 'pk'),
+                ('SEARCH', 'd', 'api_searchdocument_kind_ref_e6ddc7b0_uniq'),
+                ('SCAN', 's', 'virtual 0:=M1'),
+            ],
+        )
@@ -0,0 +1,102 @@
+"""
+Token-bucket throttling for the money and auth endpoints.
+
+Each (scope, user or client IP) pair gets a bucket holding up to N tokens that
+refills continuously at N per period, with N/period taken from
+`REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][scope]` in DRF's usual '10/min'
+format. A request spends one token; an empty bucket rejects the request and
+DRF answers 429 with a `Retry-After` of the time until the next token.
+
+Buckets live in the shared cache, so workers on one host share them, and a
+check is a single cache read and write with no database access. The read and
+write happen under a process lock and, for the file-based cache, an flock on
+a file in its directory, so concurrent workers cannot both spend the same
+token. Without fcntl (Windows) only the process lock applies and each worker
+effectively enforces its own limit.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_lock = threading.Lock()
+
+LOCK_FILE = 'throttle.lock'
+
+
+@contextmanager
+def _bucket_lock(cache):
+    """Held around a bucket's read and write, across processes sharing a file-based cache"""
+    with _lock:
+        directory = getattr(cache, '_dir', None)
+        if fcntl is None or directory is None:
+            yield
+            return
+        os.makedirs(directory, exist_ok=True)
+        # The cache only treats *.djcache files as entries, so it never culls this one
+        with open(os.path.join(directory, LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+    cache_alias = 'shared'
+    timer = time.time
+
+    def __init__(self):
+        self.capacity, self.period = self.parse_rate(api_settings.DEFAULT_THROTTLE_RATES[self.scope])
+        self.refill_rate = self.capacity / self.period
+        self.retry_after = None
+
+    def parse_rate(self, rate):
+        num, period = rate.split('/')
+        duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+        return int(num), duration
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user_{request.user.pk}'
+        else:
+            ident = f'ip_{self.get_ident(request)}'
+        return f'throttle_{self.scope}_{ident}'
+
+    def allow_request(self, request, view):
+        cache = caches[self.cache_alias]
+        key = self.get_cache_key(request, view)
+        with _bucket_lock(cache):
+            now = self.timer()
+            tokens, updated = cache.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.retry_after = (1 - tokens) / self.refill_rate
+            # A bucket that would be full again carries no state worth keeping
+            cache.set(key, (tokens, now), int((self.capacity - tokens) / self.refill_rate) + 1)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class MoneyRateThrottle(TokenBucketThrottle):
+    """Deposits, withdrawals, investments and signal plan purchases"""
+    scope = 'money'
+
+
+class AuthRateThrottle(TokenBucketThrottle):
+    """Login and registration"""
+    scope = 'auth'
@@ -1,3 +1,37 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import etag, require_GET
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAdminUser
+from .authentication import CachedJWTAuthentication
+from .docs import load_schema
+from .metrics import render_prometheus
 
-# Create your views here.
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Prometheus scrape endpoint for staff"""
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _schema_etag(request):
+    schema = load_schema()
+    return schema[1] if schema else None
+
+
+@require_GET
+@etag(_schema_etag)
+def prebuilt_schema_view(request):
+    """The OpenAPI schema written by build_api_schema; clients revalidate with If-None-Match"""
+    schema = load_schema()
+    if schema is None:
+        return HttpResponse(
+            'The API schema has not been built. Run `python manage.py build_api_schema`.',
+            status=404, content_type='text/plain',
+        )
+    response = HttpResponse(schema[0], content_type='application/vnd.oai.openapi+json')
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
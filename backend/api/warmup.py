@@ -0,0 +1,137 @@
+"""
+Worker warm-up.
+
+A fresh worker otherwise pays on its first requests for work Django and DRF
+do lazily: importing the URLconf and views and compiling the resolver
+regexes, loading and compiling templates, building serializer fields from
+model metadata and the first plan catalog queries. `warm_up_once` does all of
+it before the worker takes traffic. backend/asgi.py and backend/wsgi.py call
+it when the application is imported, which is the only hook daphne and
+gunicorn workers have, and `with_lifespan` runs it on `lifespan.startup` for
+ASGI servers that send one.
+"""
+import inspect
+import logging
+import threading
+import time
+from importlib import import_module
+from pathlib import Path
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+from django.utils.module_loading import module_has_submodule
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_done = False
+
+
+def warm_urls():
+    """Import the URLconf and views and populate the resolver, returning the number of URL names"""
+    resolver = get_resolver()
+    return len(resolver.reverse_dict)
+
+
+def warm_templates():
+    """Compile every template under the project template directories into the cached loader"""
+    count = 0
+    for backend in settings.TEMPLATES:
+        for directory in backend.get('DIRS', []):
+            for path in sorted(Path(directory).rglob('*.html')):
+                get_template(path.relative_to(directory).as_posix())
+                count += 1
+    return count
+
+
+def warm_serializers():
+    """Build the fields of every serializer declared in the project's apps"""
+    from rest_framework.serializers import Serializer
+
+    count = 0
+    for app_config in apps.get_app_configs():
+        if not Path(app_config.path).is_relative_to(settings.BASE_DIR):
+            continue
+        if not module_has_submodule(app_config.module, 'serializers'):
+            continue
+        module = import_module(f'{app_config.name}.serializers')
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, Serializer) and cls.__module__ == module.__name__:
+                cls().fields
+                count += 1
+    return count
+
+
+def warm_plan_catalogs():
+    """Run the plan list queries the public endpoints serve, returning the number of plans"""
+    from accounts.models import SignalPlan
+    from transactions.models import InvestmentPlan
+    from transactions.serializers import InvestmentPlanSerializer
+
+    investment_plans = InvestmentPlanSerializer(InvestmentPlan.objects.filter(is_active=True), many=True).data
+    signal_plans = list(SignalPlan.objects.filter(is_active=True))
+    return len(investment_plans) + len(signal_plans)
+
+
+STEPS = [
+    ('urls', warm_urls),
+    ('templates', warm_templates),
+    ('serializers', warm_serializers),
+    ('plan catalogs', warm_plan_catalogs),
+]
+
+
+def warm_up():
+    """
+    Run every warm-up step and return {step: (seconds, count)}. A failing
+    step is logged and skipped; it must never keep a worker from starting.
+    """
+    timings = {}
+    try:
+        for name, step in STEPS:
+            start = time.perf_counter()
+            try:
+                count = step()
+            except Exception:
+                logger.exception("Warm-up step %r failed", name)
+                continue
+            timings[name] = (time.perf_counter() - start, count)
+    finally:
+        # Requests open their own connections on their own threads
+        connections.close_all()
+    logger.info(
+        "Worker warmed up in %.0f ms (%s)",
+        sum(seconds for seconds, _ in timings.values()) * 1000,
+        ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, (seconds, _) in timings.items()),
+    )
+    return timings
+
+
+def warm_up_once():
+    """warm_up() the first time it is called in this process, if WORKER_WARMUP is on"""
+    global _done
+    if _done or not settings.WORKER_WARMUP:
+        return
+    with _lock:
+        if not _done:
+            warm_up()
+            _done = True
+
+
+def with_lifespan(application):
+    """Wrap an ASGI application to answer lifespan events, warming up on startup"""
+    async def wrapper(scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await sync_to_async(warm_up_once, thread_sensitive=False)()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    return wrapper
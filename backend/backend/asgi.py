@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+from api.warmup import warm_up_once, with_lifespan  # noqa: E402  needs the app registry
+
+# daphne has no lifespan support, so warm up before the worker starts listening
+warm_up_once()
+application = with_lifespan(application)
@@ -0,0 +1,122 @@
+"""
+Structured, non-blocking logging.
+
+Application loggers hand records to `QueueingFileHandler`, which only puts
+them on an in-memory queue; a `QueueListener` thread formats them as JSON
+lines and appends them to the log file, so request threads never wait on
+disk I/O. Several processes share the file, so none of them rotates it: a
+`WatchedFileHandler` reopens it after an external tool such as logrotate has
+moved it away. `RequestContextMiddleware` tags every record logged while a request
+is handled with its request id and user id, and logs one line per request
+with its status and duration.
+"""
+import atexit
+import json
+import logging
+import queue
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from django.utils.functional import SimpleLazyObject, empty
+
+_request = ContextVar('log_request', default=None)
+_request_id = ContextVar('log_request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id', 'user_id'}
+
+request_logger = logging.getLogger('coinease.requests')
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'user_id': getattr(record, 'user_id', None),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Copy the current request id and user id onto the record"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        record.user_id = _current_user_id()
+        return True
+
+
+def _current_user_id():
+    request = _request.get()
+    if request is None:
+        return None
+    user = request.__dict__.get('user')
+    # Don't load the session user just to log it
+    if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+        return None
+    return user.pk if user.is_authenticated else None
+
+
+class QueueingFileHandler(QueueHandler):
+    """
+    Queue records in the calling thread and write them from a listener thread
+    to a WatchedFileHandler with JSON formatting.
+    """
+
+    def __init__(self, filename):
+        super().__init__(queue.SimpleQueue())
+        self.addFilter(RequestContextFilter())
+        file_handler = WatchedFileHandler(filename, encoding='utf-8')
+        file_handler.setFormatter(JSONFormatter())
+        self.listener = QueueListener(self.queue, file_handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, where args and exc_info
+        # are still valid, but keep the extra fields for the JSON formatter
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RequestContextMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Keep an id set by the proxy in front of us, within reason
+        request_id = request.META.get('HTTP_X_REQUEST_ID', '')[:64] or uuid.uuid4().hex
+        request_token = _request.set(request)
+        id_token = _request_id.set(request_id)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            response['X-Request-ID'] = request_id
+            request_logger.info('request finished', extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+            })
+            return response
+        finally:
+            _request.reset(request_token)
+            _request_id.reset(id_token)
@@ -0,0 +1,45 @@
+class LoadedValuesMixin:
+    """
+    Remember the field values an instance was loaded with, so save hooks can
+    diff against them instead of re-reading the row.
+    See https://docs.djangoproject.com/en/5.1/ref/models/instances/#customizing-model-loading
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        updating = not self._state.adding
+        super().save(*args, **kwargs)
+        if updating:
+            # An UPDATE does not return generated columns; defer them so the
+            # next access reads the value the database computed
+            for field in self._meta.concrete_fields:
+                if field.generated:
+                    self.__dict__.pop(field.attname, None)
+        # After post_save receivers have seen the old values
+        self.remember_loaded_values()
+
+    def remember_loaded_values(self):
+        """Treat the current field values as the loaded state"""
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # refresh_from_db copies values from a fresh instance without going
+        # through from_db, so keep the remembered state in step with it
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None:
+            self.remember_loaded_values()
+        else:
+            loaded = getattr(self, '_loaded_values', {})
+            for name in fields:
+                attname = self._meta.get_field(name).attname
+                loaded[attname] = getattr(self, attname)
+            self._loaded_values = loaded
@@ -0,0 +1,94 @@
+"""
+Database routing for the read replica.
+
+Reads only go to the ``replica`` alias inside a ``replica_reads()`` block, so
+money paths and anything else that is not explicitly opted in keep using the
+primary. A user who has just written something is pinned to the primary for
+``REPLICA_STICKY_SECONDS`` so they always read their own writes, and reads
+inside a transaction on the primary stay there to see its uncommitted writes.
+The replica is skipped while its file does not exist.
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_available():
+    # Connecting to a missing SQLite file would create an empty database
+    return REPLICA_ALIAS in settings.DATABASES and os.path.exists(settings.DATABASES[REPLICA_ALIAS]['NAME'])
+
+
+def _sticky_key(user_id):
+    return f'db_sticky_{user_id}'
+
+
+def mark_user_write(user_id):
+    """Pin a user to the primary database for the stickiness window"""
+    if user_id is None or not replica_available():
+        return
+    caches['shared'].set(_sticky_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return user_id is not None and caches['shared'].get(_sticky_key(user_id)) is not None
+
+
+@contextmanager
+def replica_reads(user=None):
+    """Route reads inside the block to the replica unless the user recently wrote"""
+    user_id = getattr(user, 'pk', None)
+    enabled = replica_available() and not is_sticky(user_id)
+    token = _use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def use_replica(view_func):
+    """Decorator for read-only views that can be served from the replica"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request.user):
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a file copy of the primary, never migrated directly
+        return db != REPLICA_ALIAS
+
+
+class ReplicaChangeListMixin:
+    """ModelAdmin mixin that serves GET changelists from the replica"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context=extra_context)
+        with replica_reads(request.user):
+            response = super().changelist_view(request, extra_context=extra_context)
+            # The result list is a lazy queryset, so render while still routed
+            if hasattr(response, 'render'):
+                response.render()
+        return response
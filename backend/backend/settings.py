@@ -10,7 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
+import tempfile
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -34,6 +39,14 @@ ALLOWED_HOSTS = [
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# How the OpenAPI schema and docs are served (see api/docs.py): 'live'
+# generates the schema on every request, 'prebuilt' serves the file written
+# by `python manage.py build_api_schema` at deploy time, 'off' drops them
+API_DOCS_MODE = os.environ.get('COINEASE_API_DOCS', 'live')
+if API_DOCS_MODE not in ('live', 'prebuilt', 'off'):
+    raise ImproperlyConfigured(f"COINEASE_API_DOCS must be live, prebuilt or off, not {API_DOCS_MODE!r}")
+API_SCHEMA_FILE = Path(os.environ.get('COINEASE_API_SCHEMA_FILE', BASE_DIR / 'openapi.json'))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -51,9 +64,17 @@ INSTALLED_APPS = [
     'accounts',
     'channels',
     'transactions',
+    'jobs',
 ]
 
+# Prebuilt mode keeps the app for the Swagger and Redoc templates; only its
+# app config and checks load at startup, not the schema generator or views
+if API_DOCS_MODE == 'off':
+    INSTALLED_APPS.remove('drf_spectacular')
+
 MIDDLEWARE = [
+    'backend.log.RequestContextMiddleware',
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,8 +83,67 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
+# Request profiling (see api/middleware.py). Staff can profile a request by
+# sending `X-Profile: 1`, or `X-Profile: cprofile` to also dump a cProfile file.
+PROFILING_SAMPLE_RATE = float(os.environ.get('COINEASE_PROFILING_SAMPLE_RATE', 0))
+PROFILING_CPROFILE_DIR = BASE_DIR / 'profiles'
+
+# Most queries a view should run, by URL name; going over is logged. Writes
+# include the rollup, search index and replica stickiness updates.
+QUERY_BUDGETS = {
+    'get_user_balance': 1,
+    'user_transactions': 4,
+    'transaction_detail': 3,
+    'user_investments': 6,
+    'investment_plans': 1,
+    'get_signal_plans': 1,
+    'create_deposit': 25,
+    'create_withdrawal': 27,
+    'create_investment': 22,
+    'purchase_signal_plan': 21,
+}
+
+# Warm URL resolvers, templates, serializers and plan catalogs when a worker
+# imports the application (see api/warmup.py)
+WORKER_WARMUP = os.environ.get('COINEASE_WARMUP', '1') == '1'
+
+# Per-process metric files merged by the metrics endpoint (see api/metrics.py)
+METRICS_DIR = os.environ.get('COINEASE_METRICS_DIR', BASE_DIR / 'metrics')
+METRICS_FLUSH_SECONDS = 10
+
+# Application logs are queued in the request thread and written as JSON lines
+# by a background thread (see backend/log.py). Every process appends to the
+# same file, which is rotated externally (logrotate), never by the processes.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queue': {
+            '()': 'backend.log.QueueingFileHandler',
+            'filename': os.environ.get('COINEASE_LOG_FILE', BASE_DIR / 'logfile.log'),
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'coinease': {'level': 'INFO'},
+        'accounts': {'level': 'INFO'},
+        'transactions': {'level': 'INFO'},
+        'api': {'level': 'INFO'},
+        'jobs': {'level': 'INFO'},
+    },
+}
+
+# The test runner keeps its log lines and metric files out of the tree
+if sys.argv[1:2] == ['test']:
+    LOGGING['handlers']['queue'] = {'class': 'logging.NullHandler'}
+    METRICS_DIR = tempfile.mkdtemp(prefix='coinease-test-metrics-')
+
 CORS_ALLOWED_ORIGINS = [
     "https://coinease.live",  # Frontend URL
     "https://www.coinease.live",  # Frontend URL
@@ -71,6 +151,11 @@ CORS_ALLOWED_ORIGINS = [
     "http://95.179.251.235:3000",  # Frontend URL
 ]
 
+# Clients send Idempotency-Key on money-moving requests and can tell a replayed response
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['idempotent-replayed']
+
+EMAIL_BACKEND = os.environ.get('COINEASE_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'mail.privateemail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -81,14 +166,52 @@ ADMIN_EMAIL = 'coinease7@gmail.com'
 DEFAULT_FROM_EMAIL = 'communications@coinease.live'
 SITE_URL = 'https://coinease.live'
 
+# Background jobs (see jobs/queue.py), run by `python manage.py run_jobs`
+JOB_WORKER_PROCESSES = 1
+JOB_WORKER_THREADS = 4
+# Attempts for enqueued jobs; the first retry waits JOB_RETRY_BACKOFF seconds
+# and each later one twice as long, up to JOB_RETRY_BACKOFF_MAX
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 30
+JOB_RETRY_BACKOFF_MAX = 3600
+# Workers refresh the heartbeat of their running jobs this often; a running
+# job without one for JOB_STALLED_AFTER seconds is taken to have lost its worker
+JOB_HEARTBEAT_SECONDS = 10
+JOB_STALLED_AFTER = 60
+# How often each worker enqueues due schedules and requeues stalled jobs
+JOB_HOUSEKEEPING_SECONDS = 5
+JOB_RETENTION_DAYS = 7
+# Recurring jobs, every `every` seconds
+JOB_SCHEDULES = {
+    'process_investments': {'task': 'transactions.tasks.process_investments', 'every': 60},
+    # The check notifies plans that expired within the last hour
+    'check_signal_expirations': {'task': 'accounts.tasks.check_signal_expirations', 'every': 3600},
+    'rebuild_dashboard_rollups': {'task': 'transactions.tasks.rebuild_dashboard_rollups', 'every': 24 * 3600},
+    'prune_jobs': {'task': 'jobs.tasks.prune_jobs', 'every': 3600},
+    'prune_idempotency_keys': {'task': 'api.tasks.prune_idempotency_keys', 'every': 3600},
+    'prune_revoked_tokens': {'task': 'api.tasks.prune_revoked_tokens', 'every': 3600},
+}
+
+# How long a money-moving request's Idempotency-Key replays its response (see api/idempotency.py)
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
- 'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Token buckets for api.throttling: N requests of burst, refilled at N per period
+    'DEFAULT_THROTTLE_RATES': {
+        'money': '30/min',
+        'auth': '10/min',
+    },
 }
 
+# Every @api_view imports its schema class when it is defined, so only load
+# drf-spectacular's when the schema is generated in this process
+if API_DOCS_MODE == 'live':
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -129,10 +252,60 @@ SIMPLE_JWT = {
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('COINEASE_DB', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            # Take the write lock when a transaction starts; a deferred
+            # transaction that reads and then writes fails with "database is
+            # locked" when another writer got there first
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Read replica for read-heavy endpoints and admin changelists. It is a copy of
+# the primary refreshed with `python manage.py refresh_replica`, and is only
+# used once that copy exists.
+REPLICA_DATABASE_PATH = Path(os.environ.get('COINEASE_REPLICA_DB', BASE_DIR / 'db.replica.sqlite3'))
+if REPLICA_DATABASE_PATH.exists():
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': REPLICA_DATABASE_PATH,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['backend.routers.ReplicaRouter']
+
+# Seconds a user keeps reading from the primary after one of their own writes
+REPLICA_STICKY_SECONDS = 10
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared between worker processes on the same host
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('COINEASE_CACHE_DIR', BASE_DIR / 'cache'),
+    },
+}
+
+# How long API requests may authenticate from a cached user snapshot
+JWT_USER_CACHE_SECONDS = 60
+
+# Access token revocation (see api/revocation.py). New revocations reach other
+# processes within TOKEN_REVOCATION_REFRESH_SECONDS.
+TOKEN_REVOCATION_REFRESH_SECONDS = 5
+TOKEN_REVOCATION_REBUILD_SECONDS = 600
+TOKEN_REVOCATION_BLOOM_CAPACITY = 100000
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = 0.001
+
+# Exchange rates for wallet valuations (see transactions/rates.py). The file
+# provider is a local stand-in for a market data feed.
+EXCHANGE_RATE_PROVIDER = os.environ.get('COINEASE_RATE_PROVIDER', 'transactions.rates.FileRateProvider')
+EXCHANGE_RATES_FILE = os.environ.get('COINEASE_RATES_FILE', BASE_DIR / 'transactions' / 'exchange_rates.json')
+EXCHANGE_RATE_TTL = int(os.environ.get('COINEASE_RATE_TTL', '60'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -152,6 +325,19 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing work factor. Changing it rehashes each user's password on
+# their next login (see accounts/hashers.py); run `manage.py benchmark_auth`
+# to see what a value costs per core.
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('COINEASE_PASSWORD_HASH_ITERATIONS', 870000))
+
+PASSWORD_HASHERS = [
+    'accounts.hashers.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -174,6 +360,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Settled transactions older than this move to the archive table
+# (`python manage.py archive_transactions`), in chunks of this many rows
+TRANSACTION_ARCHIVE_AFTER_DAYS = 180
+TRANSACTION_ARCHIVE_CHUNK_SIZE = 1000
+
 # Admin approval token for one-click deposit approval
 # You should change this to a secure random string in production
 ADMIN_APPROVAL_TOKEN = "YOUR_SECURE_RANDOM_TOKEN"
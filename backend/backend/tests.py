@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from accounts.models import User
+from api.testing import TEST_CACHES
+from transactions.models import Transaction, InvestmentPlan
+from .routers import REPLICA_ALIAS, replica_available, replica_reads
+
+
+def make_user(name):
+    return User.objects.create(username=name, email=f'{name}@example.com', full_name=name.title())
+
+
+@override_settings(CACHES=TEST_CACHES, REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.replica_path = os.path.join(directory.name, 'replica.sqlite3')
+        connections.settings[REPLICA_ALIAS] = {**connections['default'].settings_dict, 'NAME': cls.replica_path}
+        cls.addClassCleanup(cls.drop_replica)
+        # The alias only exists for this class, so the runner can't be told about it up front
+        cls.databases = {'default', REPLICA_ALIAS}
+        super().setUpClass()
+
+    @classmethod
+    def drop_replica(cls):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+        del cls.databases
+
+    def setUp(self):
+        self.user = make_user('reader')
+        self.other = make_user('other')
+        self.deposit(self.user)
+
+        # The replica is an SQLite copy of the primary taken now
+        connections[REPLICA_ALIAS].close()
+        if os.path.exists(self.replica_path):
+            os.remove(self.replica_path)
+        primary = connections['default']
+        primary.ensure_connection()
+        replica = sqlite3.connect(self.replica_path)
+        try:
+            primary.connection.backup(replica)
+        finally:
+            replica.close()
+        # The setup writes are old news by the time the copy is taken
+        caches['shared'].clear()
+
+    def deposit(self, user):
+        # bulk_create skips the signals, like a write made on the user's behalf elsewhere
+        Transaction.objects.bulk_create([Transaction(user=user, type='deposit', amount=Decimal('10'), currency='USDT')])
+
+    def history(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        return len(api.get(reverse('user_transactions')).json())
+
+    def plans_read(self, user):
+        with replica_reads(user):
+            return InvestmentPlan.objects.count()
+
+    def add_plan(self):
+        InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('1'), min_deposit=Decimal('1'), max_deposit=Decimal('10'), duration=60,
+        )
+
+    def test_reads_go_to_the_replica(self):
+        self.deposit(self.user)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.history(self.user), 1)
+
+    def test_own_writes_pin_the_user_to_the_primary(self):
+        self.deposit(self.user)
+        # A save goes through the signals that mark the user's write
+        Transaction.objects.create(user=self.user, type='withdrawal', amount=Decimal('1'), currency='USDT')
+        self.deposit(self.other)
+        self.assertEqual(self.history(self.user), 3)
+        self.assertEqual(self.history(self.other), 0)
+
+        # Back on the replica once the window is over
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 11):
+            self.assertEqual(self.history(self.user), 1)
+
+    def test_reads_in_a_transaction_stay_on_the_primary(self):
+        with transaction.atomic():
+            self.add_plan()
+            self.assertEqual(self.plans_read(self.other), 1)
+        self.assertEqual(self.plans_read(self.other), 0)
+
+    def test_a_missing_replica_file_is_skipped(self):
+        self.add_plan()
+        os.remove(self.replica_path)
+        self.assertFalse(replica_available())
+        self.assertEqual(self.plans_read(self.other), 1)
+        self.assertFalse(os.path.exists(self.replica_path))
@@ -1,16 +1,28 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from api.docs import lazy_view
+from api.views import metrics_view, prebuilt_schema_view
 
 urlpatterns = [
     path('api/admin/', admin.site.urls),
 
-    # API Schema and Swagger UI
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
-
     # Your app endpoints
     path('api/accounts/', include('accounts.urls')),  # Ensure you have this line
     path('api/transactions/', include('transactions.urls')),
+
+    # Prometheus metrics (staff only)
+    path('api/metrics/', metrics_view, name='metrics'),
 ]
+
+# API Schema and Swagger UI, imported on first use (see api/docs.py)
+if settings.API_DOCS_MODE != 'off':
+    if settings.API_DOCS_MODE == 'prebuilt':
+        schema_view = prebuilt_schema_view
+    else:
+        schema_view = lazy_view('drf_spectacular.views.SpectacularAPIView')
+    urlpatterns += [
+        path('api/schema/', schema_view, name='schema'),
+        path('api/docs/', lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema'), name='swagger-ui'),
+        path('api/redoc/', lazy_view('drf_spectacular.views.SpectacularRedocView', url_name='schema'), name='redoc'),
+    ]
@@ -0,0 +1,29 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Job, Schedule
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'run_at', 'attempts', 'max_attempts', 'duration', 'finished_at')
+    list_filter = ('status', 'task')
+    search_fields = ('task',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'duration', 'worker', 'heartbeat_at', 'last_error')
+    actions = ['retry_now']
+
+    @admin.action(description='Run selected jobs again now')
+    def retry_now(self, request, queryset):
+        count = queryset.exclude(status='running').update(
+            status='queued', run_at=timezone.now(), attempts=0, last_error=''
+        )
+        self.message_user(request, f'{count} jobs queued')
+
+
+@admin.register(Schedule)
+class ScheduleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'task', 'interval', 'next_run_at', 'last_run_at')
+    # JOB_SCHEDULES owns everything but when the next run is
+    readonly_fields = ('name', 'task', 'kwargs', 'interval', 'last_run_at')
+
+    def has_add_permission(self, request):
+        return False
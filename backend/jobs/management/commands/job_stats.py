@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Per-task job counts and run times over a recent window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Only jobs created in the last this many hours')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timezone.timedelta(hours=options['hours'])
+        rows = (
+            Job.objects.filter(created_at__gte=since)
+            .values('task')
+            .annotate(
+                total=Count('id'),
+                queued=Count('id', filter=Q(status__in=['queued', 'running'])),
+                succeeded=Count('id', filter=Q(status='succeeded')),
+                failed=Count('id', filter=Q(status='failed')),
+                retried=Count('id', filter=Q(attempts__gt=1)),
+                avg_duration=Avg('duration'),
+                max_duration=Max('duration'),
+            )
+            .order_by('-total')
+        )
+        self.stdout.write(
+            f"{'task':<55} {'jobs':>6} {'queued':>6} {'ok':>6} {'failed':>6} {'retried':>7} {'avg ms':>9} {'max ms':>9}"
+        )
+        for row in rows:
+            avg = f"{row['avg_duration'] * 1000:.1f}" if row['avg_duration'] is not None else '-'
+            peak = f"{row['max_duration'] * 1000:.1f}" if row['max_duration'] is not None else '-'
+            self.stdout.write(
+                f"{row['task']:<55} {row['total']:>6} {row['queued']:>6} {row['succeeded']:>6} {row['failed']:>6} "
+                f"{row['retried']:>7} {avg:>9} {peak:>9}"
+            )
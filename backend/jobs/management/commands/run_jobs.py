@@ -0,0 +1,76 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from jobs.queue import sync_schedules
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs and the schedules in JOB_SCHEDULES in a pool of warm worker processes and threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKER_PROCESSES, help='Worker processes')
+        parser.add_argument('--threads', type=int, default=settings.JOB_WORKER_THREADS, help='Job threads per process')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls when idle')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due or running')
+        parser.add_argument('--no-schedules', action='store_true', help='Only run queued jobs; do not enqueue schedules')
+        # Set on the processes started by a supervising run_jobs
+        parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        schedules = not options['no_schedules']
+        if schedules and not options['child']:
+            sync_schedules()
+
+        if options['processes'] > 1:
+            self.supervise(options)
+            return
+
+        worker = Worker(threads=options['threads'], poll_interval=options['poll_interval'], schedules=schedules)
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        processed = worker.run(burst=options['burst'])
+        if not options['child']:
+            self.stdout.write(self.style.SUCCESS(f'Ran {processed} jobs'))
+
+    def supervise(self, options):
+        """Keep `processes` single-process workers running until told to stop"""
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'run_jobs', '--child',
+            '--processes', '1', '--threads', str(options['threads']), '--poll-interval', str(options['poll_interval']),
+        ]
+        if options['burst']:
+            command.append('--burst')
+        if options['no_schedules']:
+            command.append('--no-schedules')
+
+        stopping = False
+
+        def stop(*args):
+            nonlocal stopping
+            stopping = True
+            for child in children:
+                if child.poll() is None:
+                    child.send_signal(signal.SIGTERM)
+
+        children = [subprocess.Popen(command) for _ in range(options['processes'])]
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f"Started {len(children)} worker processes with {options['threads']} threads each")
+
+        while True:
+            for index, child in enumerate(children):
+                if child.poll() is None or stopping or options['burst']:
+                    continue
+                # A worker that crashed is replaced; its running jobs are requeued once they stall
+                self.stderr.write(f'Worker process {child.pid} exited with {child.returncode}, restarting')
+                children[index] = subprocess.Popen(command)
+            if all(child.poll() is not None for child in children):
+                break
+            time.sleep(1)
+        self.stdout.write(self.style.SUCCESS('All worker processes stopped'))
@@ -0,0 +1,56 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Schedule(models.Model):
+    """
+    A recurring job, kept in step with settings.JOB_SCHEDULES by the worker.
+    Workers share next_run_at, so each run is enqueued once however many
+    workers are up.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    interval = models.PositiveIntegerField(help_text='Seconds between runs')
+    next_run_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+    """One call of `task` (a dotted path to a function) with JSON `kwargs`, run by the jobs worker"""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    )
+
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    schedule = models.ForeignKey(Schedule, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Run time of the latest attempt, in seconds
+    duration = models.FloatField(null=True, blank=True)
+    # Claim token of the worker running the job
+    worker = models.CharField(max_length=100, blank=True)
+    # Refreshed by the worker while the job runs (see jobs.queue.heartbeat)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Claiming due jobs in run_at order, requeueing stalled ones and pruning
+            models.Index(fields=['status', 'run_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
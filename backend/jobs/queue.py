@@ -0,0 +1,165 @@
+"""
+Database-backed job queue.
+
+`enqueue` adds a Job row in the caller's database transaction, so a job only
+exists once the work that asked for it has committed. A task is the dotted
+path of a function taking the job's JSON kwargs; it succeeds by returning
+and fails by raising, after which it is retried with exponential backoff
+until it has had `max_attempts` attempts.
+
+Workers (`python manage.py run_jobs`, see jobs/worker.py) claim due jobs
+with a conditional UPDATE, so two workers never run the same job, and
+enqueue the runs of settings.JOB_SCHEDULES as they come due. While a job
+runs its worker refreshes the job's heartbeat; only a job whose heartbeat
+stopped, because its worker died, is taken back, however long it has run.
+"""
+import logging
+import random
+import time
+import traceback
+import uuid
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from api import metrics
+from .models import Job, Schedule
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def task_path(task):
+    """The dotted path stored for a task given as a path or a module-level function"""
+    if isinstance(task, str):
+        return task
+    return f'{task.__module__}.{task.__qualname__}'
+
+
+def enqueue(task, run_at=None, max_attempts=None, schedule=None, **kwargs):
+    """Queue task(**kwargs) to run at run_at (default: now); kwargs must be JSON serializable"""
+    return Job.objects.create(
+        task=task_path(task),
+        kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        schedule=schedule,
+    )
+
+
+def retry_delay(attempts):
+    """Seconds before the retry that follows attempt number `attempts`, with jitter"""
+    delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.9, 1.1)
+
+
+def claim(worker, limit):
+    """Mark up to `limit` due jobs as running for this worker and return them, oldest first"""
+    now = timezone.now()
+    ids = list(
+        Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = f'{worker}:{uuid.uuid4().hex[:8]}'
+    # Jobs another worker claimed in the meantime are no longer queued
+    Job.objects.filter(id__in=ids, status='queued').update(
+        status='running', worker=token, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1
+    )
+    return list(Job.objects.filter(id__in=ids, worker=token).order_by('run_at'))
+
+
+def run(job):
+    """Run a claimed job and record the outcome; returns True if it succeeded"""
+    metrics.job_queue_delay.observe((job.started_at - job.run_at).total_seconds(), task=job.task)
+    start = time.perf_counter()
+    try:
+        import_string(job.task)(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+    else:
+        error = None
+    duration = time.perf_counter() - start
+    metrics.job_duration.observe(duration, task=job.task)
+
+    finished = {'finished_at': timezone.now(), 'duration': duration, 'worker': ''}
+    # Only the claim that is still current may record an outcome, not one
+    # whose job was requeued as stalled in the meantime
+    current = Job.objects.filter(pk=job.pk, worker=job.worker)
+    if error is None:
+        current.update(status='succeeded', last_error='', **finished)
+        metrics.job_runs.inc(task=job.task, outcome='succeeded')
+        logger.info("Job %s %s succeeded in %.0f ms", job.pk, job.task, duration * 1000)
+        return True
+
+    if job.attempts < job.max_attempts:
+        delay = retry_delay(job.attempts)
+        current.update(
+            status='queued', last_error=error, run_at=timezone.now() + timezone.timedelta(seconds=delay), **finished
+        )
+        metrics.job_runs.inc(task=job.task, outcome='retried')
+        logger.warning(
+            "Job %s %s failed on attempt %d of %d, retrying in %.0f s",
+            job.pk, job.task, job.attempts, job.max_attempts, delay, extra={'error': error},
+        )
+    else:
+        current.update(status='failed', last_error=error, **finished)
+        metrics.job_runs.inc(task=job.task, outcome='failed')
+        logger.error("Job %s %s failed after %d attempts", job.pk, job.task, job.attempts, extra={'error': error})
+    return False
+
+
+def heartbeat(worker):
+    """Mark the jobs this worker is running as alive"""
+    return Job.objects.filter(status='running', worker__startswith=f'{worker}:').update(heartbeat_at=timezone.now())
+
+
+def requeue_stalled():
+    """
+    Give jobs whose worker died mid-run back to the queue, or fail them if out
+    of attempts. A job is only taken for dead once its worker has missed
+    heartbeats for JOB_STALLED_AFTER seconds, so a slow run is never started
+    a second time alongside itself.
+    """
+    stalled = Job.objects.filter(
+        status='running', heartbeat_at__lt=timezone.now() - timezone.timedelta(seconds=settings.JOB_STALLED_AFTER)
+    )
+    error = 'The worker stopped while running the job'
+    requeued = stalled.filter(attempts__lt=F('max_attempts')).update(status='queued', worker='', last_error=error)
+    failed = stalled.update(status='failed', worker='', last_error=error, finished_at=timezone.now())
+    if requeued or failed:
+        logger.warning("Requeued %d and failed %d stalled jobs", requeued, failed)
+    return requeued, failed
+
+
+def sync_schedules():
+    """Create, update and delete Schedule rows to match settings.JOB_SCHEDULES"""
+    configured = settings.JOB_SCHEDULES
+    for name, entry in configured.items():
+        Schedule.objects.update_or_create(
+            name=name, defaults={'task': entry['task'], 'kwargs': entry.get('kwargs', {}), 'interval': entry['every']}
+        )
+    Schedule.objects.exclude(name__in=configured).delete()
+
+
+def enqueue_due_schedules():
+    """
+    Enqueue a job for every schedule that has come due, unless its previous
+    run is still queued or running. Scheduled jobs get a single attempt; the
+    next run is the retry.
+    """
+    now = timezone.now()
+    enqueued = []
+    for schedule in Schedule.objects.filter(next_run_at__lte=now):
+        # Keep the cadence, but do not replay runs missed while no worker was up
+        next_run_at = max(schedule.next_run_at + timezone.timedelta(seconds=schedule.interval), now)
+        with transaction.atomic():
+            claimed = Schedule.objects.filter(pk=schedule.pk, next_run_at=schedule.next_run_at).update(
+                next_run_at=next_run_at, last_run_at=now
+            )
+            if not claimed or schedule.jobs.filter(status__in=ACTIVE_STATUSES).exists():
+                continue
+            enqueued.append(enqueue(schedule.task, max_attempts=1, schedule=schedule, **schedule.kwargs))
+    return enqueued
@@ -0,0 +1,9 @@
+from django.conf import settings
+from django.utils import timezone
+from .models import Job
+
+
+def prune_jobs():
+    """Delete finished jobs older than JOB_RETENTION_DAYS"""
+    cutoff = timezone.now() - timezone.timedelta(days=settings.JOB_RETENTION_DAYS)
+    Job.objects.filter(status__in=['succeeded', 'failed'], finished_at__lt=cutoff).delete()
@@ -0,0 +1,138 @@
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.mail import send_mail_async
+from api.testing import QueryRegressionTestCase
+from . import queue
+from .models import Job, Schedule
+from .tasks import prune_jobs
+
+calls = []
+
+
+def record(**kwargs):
+    calls.append(kwargs)
+
+
+def explode():
+    raise RuntimeError('boom')
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def test_claim_and_run(self):
+        job = queue.enqueue(record, amount=5)
+        self.assertEqual(job.task, 'jobs.tests.record')
+        claimed = queue.claim('worker', 10)
+        self.assertEqual(claimed, [job])
+        # Claimed jobs are no longer handed out
+        self.assertEqual(queue.claim('other', 10), [])
+
+        self.assertTrue(queue.run(claimed[0]))
+        self.assertEqual(calls, [{'amount': 5}])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.worker), ('succeeded', 1, ''))
+        self.assertIsNotNone(job.duration)
+
+    def test_future_jobs_wait(self):
+        queue.enqueue(record, run_at=timezone.now() + timezone.timedelta(minutes=5))
+        self.assertEqual(queue.claim('worker', 10), [])
+
+    @override_settings(JOB_RETRY_BACKOFF=60, JOB_RETRY_BACKOFF_MAX=90)
+    def test_retries_with_backoff_then_fails(self):
+        job = queue.enqueue(explode, max_attempts=3)
+        for attempt, delay in ((1, 60), (2, 90)):
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            self.assertFalse(queue.run(queue.claim('worker', 1)[0]))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('queued', attempt))
+            self.assertIn('RuntimeError: boom', job.last_error)
+            wait = (job.run_at - job.finished_at).total_seconds()
+            self.assertTrue(delay * 0.9 <= wait <= delay * 1.1, wait)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        queue.run(queue.claim('worker', 1)[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+
+    @override_settings(JOB_STALLED_AFTER=60)
+    def test_stalled_jobs_are_requeued(self):
+        job = queue.enqueue(record, max_attempts=2)
+        queue.claim('worker', 1)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timezone.timedelta(minutes=2))
+        self.assertEqual(queue.requeue_stalled(), (1, 0))
+        # The old claim can no longer record an outcome
+        stale = Job.objects.get(pk=job.pk)
+        stale.worker = 'worker:gone'
+        stale.started_at = timezone.now()
+        queue.run(stale)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+
+    @override_settings(JOB_STALLED_AFTER=60)
+    def test_long_runs_with_a_heartbeat_are_left_alone(self):
+        job = queue.enqueue(record)
+        queue.claim('worker', 1)
+        long_ago = timezone.now() - timezone.timedelta(hours=2)
+        Job.objects.filter(pk=job.pk).update(started_at=long_ago, heartbeat_at=long_ago)
+        # Another worker's heartbeat does not cover this job
+        self.assertEqual(queue.heartbeat('work'), 0)
+        self.assertEqual(queue.heartbeat('worker'), 1)
+        self.assertEqual(queue.requeue_stalled(), (0, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+
+    def test_emails_are_sent_by_the_job(self):
+        send_mail_async('Hello', 'Body', 'from@example.com', ['to@example.com'], kind='test', html_message='<p>Body</p>')
+        self.assertEqual(mail.outbox, [])
+        self.assertTrue(queue.run(queue.claim('worker', 1)[0]))
+        self.assertEqual([email.to for email in mail.outbox], [['to@example.com']])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+
+    @override_settings(JOB_RETENTION_DAYS=1)
+    def test_prune(self):
+        old, recent = queue.enqueue(record), queue.enqueue(record)
+        Job.objects.filter(pk=old.pk).update(status='succeeded', finished_at=timezone.now() - timezone.timedelta(days=2))
+        Job.objects.filter(pk=recent.pk).update(status='succeeded', finished_at=timezone.now())
+        prune_jobs()
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [recent.pk])
+
+
+@override_settings(JOB_SCHEDULES={'tick': {'task': 'jobs.tests.record', 'every': 60, 'kwargs': {'source': 'tick'}}})
+class ScheduleTests(TestCase):
+    def test_sync(self):
+        Schedule.objects.create(name='removed', task='jobs.tests.record', interval=5)
+        queue.sync_schedules()
+        self.assertEqual(list(Schedule.objects.values_list('name', 'interval')), [('tick', 60)])
+
+    def test_each_run_is_enqueued_once(self):
+        queue.sync_schedules()
+        jobs = queue.enqueue_due_schedules()
+        self.assertEqual([(job.task, job.kwargs, job.max_attempts) for job in jobs], [('jobs.tests.record', {'source': 'tick'}, 1)])
+        # Not due again for a minute
+        self.assertEqual(queue.enqueue_due_schedules(), [])
+
+    def test_runs_do_not_overlap(self):
+        queue.sync_schedules()
+        queue.enqueue_due_schedules()
+        Schedule.objects.update(next_run_at=timezone.now())
+        # The first run is still queued
+        self.assertEqual(queue.enqueue_due_schedules(), [])
+        self.assertEqual(Job.objects.count(), 1)
+
+
+class JobQueryPlanTests(QueryRegressionTestCase):
+    def test_claim(self):
+        self.assertQueryPlan(
+            Job.objects.filter(status='queued', run_at__lte=timezone.now()).order_by('run_at').values_list('id')[:4],
+            [('SEARCH', 'jobs_job', 'jobs_job_status_f5c023_idx')],
+        )
+
+    def test_stalled(self):
+        self.assertQueryPlan(
+            Job.objects.filter(status='running', heartbeat_at__lt=timezone.now()),
+            [('SEARCH', 'jobs_job', 'jobs_job_status_f5c023_idx')],
+        )
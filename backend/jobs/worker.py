@@ -0,0 +1,96 @@
+"""
+The jobs worker: one process claiming due jobs into a thread pool.
+
+Threads suit the jobs this project runs, which mostly wait on the database
+or the mail server; `run_jobs --processes` starts several of these for CPU
+bound work. Each worker also enqueues due schedules and requeues stalled
+jobs every JOB_HOUSEKEEPING_SECONDS, and refreshes the heartbeat of the
+jobs it is running every JOB_HEARTBEAT_SECONDS.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, connections
+from . import queue
+
+logger = logging.getLogger(__name__)
+
+
+def _run_in_thread(job):
+    close_old_connections()
+    try:
+        return queue.run(job)
+    except Exception:
+        # Recording the outcome failed; the job is requeued once it stalls
+        logger.exception("Job %s %s could not be recorded", job.pk, job.task)
+        return False
+    finally:
+        connections.close_all()
+
+
+class Worker:
+    def __init__(self, threads=4, poll_interval=1.0, schedules=True):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.schedules = schedules
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self._wake = threading.Event()
+        self.running = set()
+        self.processed = 0
+        self._last_housekeeping = 0
+        self._last_heartbeat = 0
+
+    def stop(self, *args):
+        """Stop claiming jobs; the ones running are finished first"""
+        self.stopping.set()
+        self._wake.set()
+
+    def housekeeping(self):
+        self._last_housekeeping = time.monotonic()
+        if self.schedules:
+            queue.enqueue_due_schedules()
+        queue.requeue_stalled()
+
+    def _finished(self, future):
+        self.running.discard(future)
+        self.processed += 1
+        # Wake the loop so the free thread is filled straight away
+        self._wake.set()
+
+    def run(self, burst=False):
+        """
+        Claim and run jobs until stop() is called, or with burst=True until
+        no job is due and none is running. Returns the number of jobs run.
+        """
+        logger.info("Jobs worker %s started with %d threads", self.name, self.threads)
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='job') as executor:
+            while not self.stopping.is_set():
+                close_old_connections()
+                if self.running and time.monotonic() - self._last_heartbeat >= settings.JOB_HEARTBEAT_SECONDS:
+                    self._last_heartbeat = time.monotonic()
+                    queue.heartbeat(self.name)
+                if time.monotonic() - self._last_housekeeping >= settings.JOB_HOUSEKEEPING_SECONDS:
+                    self.housekeeping()
+
+                claimed = []
+                free = self.threads - len(self.running)
+                if free > 0:
+                    claimed = queue.claim(self.name, free)
+                    for job in claimed:
+                        future = executor.submit(_run_in_thread, job)
+                        self.running.add(future)
+                        future.add_done_callback(self._finished)
+
+                if burst and not claimed and not self.running:
+                    break
+                if not claimed or len(self.running) >= self.threads:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+        connections.close_all()
+        logger.info("Jobs worker %s stopped after %d jobs", self.name, self.processed)
+        return self.processed
@@ -1,8 +1,43 @@
-from django.contrib import admin
+from collections import defaultdict
+from decimal import Decimal
+from django.contrib import admin, messages
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.template.loader import render_to_string
 from django.urls import reverse
-from django.utils.html import format_html
+from django.utils.html import format_html, strip_tags
 from django.utils import timezone
-from .models import Transaction, Deposit, Withdrawal, InvestmentPlan, Investment
+from accounts.models import User
+from api.search import SearchIndexAdminMixin
+from backend.routers import ReplicaChangeListMixin, mark_user_write
+from api.authentication import invalidate_user_snapshots
+from api.mail import send_messages_async
+from . import rollups, wallets
+from .models import Transaction, ArchivedTransaction, Deposit, Withdrawal, InvestmentPlan, Investment
+
+def send_deposit_review_emails(deposits, new_status):
+    """Queue the approval / rejection emails for reviewed deposits as one job sent over one SMTP connection"""
+    template = 'transactions/deposit_approved_email.html' if new_status == 'successful' else 'transactions/deposit_failed_email.html'
+    subject = f"Deposit {new_status.capitalize()}"
+    
+    emails = []
+    for deposit in deposits:
+        transaction = deposit.transaction
+        html_message = render_to_string(template, {
+            'user': transaction.user,
+            'transaction': transaction,
+            'deposit': deposit,
+        })
+        emails.append({
+            'subject': subject,
+            'body': strip_tags(html_message),
+            'from_email': settings.DEFAULT_FROM_EMAIL,
+            'to': [transaction.user.email],
+            'html': html_message,
+        })
+    if emails:
+        send_messages_async(emails, kind='deposit_review')
 
 class DepositInline(admin.StackedInline):
     model = Deposit
@@ -20,10 +55,16 @@ class InvestmentInline(admin.StackedInline):
     readonly_fields = ('transaction', 'start_date', 'end_date', 'total_returns', 'last_payout_date', 'next_payout_date')
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(ReplicaChangeListMixin, SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'type', 'amount', 'currency', 'status', 'date')
     list_filter = ('type', 'status', 'currency', 'date')
     search_fields = ('user__email', 'user__full_name', 'description')
+    search_index_lookups = {
+        'transaction': 'pk',
+        'user': 'user_id',
+        'deposit': 'deposit_details__pk',
+        'withdrawal': 'withdrawal_details__pk',
+    }
     readonly_fields = ('id', 'user', 'type', 'amount', 'currency', 'date')
     inlines = [DepositInline, WithdrawalInline, InvestmentInline]
     
@@ -40,11 +81,21 @@ class TransactionAdmin(admin.ModelAdmin):
         extra_context['pending_deposits_link'] = self.pending_deposits_link(request)
         return super().changelist_view(request, extra_context=extra_context)
 
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ('id', 'user', 'type', 'amount', 'currency', 'status', 'date', 'archived_at')
+    list_filter = ('type', 'status', 'currency')
+    search_fields = ('user__email', 'user__full_name', 'description')
+    readonly_fields = ('id', 'user', 'type', 'status', 'amount', 'currency', 'date', 'description',
+                       'deposit_details', 'withdrawal_details', 'archived_at')
+    list_select_related = ('user',)
+
 @admin.register(Deposit)
-class DepositAdmin(admin.ModelAdmin):
+class DepositAdmin(ReplicaChangeListMixin, SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ('transaction_id', 'user', 'amount', 'currency', 'status', 'wallet_address', 'date')
     list_filter = ('transaction__status', 'transaction__date')
     search_fields = ('transaction__user__email', 'transaction__user__full_name', 'wallet_address')
+    search_index_lookups = {'deposit': 'pk', 'user': 'transaction__user_id', 'transaction': 'transaction_id'}
     readonly_fields = ('transaction',)
     
     def transaction_id(self, obj):
@@ -73,47 +124,89 @@ class DepositAdmin(admin.ModelAdmin):
     actions = ['approve_deposits', 'reject_deposits']
     
     def approve_deposits(self, request, queryset):
-        for deposit in queryset:
-            transaction = deposit.transaction
-            if transaction.status == 'pending':
-                # Update transaction status
-                transaction.status = 'successful'
-                transaction.save()
-                
-                # Update user balance
-                user = transaction.user
-                user.balance += transaction.amount
-                user.save()
-                
-                # Update deposit review info
-                deposit.reviewed_by = request.user
-                deposit.reviewed_at = timezone.now()
-                deposit.save()
-        
-        self.message_user(request, f"Successfully approved {queryset.count()} deposits")
+        approved, skipped = self.review_pending_deposits(request, queryset, 'successful')
+        self.report_review(request, 'approved', approved, skipped)
     approve_deposits.short_description = "Approve selected deposits and update balances"
     
     def reject_deposits(self, request, queryset):
-        for deposit in queryset:
-            transaction = deposit.transaction
-            if transaction.status == 'pending':
-                # Update transaction status
-                transaction.status = 'failed'
-                transaction.save()
-                
-                # Update deposit review info
+        rejected, skipped = self.review_pending_deposits(request, queryset, 'failed')
+        self.report_review(request, 'rejected', rejected, skipped)
+    reject_deposits.short_description = "Reject selected deposits"
+    
+    def review_pending_deposits(self, request, queryset, new_status):
+        """
+        Approve or reject the pending deposits in the queryset as one set-based update.
+        Returns (processed deposits, ids of selected deposits that were not pending).
+        """
+        selected_ids = set(queryset.values_list('pk', flat=True))
+        now = timezone.now()
+        
+        with db_transaction.atomic():
+            # Lock the selected rows that are still pending so concurrent
+            # reviews cannot credit the same deposit twice
+            deposits = list(
+                Deposit.objects.select_for_update()
+                .filter(pk__in=selected_ids, transaction__status='pending')
+                .select_related('transaction', 'transaction__user')
+            )
+            
+            credits = defaultdict(Decimal)
+            for deposit in deposits:
+                deposit.transaction.status = new_status
                 deposit.reviewed_by = request.user
-                deposit.reviewed_at = timezone.now()
-                deposit.save()
+                deposit.reviewed_at = now
+                credits[deposit.transaction.user_id] += deposit.transaction.amount
+            
+            # One UPDATE per user, however many deposits they have
+            if new_status == 'successful':
+                for user_id, amount in credits.items():
+                    User.objects.filter(pk=user_id).update(balance=F('balance') + amount)
+            
+            Transaction.objects.bulk_update([deposit.transaction for deposit in deposits], ['status'])
+            Deposit.objects.bulk_update(deposits, ['reviewed_by', 'reviewed_at'])
+            
+            # Bulk updates skip post_save, so pin the owners to the primary,
+            # drop their cached auth snapshots and update the dashboard rollups here
+            for user_id in credits:
+                mark_user_write(user_id)
+            invalidate_user_snapshots(credits)
+            db_transaction.on_commit(lambda: invalidate_user_snapshots(credits))
+            reviewed_total = sum(credits.values(), Decimal('0'))
+            deltas = {rollups.PENDING_DEPOSITS: (-len(deposits), -reviewed_total, Decimal('0'))}
+            if new_status == 'successful':
+                deltas[rollups.USER_BALANCES] = (0, reviewed_total, Decimal('0'))
+            rollups.apply_deltas(deltas)
+            # Pending deposits had not moved any money, so their wallets
+            # change by the whole effect of the new status
+            wallet_deltas = defaultdict(int)
+            for deposit in deposits:
+                for key, minor in wallets.effect(wallets.current_values(deposit.transaction)).items():
+                    wallet_deltas[key] += minor
+            wallets.apply(wallet_deltas)
+            
+            # Queued with the review, so the emails only go out if it commits
+            send_deposit_review_emails(deposits, new_status)
         
-        self.message_user(request, f"Successfully rejected {queryset.count()} deposits")
-    reject_deposits.short_description = "Reject selected deposits"
+        processed_ids = {deposit.pk for deposit in deposits}
+        return deposits, sorted(selected_ids - processed_ids)
+    
+    def report_review(self, request, verb, processed, skipped):
+        if processed:
+            ids = ', '.join(str(deposit.transaction_id) for deposit in processed)
+            self.message_user(request, f"Successfully {verb} {len(processed)} deposits: {ids}", messages.SUCCESS)
+        if skipped:
+            self.message_user(
+                request,
+                f"Skipped {len(skipped)} deposits that were no longer pending (deposit ids: {', '.join(map(str, skipped))})",
+                messages.WARNING,
+            )
 
 @admin.register(Withdrawal)
-class WithdrawalAdmin(admin.ModelAdmin):
+class WithdrawalAdmin(ReplicaChangeListMixin, SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ('transaction_id', 'user', 'amount', 'currency', 'withdrawal_address', 'withdrawal_method', 'date')
     list_filter = ('withdrawal_method', 'transaction__date')
     search_fields = ('transaction__user__email', 'transaction__user__full_name', 'withdrawal_address')
+    search_index_lookups = {'withdrawal': 'pk', 'user': 'transaction__user_id', 'transaction': 'transaction_id'}
     readonly_fields = ('transaction',)
     
     def transaction_id(self, obj):
@@ -142,11 +235,16 @@ class InvestmentPlanAdmin(admin.ModelAdmin):
     search_fields = ('tier', 'level')
 
 @admin.register(Investment)
-class InvestmentAdmin(admin.ModelAdmin):
+class InvestmentAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ('user', 'plan', 'amount', 'currency', 'status', 'start_date', 'end_date', 'total_returns', 'progress')
     list_filter = ('status', 'plan__tier', 'plan__level', 'currency')
     search_fields = ('user__email', 'user__full_name')
     readonly_fields = ('transaction', 'start_date', 'progress')
+    list_select_related = ('user', 'plan')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_progress()
     
     def progress(self, obj):
-        return f"{obj.calculate_progress():.2f}%"
+        return f"{obj.progress_value:.2f}%"
+    progress.admin_order_field = 'progress_value'
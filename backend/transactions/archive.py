@@ -0,0 +1,134 @@
+"""
+Cold storage for settled transactions.
+
+`archive_settled_transactions` moves old successful/failed transactions and
+their Deposit / Withdrawal details into `ArchivedTransaction` in chunks. The
+read helpers below serve both tiers so callers never need to know where a
+transaction lives.
+"""
+import heapq
+from operator import itemgetter
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from . import rollups
+from .models import Transaction, ArchivedTransaction
+from .serializers import TransactionSerializer, ArchivedTransactionSerializer
+
+SETTLED_STATUSES = ('successful', 'failed')
+
+
+def archivable_transactions(older_than):
+    """Settled transactions older than the cutoff that nothing else points at"""
+    return Transaction.objects.filter(
+        status__in=SETTLED_STATUSES,
+        date__lt=older_than,
+        # Investments cascade from their transaction and signal purchases
+        # link to it, so those stay in the live table
+        investment_details__isnull=True,
+        signalpurchasehistory__isnull=True,
+    )
+
+
+def _deposit_snapshot(deposit):
+    return {
+        'wallet_address': deposit.wallet_address,
+        'wallet_network': deposit.wallet_network,
+        'admin_notes': deposit.admin_notes,
+        'reviewed_by_id': deposit.reviewed_by_id,
+        'reviewed_at': deposit.reviewed_at.isoformat() if deposit.reviewed_at else None,
+    }
+
+
+def _withdrawal_snapshot(withdrawal):
+    return {
+        'withdrawal_address': withdrawal.withdrawal_address,
+        'withdrawal_network': withdrawal.withdrawal_network,
+        'withdrawal_method': withdrawal.withdrawal_method,
+        'processed_by_id': withdrawal.processed_by_id,
+    }
+
+
+def _to_archive(tx):
+    deposit = getattr(tx, 'deposit_details', None)
+    withdrawal = getattr(tx, 'withdrawal_details', None)
+    return ArchivedTransaction(
+        id=tx.id,
+        user_id=tx.user_id,
+        type=tx.type,
+        status=tx.status,
+        amount=tx.amount,
+        currency=tx.currency,
+        date=tx.date,
+        description=tx.description,
+        deposit_details=_deposit_snapshot(deposit) if deposit else None,
+        withdrawal_details=_withdrawal_snapshot(withdrawal) if withdrawal else None,
+    )
+
+
+def archive_settled_transactions(older_than_days=None, chunk_size=None):
+    """Move settled transactions into the archive, returning how many moved"""
+    if older_than_days is None:
+        older_than_days = settings.TRANSACTION_ARCHIVE_AFTER_DAYS
+    if chunk_size is None:
+        chunk_size = settings.TRANSACTION_ARCHIVE_CHUNK_SIZE
+    cutoff = timezone.now() - timezone.timedelta(days=older_than_days)
+
+    moved = 0
+    while True:
+        # One short write transaction per chunk keeps the writer lock brief
+        with db_transaction.atomic():
+            batch = list(
+                archivable_transactions(cutoff)
+                .select_related('deposit_details', 'withdrawal_details')
+                .order_by('date')[:chunk_size]
+            )
+            if not batch:
+                break
+            ArchivedTransaction.objects.bulk_create([_to_archive(tx) for tx in batch])
+            # Deposit and Withdrawal rows cascade with their transaction
+            Transaction.objects.filter(pk__in=[tx.pk for tx in batch]).delete()
+            # The deletes took their signal revenue off the dashboard, but the
+            # archive still counts it
+            revenue = [tx.amount for tx in batch if tx.type == 'signal_purchase' and tx.status == 'successful']
+            if revenue:
+                rollups.apply_deltas({rollups.SIGNAL_REVENUE: (len(revenue), sum(revenue, rollups.ZERO), rollups.ZERO)})
+        moved += len(batch)
+    return moved
+
+
+def get_user_transaction_history(user, transaction_type=None, status_filter=None):
+    """Serialized transactions for a user across the live and archive tables, newest first"""
+    live = Transaction.objects.filter(user=user).select_related('deposit_details', 'withdrawal_details')
+    archived = ArchivedTransaction.objects.filter(user=user)
+    if transaction_type:
+        live = live.filter(type=transaction_type)
+        archived = archived.filter(type=transaction_type)
+    if status_filter:
+        live = live.filter(status=status_filter)
+        archived = archived.filter(status=status_filter)
+
+    live = list(live)
+    archived = list(archived)
+    merged = heapq.merge(
+        zip([tx.date for tx in live], TransactionSerializer(live, many=True).data),
+        zip([tx.date for tx in archived], ArchivedTransactionSerializer(archived, many=True).data),
+        key=itemgetter(0),
+        reverse=True,
+    )
+    return [data for _, data in merged]
+
+
+def get_user_transaction(user, transaction_id):
+    """Serialized transaction from either tier, or None if the user has no such transaction"""
+    tx = (
+        Transaction.objects.filter(id=transaction_id, user=user)
+        .select_related('deposit_details', 'withdrawal_details')
+        .first()
+    )
+    if tx is not None:
+        return TransactionSerializer(tx).data
+    archived = ArchivedTransaction.objects.filter(id=transaction_id, user=user).first()
+    if archived is not None:
+        return ArchivedTransactionSerializer(archived).data
+    return None
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from transactions.archive import archive_settled_transactions, archivable_transactions
+
+class Command(BaseCommand):
+    help = 'Move settled transactions older than the archive age into cold storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TRANSACTION_ARCHIVE_AFTER_DAYS,
+                            help='Archive settled transactions older than this many days')
+        parser.add_argument('--chunk-size', type=int, default=settings.TRANSACTION_ARCHIVE_CHUNK_SIZE,
+                            help='Rows moved per database transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count eligible transactions')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            cutoff = timezone.now() - timezone.timedelta(days=options['days'])
+            count = archivable_transactions(cutoff).count()
+            self.stdout.write(f'{count} transactions would be archived')
+            return
+
+        moved = archive_settled_transactions(options['days'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully archived {moved} transactions'))
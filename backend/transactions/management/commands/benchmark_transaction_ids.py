@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from transactions.models import uuid7
+
+# Mirrors the transactions_transaction table Django creates on SQLite
+TABLE_SQL = '''
+CREATE TABLE transactions_transaction (
+    id char(32) NOT NULL PRIMARY KEY,
+    type varchar(20) NOT NULL,
+    status varchar(20) NOT NULL,
+    amount decimal NOT NULL,
+    currency varchar(10) NOT NULL,
+    date datetime NOT NULL,
+    description text NULL,
+    user_id bigint NOT NULL
+)
+'''
+INSERT_SQL = 'INSERT INTO transactions_transaction VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+
+class Command(BaseCommand):
+    help = 'Compare insert throughput and primary-key index size for uuid4 and uuid7 transaction ids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--existing', type=int, default=200000, help='Rows already in the table before the payout runs')
+        parser.add_argument('--runs', type=int, default=20, help='Number of payout runs to time')
+        parser.add_argument('--batch', type=int, default=5000, help='Transactions inserted per payout run')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['existing']} existing rows, {options['runs']} payout runs of {options['batch']} inserts\n"
+        )
+        self.stdout.write(f"{'generator':<10}{'rows/sec':>12}{'index KiB':>12}{'index pages':>13}{'avg fill':>10}")
+        for name, generator in (('uuid4', uuid.uuid4), ('uuid7', uuid7)):
+            rate, index_bytes, pages, fill = self.run_benchmark(generator, **options)
+            self.stdout.write(f"{name:<10}{rate:>12,.0f}{index_bytes / 1024:>12,.0f}{pages:>13,}{fill:>10.0%}")
+
+    def run_benchmark(self, generator, existing, runs, batch, **options):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = sqlite3.connect(os.path.join(tmp_dir, 'bench.sqlite3'), isolation_level=None)
+            db.execute(TABLE_SQL)
+
+            def rows(count):
+                now = time.strftime('%Y-%m-%d %H:%M:%S')
+                for i in range(count):
+                    yield (generator().hex, 'investment_return', 'successful', '12.50000000', 'USDT', now, None, i % 1000)
+
+            db.execute('BEGIN')
+            db.executemany(INSERT_SQL, rows(existing))
+            db.execute('COMMIT')
+
+            # Each payout run inserts its transactions in one database transaction
+            elapsed = 0.0
+            for _ in range(runs):
+                batch_rows = list(rows(batch))
+                start = time.perf_counter()
+                db.execute('BEGIN')
+                db.executemany(INSERT_SQL, batch_rows)
+                db.execute('COMMIT')
+                elapsed += time.perf_counter() - start
+
+            # The uuid primary key lives in SQLite's automatic unique index
+            index_bytes, pages, unused = db.execute(
+                "SELECT SUM(pgsize), COUNT(*), SUM(unused) FROM dbstat "
+                "WHERE name LIKE 'sqlite_autoindex_transactions_transaction%'"
+            ).fetchone()
+            db.close()
+
+        return runs * batch / elapsed, index_bytes, pages, 1 - unused / index_bytes
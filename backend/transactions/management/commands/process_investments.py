@@ -1,19 +1,29 @@
+import logging
+import time
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from api import metrics
 from transactions.models import Investment
 
+logger = logging.getLogger(__name__)
+
 class Command(BaseCommand):
     help = 'Process all active investments to calculate returns'
 
     def handle(self, *args, **options):
+        start = time.perf_counter()
+        
         # Get all ongoing investments
-        active_investments = Investment.objects.filter(status__in=['ongoing', 'halfway'])
-        print(f"Found {active_investments.count()} active investments")
+        active_investments = Investment.objects.filter(status__in=['ongoing', 'halfway']).select_related('user', 'plan')
+        logger.info("Found %d active investments", active_investments.count())
         
         processed_count = 0
         for investment in active_investments:
-            print(f"Processing investment {investment.id}")
+            logger.debug("Processing investment %s", investment.id)
             if investment.process_payout():
                 processed_count += 1
         
-        self.stdout.write(self.style.SUCCESS(f'Successfully processed {processed_count} investments')) 
\ No newline at end of file
+        metrics.investment_payouts.inc(processed_count)
+        metrics.investment_run_duration.observe(time.perf_counter() - start)
+        metrics.investment_last_run.set(timezone.now().timestamp())
+        self.stdout.write(self.style.SUCCESS(f'Successfully processed {processed_count} investments'))
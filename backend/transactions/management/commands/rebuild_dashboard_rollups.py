@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from transactions.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard rollup tables from the transaction, investment and user tables'
+
+    def handle(self, *args, **options):
+        counters = rebuild_rollups()
+        for key, (count, total) in counters.items():
+            self.stdout.write(f"{key}: {count} rows, total {total}")
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt dashboard rollups'))
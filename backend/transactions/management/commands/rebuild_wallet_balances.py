@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from transactions.wallets import rebuild_wallet_balances
+
+class Command(BaseCommand):
+    help = 'Recompute the per-currency wallet balances from the live and archived transactions'
+
+    def handle(self, *args, **options):
+        count = rebuild_wallet_balances()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {count} wallet balances'))
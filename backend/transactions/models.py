@@ -1,15 +1,53 @@
 from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, Q, Value, When
+from django.db.models.functions import Cast, Least, Round
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from backend.mixins import LoadedValuesMixin
+from .money import Money, minor_units_field
 import uuid
 import math
+import os
+import threading
+import time
 from django.utils import timezone
-from decimal import Decimal
 from django.db import transaction
 from django.template.loader import render_to_string
 from django.core.mail import send_mail
 from django.utils.html import strip_tags
 
-class Transaction(models.Model):
+_uuid7_lock = threading.Lock()
+_uuid7_last_ms = 0
+_uuid7_seq = 0
+
+def uuid7():
+    """
+    Time-ordered UUID (RFC 9562 version 7).
+
+    The leading 48 bits are the Unix time in milliseconds, so new rows append
+    to the end of the primary-key index instead of landing at random pages.
+    The 12-bit rand_a field is used as a counter to keep ids generated in the
+    same millisecond monotonic within the process.
+    """
+    global _uuid7_last_ms, _uuid7_seq
+    with _uuid7_lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _uuid7_last_ms:
+            # Start low in the counter space to leave room for a burst
+            _uuid7_seq = int.from_bytes(os.urandom(2), 'big') & 0x3FF
+            _uuid7_last_ms = ms
+        else:
+            _uuid7_seq += 1
+            if _uuid7_seq > 0xFFF:
+                # Counter exhausted, borrow the next millisecond
+                _uuid7_last_ms += 1
+                _uuid7_seq = 0
+        ms, seq = _uuid7_last_ms, _uuid7_seq
+    rand_b = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (ms & ((1 << 48) - 1)) << 80 | 0x7 << 76 | seq << 64 | 0b10 << 62 | rand_b
+    return uuid.UUID(int=value)
+
+class Transaction(LoadedValuesMixin, models.Model):
     TRANSACTION_TYPES = (
         ('deposit', 'Deposit'),
         ('withdrawal', 'Withdrawal'),
@@ -24,22 +62,57 @@ class Transaction(models.Model):
         ('failed', 'Failed'),
     )
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transactions', default=1)
     type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     amount = models.DecimalField(max_digits=18, decimal_places=8)
     currency = models.CharField(max_length=10)  # BTC, ETH, USDT, etc.
+    amount_minor = minor_units_field('amount', 'currency')
     date = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True, null=True)
     
     class Meta:
         ordering = ['-date']
+        indexes = [
+            # User history, newest first
+            models.Index(fields=['user', '-date']),
+            # Pending deposit queues and rollup rebuilds
+            models.Index(fields=['type', 'status']),
+            # Archiving settled transactions oldest first
+            models.Index(fields=['status', 'date']),
+        ]
     
     def __str__(self):
         return f"{self.type.capitalize()} of {self.amount} {self.currency} - {self.status.capitalize()}"
 
 
+class ArchivedTransaction(models.Model):
+    """Settled transaction moved out of the live table by `archive_transactions`"""
+    id = models.UUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_transactions')
+    type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(max_length=20, choices=Transaction.STATUS_CHOICES)
+    amount = models.DecimalField(max_digits=18, decimal_places=8)
+    currency = models.CharField(max_length=10)
+    amount_minor = minor_units_field('amount', 'currency')
+    date = models.DateTimeField()
+    description = models.TextField(blank=True, null=True)
+    # Snapshot of the Deposit / Withdrawal row that was archived with it
+    deposit_details = models.JSONField(blank=True, null=True)
+    withdrawal_details = models.JSONField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['user', '-date']),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.type} of {self.amount} {self.currency} - {self.status.capitalize()}"
+
+
 class Deposit(models.Model):
     transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name='deposit_details')
     wallet_address = models.CharField(max_length=255)
@@ -109,7 +182,35 @@ class InvestmentPlan(models.Model):
         return f"{self.tier.capitalize()} {self.level.capitalize()} Plan"
 
 
-class Investment(models.Model):
+class InvestmentQuerySet(models.QuerySet):
+    def with_progress(self, now=None):
+        """
+        Annotate progress_value, daily_return_minor and signal_ok in SQL,
+        mirroring calculate_progress() and calculate_daily_return() so list
+        views do not have to touch user and plan for every row.
+        """
+        now = Value(now or timezone.now(), output_field=models.DateTimeField())
+        elapsed = ExpressionWrapper(now - F('start_date'), output_field=models.DurationField())
+        total = ExpressionWrapper(F('end_date') - F('start_date'), output_field=models.DurationField())
+        percent = Cast(elapsed, models.FloatField()) * 100 / Cast(total, models.FloatField())
+        return self.annotate(
+            signal_ok=ExpressionWrapper(Q(user__signal_strength__gte=3), output_field=models.BooleanField()),
+            progress_value=Case(
+                When(status='completed', then=Value(100)),
+                When(signal_ok=False, then=Value(0)),
+                When(end_date__lte=now, then=Value(100)),
+                # Cap at 99.99% until officially completed
+                default=Least(Round(percent, 2), Value(99.99)),
+                output_field=models.FloatField(),
+            ),
+            # In minor units of the investment's currency
+            daily_return_minor=Cast(
+                Round(F('amount_minor') * F('plan__daily_roi') / Value(100)), models.BigIntegerField()
+            ),
+        )
+
+
+class Investment(LoadedValuesMixin, models.Model):
     STATUS_CHOICES = (
         ('ongoing', 'Ongoing'),
         ('halfway', 'Halfway'),
@@ -122,6 +223,7 @@ class Investment(models.Model):
     transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name='investment_details')
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     currency = models.CharField(max_length=10, default='USDT')
+    amount_minor = minor_units_field('amount', 'currency')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ongoing')
     start_date = models.DateTimeField(auto_now_add=True)
     end_date = models.DateTimeField()
@@ -129,6 +231,14 @@ class Investment(models.Model):
     last_payout_date = models.DateTimeField(null=True, blank=True)
     next_payout_date = models.DateTimeField(null=True, blank=True)
     
+    objects = InvestmentQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Payout runs and maturity rollups over active investments
+            models.Index(fields=['status', 'end_date']),
+        ]
+    
     def __str__(self):
         return f"{self.user.email} - {self.plan} - {self.amount} {self.currency}"
     
@@ -165,8 +275,7 @@ class Investment(models.Model):
     
     def calculate_daily_return(self):
         """Calculate the daily return amount based on investment and ROI"""
-        daily_return = (self.amount * self.plan.daily_roi) / Decimal('100.0')
-        return daily_return.quantize(Decimal('0.01'))
+        return Money.of(self.amount, self.currency).percent(self.plan.daily_roi).amount
     
     def process_payout(self):
         """Process investment payout based on daily ROI and duration"""
@@ -190,14 +299,19 @@ class Investment(models.Model):
         # Check if investment period has ended
         if now >= self.end_date:
             # Calculate total return including principal
-            daily_roi_decimal = self.plan.daily_roi / Decimal('100.00')
-            total_days = self.plan.duration
-            total_return = self.amount + (self.amount * daily_roi_decimal * total_days)
+            principal = Money.of(self.amount, self.currency)
+            total_return = (principal + principal.percent(self.plan.daily_roi * self.plan.duration)).amount
             
             # Return investment to user's balance
             with transaction.atomic():
-                self.user.balance += total_return
-                self.user.save()
+                # A concurrent run may have paid this investment out since
+                # it was loaded, so check again on the locked row
+                if not Investment.objects.select_for_update().filter(pk=self.pk, status='ongoing').exists():
+                    return False
+                user = get_user_model().objects.select_for_update().get(pk=self.user_id)
+                user.balance += total_return
+                user.save()
+                self.user = user
                 
                 # Create transaction record for completed investment
                 Transaction.objects.create(
@@ -216,4 +330,44 @@ class Investment(models.Model):
             return True
         
         # Investment still ongoing, do nothing
-        return False
\ No newline at end of file
+        return False
+
+
+class DashboardCounter(models.Model):
+    """Running platform total behind the admin operations dashboard, maintained by transactions.rollups"""
+    key = models.CharField(max_length=50, primary_key=True)
+    count = models.BigIntegerField(default=0)
+    total = models.DecimalField(max_digits=24, decimal_places=8, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.key}: {self.count} / {self.total}"
+
+
+class MaturityBucket(models.Model):
+    """Ongoing investments grouped by the day they mature, maintained by transactions.rollups"""
+    date = models.DateField(primary_key=True)
+    count = models.BigIntegerField(default=0)
+    principal = models.DecimalField(max_digits=24, decimal_places=8, default=0)
+    payout = models.DecimalField(max_digits=24, decimal_places=8, default=0)
+    
+    def __str__(self):
+        return f"{self.date}: {self.count} investments, {self.payout} due"
+
+
+class WalletBalance(models.Model):
+    """A user's holdings in one currency, maintained from their transactions by transactions.wallets"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='wallet_balances')
+    currency = models.CharField(max_length=10)
+    amount_minor = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('user', 'currency')
+    
+    @property
+    def money(self):
+        return Money(self.amount_minor, self.currency)
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.money}"
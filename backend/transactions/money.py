@@ -0,0 +1,171 @@
+"""
+Money as an integer count of a currency's minor units.
+
+Every currency has one fixed exponent (cents for USD, satoshis for BTC), so
+amounts add, subtract and compare as plain integers and the database can
+SUM them exactly. The API refuses amounts finer than their currency's minor
+unit (see `fits`), so the minor units always hold the exact amount. The decimal columns stay the values the API reads and
+writes; each has a generated `*_minor` column next to it (see
+`minor_units_field`) that the database keeps in step on every insert and
+update, including F() updates, and that aggregations and rollups sum.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+from django.db import models
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import Cast, Round
+
+# Decimal places of each currency's minor unit. Crypto assets are capped at
+# 8 places, the precision Transaction.amount stores.
+CURRENCY_EXPONENTS = {
+    'USD': 2,
+    'EUR': 2,
+    'GBP': 2,
+    'USDT': 2,
+    'USDC': 2,
+    'BTC': 8,
+    'ETH': 8,
+}
+DEFAULT_EXPONENT = 8
+
+# User.balance has no currency column of its own
+BALANCE_CURRENCY = 'USD'
+
+
+def exponent(currency):
+    return CURRENCY_EXPONENTS.get(currency, DEFAULT_EXPONENT)
+
+
+def fits(amount, currency):
+    """Whether `amount` is a whole number of the currency's minor units"""
+    return Decimal(amount).scaleb(exponent(currency)) % 1 == 0
+
+
+def _divide(numerator, denominator):
+    """Integer division rounding half to even, like Decimal.quantize"""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = remainder * 2
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+class Money:
+    __slots__ = ('minor', 'currency')
+
+    def __init__(self, minor, currency):
+        self.minor = int(minor)
+        self.currency = currency
+
+    @classmethod
+    def of(cls, amount, currency):
+        """Money for a decimal amount, rounded to the currency's minor unit"""
+        places = exponent(currency)
+        minor = Decimal(amount).scaleb(places).quantize(Decimal(1), rounding=ROUND_HALF_EVEN)
+        return cls(minor, currency)
+
+    @classmethod
+    def zero(cls, currency):
+        return cls(0, currency)
+
+    @property
+    def amount(self):
+        """The amount as a Decimal with the currency's number of places"""
+        return Decimal(self.minor).scaleb(-exponent(self.currency))
+
+    def _check(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        if other.currency != self.currency:
+            raise ValueError(f'Cannot combine {self.currency} and {other.currency}')
+        return other.minor
+
+    def __add__(self, other):
+        minor = self._check(other)
+        return NotImplemented if minor is NotImplemented else Money(self.minor + minor, self.currency)
+
+    def __sub__(self, other):
+        minor = self._check(other)
+        return NotImplemented if minor is NotImplemented else Money(self.minor - minor, self.currency)
+
+    def __neg__(self):
+        return Money(-self.minor, self.currency)
+
+    def __mul__(self, factor):
+        """Multiply by an int exactly or by a Decimal, rounding to the minor unit"""
+        if isinstance(factor, int):
+            return Money(self.minor * factor, self.currency)
+        if isinstance(factor, Decimal):
+            numerator, denominator = factor.as_integer_ratio()
+            return Money(_divide(self.minor * numerator, denominator), self.currency)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def percent(self, rate):
+        """`rate` percent of this amount, e.g. a daily ROI of Decimal('2.80'), rounded once"""
+        numerator, denominator = Decimal(rate).as_integer_ratio()
+        return Money(_divide(self.minor * numerator, denominator * 100), self.currency)
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and (self.minor, self.currency) == (other.minor, other.currency)
+
+    def __lt__(self, other):
+        return self.minor < self._check(other)
+
+    def __le__(self, other):
+        return self.minor <= self._check(other)
+
+    def __gt__(self, other):
+        return self.minor > self._check(other)
+
+    def __ge__(self, other):
+        return self.minor >= self._check(other)
+
+    def __hash__(self):
+        return hash((self.minor, self.currency))
+
+    def __bool__(self):
+        return self.minor != 0
+
+    def __repr__(self):
+        return f'Money({self.amount}, {self.currency!r})'
+
+    def __str__(self):
+        return f'{self.amount} {self.currency}'
+
+
+def minor_units(amount_field, currency_field=None, currency=None):
+    """
+    Expression converting a decimal column to minor units, with the scale
+    picked by the row's currency column or fixed to `currency`.
+    """
+    if currency_field is None:
+        scale = Value(10 ** exponent(currency))
+    else:
+        scale = Case(
+            *[When(**{currency_field: code}, then=Value(10 ** places)) for code, places in CURRENCY_EXPONENTS.items()],
+            default=Value(10 ** DEFAULT_EXPONENT),
+        )
+    return Cast(Round(F(amount_field) * scale), models.BigIntegerField())
+
+
+def minor_units_field(amount_field, currency_field=None, currency=None):
+    """A stored generated column holding `amount_field` in minor units"""
+    return models.GeneratedField(
+        expression=minor_units(amount_field, currency_field, currency),
+        output_field=models.BigIntegerField(),
+        db_persist=True,
+    )
+
+
+def totals(queryset, minor_field, currency_field='currency', currency=None):
+    """
+    Sum a minor-units column as integers in one grouped query. Returns
+    (row count, {currency: Money}); pass `currency` for tables without a
+    currency column.
+    """
+    if currency_field is None:
+        row = queryset.aggregate(count=Count('pk'), total=Sum(minor_field))
+        return row['count'], ({currency: Money(row['total'], currency)} if row['count'] else {})
+    rows = queryset.order_by().values_list(currency_field).annotate(count=Count('pk'), total=Sum(minor_field))
+    return sum(count for _, count, _ in rows), {code: Money(total, code) for code, _, total in rows}
@@ -0,0 +1,82 @@
+"""
+Exchange rates for valuing wallet balances.
+
+A rate provider returns the price of one unit of each currency in its base
+currency. EXCHANGE_RATE_PROVIDER names the provider class; the default
+reads a JSON file, a local stand-in for a market data feed. Each process
+keeps the last rates it fetched for EXCHANGE_RATE_TTL seconds, so valuing a
+balance does not call the provider, and keeps serving them if a refresh
+fails.
+"""
+import json
+import logging
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class RateProvider:
+    def fetch(self):
+        """(base currency, {currency: Decimal price in the base currency})"""
+        raise NotImplementedError
+
+
+class FileRateProvider(RateProvider):
+    """
+    Rates from a JSON file of the form
+    {"base": "USD", "rates": {"BTC": "65000.00", ...}}.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.EXCHANGE_RATES_FILE
+
+    def fetch(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        rates = {currency: Decimal(str(rate)) for currency, rate in data['rates'].items()}
+        rates[data['base']] = Decimal('1')
+        return data['base'], rates
+
+
+class RateCache:
+    """Process-wide rates from the configured provider, refetched once they are EXCHANGE_RATE_TTL old"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._provider = None
+        self._rates = None
+        self._fetched = 0.0
+
+    def _fetch(self, now):
+        if self._provider is None:
+            self._provider = import_string(settings.EXCHANGE_RATE_PROVIDER)()
+        try:
+            self._rates = self._provider.fetch()
+        except Exception:
+            if self._rates is None:
+                raise
+            logger.warning("Could not refresh exchange rates, keeping the cached ones", exc_info=True)
+        self._fetched = now
+
+    def current(self):
+        """(base currency, {currency: rate})"""
+        now = time.monotonic()
+        if self._rates is None or now - self._fetched >= settings.EXCHANGE_RATE_TTL:
+            with self._lock:
+                # Another thread may have refreshed while this one waited
+                if self._rates is None or now - self._fetched >= settings.EXCHANGE_RATE_TTL:
+                    self._fetch(now)
+        return self._rates
+
+    def reset(self):
+        with self._lock:
+            self._provider = None
+            self._rates = None
+            self._fetched = 0.0
+
+
+rates = RateCache()
@@ -0,0 +1,201 @@
+"""
+Incrementally maintained totals for the admin operations dashboard.
+
+Every tracked row contributes to one or more rollups depending on its state
+(a pending deposit adds to `pending_deposits`, an ongoing investment adds to
+`locked_principal` and to the maturity bucket of its end date, ...). On save
+the contributions of the loaded state are diffed against the new state and
+only the difference is applied with F() updates, so the dashboard never has to
+aggregate the big tables. `rebuild_rollups` recomputes everything from scratch.
+
+The diff is taken against the state the instance was loaded with, not the row
+as it is when saved. If two processes save their own stale copies of the same
+row at once, both deltas are applied and the totals drift until the daily
+`rebuild_rollups` job puts them right again.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import TruncDate
+from accounts.models import User
+from . import money
+from .models import Transaction, ArchivedTransaction, Investment, DashboardCounter, MaturityBucket
+
+PENDING_DEPOSITS = 'pending_deposits'
+USER_BALANCES = 'user_balances'
+LOCKED_PRINCIPAL = 'locked_principal'
+SIGNAL_REVENUE = 'signal_revenue'
+COUNTER_KEYS = (PENDING_DEPOSITS, USER_BALANCES, LOCKED_PRINCIPAL, SIGNAL_REVENUE)
+
+LOCKED_INVESTMENT_STATUSES = ('ongoing', 'halfway')
+
+# Fields each model's contributions depend on
+TRACKED_FIELDS = {
+    Transaction: ('type', 'status', 'amount'),
+    Investment: ('status', 'amount', 'end_date', 'plan_id'),
+    User: ('balance',),
+}
+
+ZERO = Decimal('0')
+
+
+def expected_payout(amount, plan):
+    """Principal plus returns paid when an investment completes, as in Investment.process_payout"""
+    return amount + amount * (plan.daily_roi / Decimal('100.00')) * plan.duration
+
+
+def _contributions(model, values, plan=None):
+    """
+    Map of rollup -> (count, total, payout) for a row in the given state.
+    Counter rollups are keyed by name, maturity buckets by ('maturity', date).
+    """
+    if values is None:
+        return {}
+
+    if model is User:
+        return {USER_BALANCES: (1, Decimal(values['balance'] or 0), ZERO)}
+
+    amount = Decimal(values['amount'])
+    if model is Transaction:
+        if values['type'] == 'deposit' and values['status'] == 'pending':
+            return {PENDING_DEPOSITS: (1, amount, ZERO)}
+        if values['type'] == 'signal_purchase' and values['status'] == 'successful':
+            return {SIGNAL_REVENUE: (1, amount, ZERO)}
+        return {}
+
+    if model is Investment:
+        if values['status'] not in LOCKED_INVESTMENT_STATUSES:
+            return {}
+        return {
+            LOCKED_PRINCIPAL: (1, amount, ZERO),
+            ('maturity', values['end_date'].date()): (1, amount, expected_payout(amount, plan)),
+        }
+
+
+def _current_values(instance):
+    return {name: getattr(instance, name) for name in TRACKED_FIELDS[type(instance)]}
+
+
+def _loaded_values(instance, created):
+    """The tracked values the row had before this save, or None for a new row"""
+    if created:
+        return None
+    model = type(instance)
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(name in loaded for name in TRACKED_FIELDS[model]):
+        return {name: loaded[name] for name in TRACKED_FIELDS[model]}
+    # Instance was not loaded from the database (or with deferred fields).
+    # This only happens outside the normal request paths.
+    return model.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS[model]).first()
+
+
+def apply_deltas(deltas):
+    """Add (count, total, payout) deltas to the rollup rows with F() updates"""
+    for key, (count, total, payout) in deltas.items():
+        if not count and not total and not payout:
+            continue
+        if isinstance(key, tuple):
+            updated = MaturityBucket.objects.filter(date=key[1]).update(
+                count=F('count') + count, principal=F('principal') + total, payout=F('payout') + payout
+            )
+            if not updated:
+                MaturityBucket.objects.create(date=key[1], count=count, principal=total, payout=payout)
+            elif count < 0:
+                # A rebuild has no row for a day nothing matures on
+                MaturityBucket.objects.filter(date=key[1], count=0).delete()
+        else:
+            updated = DashboardCounter.objects.filter(key=key).update(
+                count=F('count') + count, total=F('total') + total
+            )
+            if not updated:
+                DashboardCounter.objects.create(key=key, count=count, total=total)
+
+
+def _diff(old, new):
+    deltas = defaultdict(lambda: (0, ZERO, ZERO))
+    for key, (count, total, payout) in new.items():
+        c, t, p = deltas[key]
+        deltas[key] = (c + count, t + total, p + payout)
+    for key, (count, total, payout) in old.items():
+        c, t, p = deltas[key]
+        deltas[key] = (c - count, t - total, p - payout)
+    return deltas
+
+
+def track_save(instance, created):
+    model = type(instance)
+    plan = instance.plan if model is Investment else None
+    old = _contributions(model, _loaded_values(instance, created), plan)
+    new = _contributions(model, _current_values(instance), plan)
+    if old != new:
+        apply_deltas(_diff(old, new))
+
+
+def track_delete(instance):
+    model = type(instance)
+    plan = instance.plan if model is Investment else None
+    old = _contributions(model, _loaded_values(instance, created=False) or _current_values(instance), plan)
+    apply_deltas(_diff(old, {}))
+
+
+def _totals(queryset, minor_field='amount_minor', **kwargs):
+    # Summed as integers per currency, then added up the way the incremental updates do
+    count, by_currency = money.totals(queryset, minor_field, **kwargs)
+    return count, sum((total.amount for total in by_currency.values()), ZERO)
+
+
+def rebuild_rollups():
+    """Recompute every rollup from the live tables (and the archive for revenue)"""
+    # Divide by a float: SQLite divides two whole-number decimals as integers,
+    # which would turn a 1% daily return into 0
+    payout = ExpressionWrapper(
+        F('amount') + F('amount') * F('plan__daily_roi') / Value(100.0) * F('plan__duration'),
+        output_field=DecimalField(max_digits=24, decimal_places=8),
+    )
+
+    # Aggregate and replace in one transaction so no concurrent change is lost
+    with db_transaction.atomic():
+        revenue_count, revenue_total = _totals(
+            Transaction.objects.filter(type='signal_purchase', status='successful')
+        )
+        archived_count, archived_total = _totals(
+            ArchivedTransaction.objects.filter(type='signal_purchase', status='successful')
+        )
+        counters = {
+            PENDING_DEPOSITS: _totals(Transaction.objects.filter(type='deposit', status='pending')),
+            USER_BALANCES: _totals(User.objects.all(), 'balance_minor', currency_field=None, currency=money.BALANCE_CURRENCY),
+            LOCKED_PRINCIPAL: _totals(Investment.objects.filter(status__in=LOCKED_INVESTMENT_STATUSES)),
+            SIGNAL_REVENUE: (revenue_count + archived_count, revenue_total + archived_total),
+        }
+        buckets = list(
+            Investment.objects.filter(status__in=LOCKED_INVESTMENT_STATUSES)
+            .annotate(day=TruncDate('end_date'))
+            .values('day')
+            .annotate(count=Count('pk'), principal=Sum('amount'), payout=Sum(payout))
+        )
+
+        DashboardCounter.objects.all().delete()
+        MaturityBucket.objects.all().delete()
+        DashboardCounter.objects.bulk_create([
+            DashboardCounter(key=key, count=count, total=total) for key, (count, total) in counters.items()
+        ])
+        MaturityBucket.objects.bulk_create([
+            MaturityBucket(date=row['day'], count=row['count'], principal=row['principal'], payout=row['payout'])
+            for row in buckets
+        ])
+    return counters
+
+
+def dashboard_snapshot(today):
+    """Everything the dashboard shows, read from the rollup tables"""
+    counters = {counter.key: counter for counter in DashboardCounter.objects.all()}
+    maturing = MaturityBucket.objects.filter(date=today).first()
+    empty = DashboardCounter(count=0, total=ZERO)
+    return {
+        'pending_deposits': counters.get(PENDING_DEPOSITS, empty),
+        'user_balances': counters.get(USER_BALANCES, empty),
+        'locked_principal': counters.get(LOCKED_PRINCIPAL, empty),
+        'signal_revenue': counters.get(SIGNAL_REVENUE, empty),
+        'maturing_today': maturing or MaturityBucket(date=today, count=0, principal=ZERO, payout=ZERO),
+    }
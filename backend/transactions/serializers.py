@@ -1,17 +1,19 @@
 from rest_framework import serializers
-from .models import Transaction, Deposit, Withdrawal, Investment, InvestmentPlan
+from api.profiling import ProfiledSerializerMixin
+from .models import Transaction, ArchivedTransaction, Deposit, Withdrawal, Investment, InvestmentPlan
+from .money import Money
 
-class DepositSerializer(serializers.ModelSerializer):
+class DepositSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Deposit
         fields = ['wallet_address', 'wallet_network']
 
-class WithdrawalSerializer(serializers.ModelSerializer):
+class WithdrawalSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Withdrawal
         fields = ['withdrawal_address', 'withdrawal_network', 'withdrawal_method']
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     deposit_details = DepositSerializer(read_only=True)
     withdrawal_details = WithdrawalSerializer(read_only=True)
     
@@ -19,12 +21,31 @@ class TransactionSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = ['id', 'type', 'status', 'amount', 'currency', 'date', 'description', 'deposit_details', 'withdrawal_details']
 
-class InvestmentPlanSerializer(serializers.ModelSerializer):
+class ArchivedTransactionSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    """Same shape as TransactionSerializer for rows served from the archive"""
+    deposit_details = serializers.SerializerMethodField()
+    withdrawal_details = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedTransaction
+        fields = ['id', 'type', 'status', 'amount', 'currency', 'date', 'description', 'deposit_details', 'withdrawal_details']
+
+    def get_deposit_details(self, obj):
+        if not obj.deposit_details:
+            return None
+        return {field: obj.deposit_details.get(field) for field in DepositSerializer.Meta.fields}
+
+    def get_withdrawal_details(self, obj):
+        if not obj.withdrawal_details:
+            return None
+        return {field: obj.withdrawal_details.get(field) for field in WithdrawalSerializer.Meta.fields}
+
+class InvestmentPlanSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = InvestmentPlan
         fields = ['id', 'tier', 'level', 'daily_roi', 'min_deposit', 'max_deposit', 'duration']
 
-class InvestmentSerializer(serializers.ModelSerializer):
+class InvestmentSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     plan = InvestmentPlanSerializer(read_only=True)
     progress = serializers.SerializerMethodField()
     daily_return = serializers.SerializerMethodField()
@@ -34,8 +55,14 @@ class InvestmentSerializer(serializers.ModelSerializer):
         fields = ['id', 'plan', 'amount', 'currency', 'status', 'start_date', 'end_date', 
                  'total_returns', 'progress', 'daily_return']
     
+    # Querysets annotated with Investment.objects.with_progress() are read
+    # from the annotations; single instances fall back to the model methods
     def get_progress(self, obj):
+        if hasattr(obj, 'progress_value'):
+            return obj.progress_value
         return obj.calculate_progress()
     
     def get_daily_return(self, obj):
-        return str(obj.calculate_daily_return()) 
\ No newline at end of file
+        if hasattr(obj, 'daily_return_minor'):
+            return str(Money(obj.daily_return_minor, obj.currency).amount)
+        return str(obj.calculate_daily_return())
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from accounts.models import User
+from backend.routers import mark_user_write
+from . import rollups, wallets
+from .models import Transaction, Investment
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Investment)
+def pin_owner_to_primary(sender, instance, **kwargs):
+    """Keep the owner reading from the primary right after their records change"""
+    mark_user_write(instance.user_id)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Investment)
+@receiver(post_save, sender=User)
+def update_dashboard_rollups(sender, instance, created, raw=False, **kwargs):
+    """Apply this row's change to the dashboard rollups"""
+    if raw:
+        # Fixture loading; run rebuild_dashboard_rollups afterwards
+        return
+    rollups.track_save(instance, created)
+
+
+@receiver(post_save, sender=Transaction)
+def update_wallet_balances(sender, instance, created, raw=False, **kwargs):
+    """Move the owner's per-currency wallet by this transaction's change"""
+    if raw:
+        # Fixture loading; run rebuild_wallet_balances afterwards
+        return
+    wallets.track_save(instance, created)
+
+
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Investment)
+@receiver(post_delete, sender=User)
+def remove_from_dashboard_rollups(sender, instance, **kwargs):
+    rollups.track_delete(instance)
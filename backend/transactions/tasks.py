@@ -1,9 +1,15 @@
-from django_q.tasks import schedule
-from django_q.models import Schedule
-
-def setup_investment_processing():
-    # Schedule the task to run every minute
-    schedule('django.core.management.call_command',
-             'process_investments',
-             schedule_type=Schedule.MINUTES,
-             minutes=1) 
\ No newline at end of file
+"""Jobs run on the schedules in settings.JOB_SCHEDULES (see jobs.queue)"""
+import logging
+from django.core.management import call_command
+from .rollups import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+
+def process_investments():
+    call_command('process_investments')
+
+
+def rebuild_dashboard_rollups():
+    counters = rebuild_rollups()
+    logger.info("Rebuilt dashboard rollups", extra={'rollups': len(counters)})
@@ -1,3 +1,647 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import User, SignalPlan, SignalPurchaseHistory
+from api.testing import TEST_CACHES, QueryRegressionTestCase
+from jobs.models import Job
+from .archive import archivable_transactions, archive_settled_transactions, get_user_transaction_history
+from .models import (
+    Transaction, ArchivedTransaction, Deposit, Withdrawal, Investment, InvestmentPlan, WalletBalance,
+    DashboardCounter, MaturityBucket, uuid7,
+)
+from .money import Money, fits, totals
+from .rates import rates
+from .rollups import rebuild_rollups
+from .wallets import rebuild_wallet_balances, valuation
 
-# Create your tests here.
+
+def make_user(name, **extra):
+    return User.objects.create(username=name, email=f'{name}@example.com', full_name=name.title(), **extra)
+
+
+class TransactionFixturesMixin:
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('owner', balance=Decimal('1000'), transaction_pin='1234')
+        # Enough to cover the investments and withdrawals the fixtures grow
+        WalletBalance.objects.create(user=self.user, currency='USDT', amount_minor=10_000_000)
+        self.staff = make_user('staff', is_staff=True, is_superuser=True)
+        self.plan = InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('1.50'),
+            min_deposit=Decimal('10'), max_deposit=Decimal('10000'), duration=60 * 24,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.client.force_login(self.staff)
+        self.created = 0
+
+    def grow_history(self, size):
+        """Bring the owner up to `size` deposits, withdrawals and archived transactions, each from a new user too"""
+        while self.created < size:
+            self.created += 1
+            other = make_user(f'user{self.created}')
+            for owner in (self.user, other):
+                deposit = Transaction.objects.create(user=owner, type='deposit', amount=Decimal('50'), currency='USDT')
+                Deposit.objects.create(transaction=deposit, wallet_address='wallet', wallet_network='TRC20')
+                withdrawal = Transaction.objects.create(
+                    user=owner, type='withdrawal', status='successful', amount=Decimal('5'), currency='USDT'
+                )
+                Withdrawal.objects.create(transaction=withdrawal, withdrawal_address='address')
+                ArchivedTransaction.objects.create(
+                    id=Transaction._meta.pk.default(), user=owner, type='deposit', status='successful',
+                    amount=Decimal('20'), currency='USDT', date=timezone.now() - timezone.timedelta(days=400),
+                    deposit_details={'wallet_address': 'old', 'wallet_network': 'ERC20'},
+                )
+
+    def grow_investments(self, size):
+        """Bring the owner up to `size` ongoing and completed investments, each from a new user too"""
+        while self.created < size:
+            self.created += 1
+            other = make_user(f'investor{self.created}')
+            for owner in (self.user, other):
+                for investment_status in ('ongoing', 'completed'):
+                    transaction = Transaction.objects.create(
+                        user=owner, type='investment', status='successful', amount=Decimal('100'), currency='USDT'
+                    )
+                    Investment.objects.create(
+                        user=owner, plan=self.plan, transaction=transaction, amount=Decimal('100'),
+                        status=investment_status, end_date=timezone.now() + timezone.timedelta(days=1),
+                    )
+
+
+class TransactionEndpointQueryTests(TransactionFixturesMixin, QueryRegressionTestCase):
+    def test_transaction_history(self):
+        url = reverse('user_transactions')
+        self.assertNumQueriesAtSizes(2, self.grow_history, lambda: self.api.get(url))
+
+    def test_filtered_transaction_history(self):
+        url = reverse('user_transactions')
+        self.assertNumQueriesAtSizes(2, self.grow_history, lambda: self.api.get(url, {'type': 'deposit'}))
+
+    def test_transaction_detail(self):
+        self.grow_history(1)
+        transaction = Transaction.objects.filter(user=self.user).first()
+        archived = ArchivedTransaction.objects.filter(user=self.user).first()
+        with self.assertNumQueries(1):
+            self.api.get(reverse('transaction_detail', args=[transaction.id]))
+        # Misses the live table first
+        with self.assertNumQueries(2):
+            self.api.get(reverse('transaction_detail', args=[archived.id]))
+
+    def test_user_investments(self):
+        url = reverse('user_investments')
+        self.assertNumQueriesAtSizes(2, self.grow_investments, lambda: self.api.get(url))
+
+    def test_investment_plans(self):
+        url = reverse('investment_plans')
+        grow = lambda size: [
+            InvestmentPlan.objects.get_or_create(
+                tier=tier, level=level, defaults={
+                    'daily_roi': Decimal('2'), 'min_deposit': Decimal('10'), 'max_deposit': Decimal('100'), 'duration': 60,
+                },
+            )
+            for tier, _ in InvestmentPlan.TIER_CHOICES for level, _ in InvestmentPlan.LEVEL_CHOICES[:size]
+        ]
+        self.assertNumQueriesAtSizes(1, grow, lambda: self.api.get(url), sizes=(1, 3))
+
+    def test_create_deposit(self):
+        url = reverse('create_deposit')
+        data = {'amount': '50', 'currency': 'USDT', 'wallet_address': 'wallet'}
+        # Includes queueing the admin alert email job
+        self.assertNumQueriesAtSizes(21, self.grow_history, lambda: self.api.post(url, data, format='json'))
+
+    def test_create_withdrawal(self):
+        url = reverse('create_withdrawal')
+        data = {
+            'amount': '5', 'currency': 'USDT', 'withdrawal_address': 'address',
+            'withdrawal_network': 'TRC20', 'transaction_pin': '1234',
+        }
+        self.assertNumQueriesAtSizes(26, self.grow_history, lambda: self.api.post(url, data, format='json'))
+
+    def test_create_investment(self):
+        url = reverse('create_investment')
+        data = {'plan_id': self.plan.id, 'amount': '100', 'currency': 'USDT'}
+        self.assertNumQueriesAtSizes(20, self.grow_investments, lambda: self.api.post(url, data, format='json'))
+
+    def test_pending_deposits(self):
+        self.api.force_authenticate(self.staff)
+        url = reverse('pending_deposits')
+        self.assertNumQueriesAtSizes(1, self.grow_history, lambda: self.api.get(url))
+
+
+class TransactionAdminQueryTests(TransactionFixturesMixin, QueryRegressionTestCase):
+    def test_transaction_changelist(self):
+        url = reverse('admin:transactions_transaction_changelist')
+        self.assertNumQueriesAtSizes(6, self.grow_history, lambda: self.client.get(url))
+
+    def test_transaction_change_page(self):
+        self.grow_history(1)
+        transaction = Transaction.objects.filter(user=self.user, type='deposit').first()
+        with self.assertNumQueries(15):
+            self.client.get(reverse('admin:transactions_transaction_change', args=[transaction.id]))
+
+    def test_archived_transaction_changelist(self):
+        url = reverse('admin:transactions_archivedtransaction_changelist')
+        self.assertNumQueriesAtSizes(6, self.grow_history, lambda: self.client.get(url))
+
+    def test_deposit_changelist(self):
+        url = reverse('admin:transactions_deposit_changelist')
+        self.assertNumQueriesAtSizes(5, self.grow_history, lambda: self.client.get(url))
+
+    def test_withdrawal_changelist(self):
+        url = reverse('admin:transactions_withdrawal_changelist')
+        self.assertNumQueriesAtSizes(5, self.grow_history, lambda: self.client.get(url))
+
+    def test_investment_changelist(self):
+        url = reverse('admin:transactions_investment_changelist')
+        self.assertNumQueriesAtSizes(6, self.grow_investments, lambda: self.client.get(url))
+
+    def test_admin_pending_deposits(self):
+        url = reverse('admin_pending_deposits')
+        self.assertNumQueriesAtSizes(3, self.grow_history, lambda: self.client.get(url))
+
+    def test_process_investments_command(self):
+        self.assertNumQueriesAtSizes(2, self.grow_investments, lambda: call_command('process_investments', stdout=StringIO()))
+
+    def test_operations_dashboard(self):
+        url = reverse('admin_operations_dashboard')
+        self.assertNumQueriesAtSizes(4, self.grow_investments, lambda: self.client.get(url))
+
+
+class TransactionIdTests(TestCase):
+    def test_uuid7_layout_and_order(self):
+        # A millisecond after anything generated so far, held still for the whole burst
+        ms = time.time_ns() // 1_000_000 + 1000
+        with mock.patch('transactions.models.time.time_ns', return_value=ms * 1_000_000):
+            ids = [uuid7() for _ in range(5000)]
+
+        for value in ids:
+            self.assertEqual(value.version, 7)
+            self.assertEqual(value.variant, uuid.RFC_4122)
+            self.assertEqual(value.int >> 62 & 0b11, 0b10)
+        self.assertEqual(ids[0].int >> 80, ms)
+        # More ids than the 12-bit counter holds, so the tail borrows the next millisecond
+        self.assertEqual(ids[-1].int >> 80, ms + 1)
+        self.assertTrue(all(earlier < later for earlier, later in zip(ids, ids[1:])))
+        self.assertTrue(all(earlier.bytes < later.bytes for earlier, later in zip(ids, ids[1:])))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MoneyTests(TestCase):
+    def test_arithmetic(self):
+        price = Money.of(Decimal('10.005'), 'USDT')
+        # Rounded half to even into cents
+        self.assertEqual(price.minor, 1000)
+        self.assertEqual((price + Money(1, 'USDT')).amount, Decimal('10.01'))
+        self.assertEqual(Money.of('0.00000001', 'BTC').minor, 1)
+        self.assertEqual(Money(1000, 'USDT').percent(Decimal('2.85')), Money(28, 'USDT'))
+        self.assertEqual(Money(1001, 'USDT') * Decimal('0.5'), Money(500, 'USDT'))
+        with self.assertRaises(ValueError):
+            Money(1, 'USDT') + Money(1, 'BTC')
+
+    def test_amounts_finer_than_the_minor_unit_are_refused(self):
+        self.assertTrue(fits(Decimal('12.30'), 'USDT'))
+        self.assertFalse(fits(Decimal('12.345678'), 'USDT'))
+        self.assertTrue(fits(Decimal('0.12345678'), 'BTC'))
+        api = APIClient()
+        api.force_authenticate(make_user('depositor'))
+        data = {'amount': '12.345678', 'currency': 'USDT', 'wallet_address': 'T-address'}
+        response = api.post(reverse('create_deposit'), data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'USDT amounts can have at most 2 decimal places')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_minor_columns_follow_the_amounts(self):
+        user = make_user('holder', balance=Decimal('12.34'))
+        self.assertEqual(user.balance_minor, 1234)
+        User.objects.filter(pk=user.pk).update(balance=F('balance') + Decimal('0.66'))
+        user.refresh_from_db()
+        self.assertEqual(user.balance_minor, 1300)
+        user.balance = Decimal('1.01')
+        user.save()
+        self.assertEqual(user.balance_minor, 101)
+
+        for amount, currency in [('0.10', 'USDT'), ('0.20', 'USDT'), ('0.00000003', 'BTC')]:
+            Transaction.objects.create(user=user, type='deposit', amount=Decimal(amount), currency=currency)
+        count, by_currency = totals(Transaction.objects.all(), 'amount_minor')
+        self.assertEqual(count, 3)
+        self.assertEqual(by_currency, {'USDT': Money(30, 'USDT'), 'BTC': Money(3, 'BTC')})
+
+    def test_investment_returns(self):
+        user = make_user('investor', balance=Decimal('0'), signal_strength=3,
+                         signal_expires_at=timezone.now() + timezone.timedelta(days=1))
+        plan = InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('2.80'),
+            min_deposit=Decimal('10'), max_deposit=Decimal('1000'), duration=7,
+        )
+        tx = Transaction.objects.create(user=user, type='investment', amount=Decimal('123.45'), currency='USDT')
+        investment = Investment.objects.create(
+            user=user, plan=plan, transaction=tx, amount=Decimal('123.45'), currency='USDT',
+            end_date=timezone.now() - timezone.timedelta(minutes=1),
+        )
+        self.assertEqual(investment.calculate_daily_return(), Decimal('3.46'))
+        annotated = Investment.objects.with_progress().get()
+        self.assertEqual(Money(annotated.daily_return_minor, 'USDT').amount, Decimal('3.46'))
+
+        # Loaded by an overlapping run before the payout below
+        stale = Investment.objects.select_related('user', 'plan').get(pk=investment.pk)
+        self.assertTrue(investment.process_payout())
+        self.assertFalse(stale.process_payout())
+        user.refresh_from_db()
+        # 123.45 + 7 days at 2.80% = 123.45 + 24.1962, rounded once, paid once
+        self.assertEqual(user.balance, Decimal('147.65'))
+        self.assertEqual(Transaction.objects.filter(type='investment_completed').count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class WalletTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('holder')
+        self.staff = make_user('staff', is_staff=True, is_superuser=True)
+        rates_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        self.addCleanup(os.remove, rates_file.name)
+        with rates_file:
+            json.dump({'base': 'USD', 'rates': {'USDT': '1.00', 'BTC': '50000'}}, rates_file)
+        self.rates_file = rates_file.name
+        settings = override_settings(EXCHANGE_RATES_FILE=self.rates_file, EXCHANGE_RATE_TTL=3600)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        rates.reset()
+        self.addCleanup(rates.reset)
+
+    def balances(self):
+        return dict(WalletBalance.objects.filter(user=self.user).values_list('currency', 'amount_minor'))
+
+    def deposit(self, amount, currency):
+        tx = Transaction.objects.create(user=self.user, type='deposit', amount=Decimal(amount), currency=currency)
+        Deposit.objects.create(transaction=tx, wallet_address='wallet')
+        return tx
+
+    def test_transactions_move_their_currency(self):
+        pending = self.deposit('100', 'USDT')
+        self.assertEqual(self.balances(), {})
+        pending.status = 'successful'
+        pending.save()
+        Transaction.objects.create(user=self.user, type='withdrawal', status='successful', amount=Decimal('30.5'), currency='USDT')
+        self.deposit('0.01', 'BTC')
+        self.client.force_login(self.staff)
+        self.client.post(reverse('admin:transactions_deposit_changelist'), {
+            'action': 'approve_deposits', '_selected_action': list(Deposit.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(self.balances(), {'USDT': 6950, 'BTC': 1000000})
+
+        # Archiving or deleting a settled transaction does not move money
+        Transaction.objects.filter(type='withdrawal').delete()
+        self.assertEqual(self.balances(), {'USDT': 6950, 'BTC': 1000000})
+        ArchivedTransaction.objects.create(
+            id=Transaction._meta.pk.default(), user=self.user, type='withdrawal', status='successful',
+            amount=Decimal('30.5'), currency='USDT', date=timezone.now(),
+        )
+        rebuild_wallet_balances()
+        self.assertEqual(self.balances(), {'USDT': 6950, 'BTC': 1000000})
+
+    def test_spending_never_takes_a_wallet_below_zero(self):
+        self.user.balance = Decimal('12.35')
+        self.user.transaction_pin = '1234'
+        self.user.save()
+        deposit = self.deposit('12.35', 'USDT')
+        deposit.status = 'successful'
+        deposit.save()
+        signal_plan = SignalPlan.objects.create(name='Pro', price=Decimal('5'), strength_level=3, duration_days=30)
+        plan = InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('1'), min_deposit=Decimal('1'), max_deposit=Decimal('100'), duration=7,
+        )
+        api = APIClient()
+        api.force_authenticate(self.user)
+
+        # Paid from the USDT the user holds and booked in USDT
+        response = api.post(reverse('purchase_signal_plan'), {'plan_id': signal_plan.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Transaction.objects.get(type='signal_purchase').currency, 'USDT')
+
+        # User.balance covers these, but no wallet of their currency does
+        refused = [
+            api.post(reverse('purchase_signal_plan'), {'plan_id': signal_plan.id, 'currency': 'BTC'}, format='json'),
+            api.post(reverse('create_withdrawal'), {
+                'amount': '1', 'currency': 'BTC', 'withdrawal_address': 'address',
+                'withdrawal_network': 'BTC', 'transaction_pin': '1234',
+            }, format='json'),
+            api.post(reverse('create_investment'), {'plan_id': plan.id, 'amount': '5', 'currency': 'USD'}, format='json'),
+            api.post(reverse('create_withdrawal'), {
+                'amount': '7.36', 'currency': 'USDT', 'withdrawal_address': 'address',
+                'withdrawal_network': 'TRC20', 'transaction_pin': '1234',
+            }, format='json'),
+        ]
+        self.assertEqual([response.status_code for response in refused], [400] * 4)
+        self.assertEqual(self.balances(), {'USDT': 735})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('7.35'))
+
+    def test_valuation_uses_cached_rates(self):
+        WalletBalance.objects.create(user=self.user, currency='USDT', amount_minor=12345)
+        WalletBalance.objects.create(user=self.user, currency='BTC', amount_minor=50000)
+        WalletBalance.objects.create(user=self.user, currency='XYZ', amount_minor=7)
+        valuation(self.user.pk)
+        with open(self.rates_file, 'w') as f:
+            json.dump({'base': 'USD', 'rates': {'USDT': '2', 'BTC': '1'}}, f)
+
+        with self.assertNumQueries(1):
+            result = valuation(self.user.pk)
+        self.assertEqual(result['currency'], 'USD')
+        # 123.45 USDT + 0.0005 BTC at 50000; XYZ has no rate
+        self.assertEqual(result['total'], Decimal('148.45'))
+        self.assertEqual([(wallet['currency'], wallet['value']) for wallet in result['wallets']],
+                         [('BTC', Decimal('25.00')), ('USDT', Decimal('123.45')), ('XYZ', None)])
+
+        rates.reset()
+        self.assertEqual(valuation(self.user.pk)['total'], Decimal('246.90'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DepositReviewTests(TestCase):
+    def setUp(self):
+        self.user = make_user('depositor', balance=Decimal('10'))
+        self.other = make_user('other')
+        self.staff = make_user('staff', is_staff=True, is_superuser=True)
+        self.client.force_login(self.staff)
+
+    def deposit(self, user, amount, status='pending'):
+        tx = Transaction.objects.create(user=user, type='deposit', status=status, amount=Decimal(amount), currency='USDT')
+        return Deposit.objects.create(transaction=tx, wallet_address='wallet')
+
+    def review(self, action, deposits):
+        response = self.client.post(reverse('admin:transactions_deposit_changelist'), {
+            'action': action, '_selected_action': [deposit.pk for deposit in deposits],
+        }, follow=True)
+        return [str(message) for message in response.context['messages']]
+
+    def test_approving_credits_each_deposit_once(self):
+        pending = [self.deposit(self.user, '50'), self.deposit(self.user, '25.50'), self.deposit(self.other, '7')]
+        reviewed = self.deposit(self.user, '100', status='failed')
+
+        reports = self.review('approve_deposits', pending + [reviewed])
+        self.assertEqual(len(reports), 2)
+        self.assertIn('Successfully approved 3 deposits', reports[0])
+        self.assertIn(f'Skipped 1 deposits that were no longer pending (deposit ids: {reviewed.pk})', reports[1])
+
+        self.user.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('85.50'))
+        self.assertEqual(self.other.balance, Decimal('7'))
+        self.assertEqual(dict(WalletBalance.objects.values_list('user__username', 'amount_minor')), {'depositor': 7550, 'other': 700})
+        self.assertEqual(
+            sorted(Transaction.objects.values_list('amount', 'status')),
+            [(Decimal('7'), 'successful'), (Decimal('25.5'), 'successful'), (Decimal('50'), 'successful'), (Decimal('100'), 'failed')],
+        )
+        for deposit in pending:
+            deposit.refresh_from_db()
+            self.assertEqual(deposit.reviewed_by, self.staff)
+        reviewed.refresh_from_db()
+        self.assertIsNone(reviewed.reviewed_by)
+        # One email job for the whole batch, none for the skipped deposit
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(len(Job.objects.get().kwargs['messages']), 3)
+
+        # Approving the same deposits again changes nothing
+        reports = self.review('approve_deposits', pending)
+        self.assertEqual(len(reports), 1)
+        self.assertIn('Skipped 3 deposits', reports[0])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('85.50'))
+        self.assertEqual(WalletBalance.objects.get(user=self.user).amount_minor, 7550)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_rejecting_leaves_balances_alone(self):
+        pending = [self.deposit(self.user, '50'), self.deposit(self.user, '5')]
+        reports = self.review('reject_deposits', pending)
+        self.assertIn('Successfully rejected 2 deposits', reports[0])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('10'))
+        self.assertFalse(WalletBalance.objects.exists())
+        self.assertEqual(set(Transaction.objects.values_list('status', flat=True)), {'failed'})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = make_user('investor', balance=Decimal('100'))
+        self.other = make_user('other', balance=Decimal('40'))
+        self.staff = make_user('staff', is_staff=True, is_superuser=True)
+        self.client.force_login(self.staff)
+        # Whole-number amounts and returns, which SQLite does integer arithmetic on
+        self.plan = InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('1'), min_deposit=Decimal('1'), max_deposit=Decimal('1000'), duration=60,
+        )
+        self.signal_plan = SignalPlan.objects.create(name='Pro', price=Decimal('5'), strength_level=3, duration_days=30)
+
+    def deposit(self, user, amount):
+        tx = Transaction.objects.create(user=user, type='deposit', amount=Decimal(amount), currency='USDT')
+        return Deposit.objects.create(transaction=tx, wallet_address='wallet')
+
+    def invest(self, user, amount, days):
+        tx = Transaction.objects.create(user=user, type='investment', status='successful', amount=Decimal(amount), currency='USDT')
+        return Investment.objects.create(
+            user=user, plan=self.plan, transaction=tx, amount=Decimal(amount),
+            end_date=timezone.now() + timezone.timedelta(days=days),
+        )
+
+    def rollup_state(self):
+        return (
+            sorted(DashboardCounter.objects.values_list('key', 'count', 'total')),
+            sorted(MaturityBucket.objects.values_list('date', 'count', 'principal', 'payout')),
+        )
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        approved = [self.deposit(self.user, '50'), self.deposit(self.other, '25')]
+        rejected = self.deposit(self.other, '7')
+        self.deposit(self.user, '12').transaction.delete()
+        self.deposit(self.other, '3')
+
+        halfway = self.invest(self.user, '20', days=1)
+        self.invest(self.user, '25', days=1)
+        completed = self.invest(self.other, '30', days=2)
+        withdrawn = self.invest(self.other, '15', days=3)
+        halfway.status = 'halfway'
+        halfway.save()
+        completed.status = 'completed'
+        completed.save()
+        withdrawn.delete()
+
+        for user in (self.user, self.other):
+            purchase = Transaction.objects.create(
+                user=user, type='signal_purchase', status='successful', amount=Decimal('5'), currency='USDT'
+            )
+            SignalPurchaseHistory.objects.create(user=user, plan=self.signal_plan, amount=Decimal('5'), transaction=purchase)
+        Transaction.objects.create(user=self.other, type='signal_purchase', status='pending', amount=Decimal('5'), currency='USDT')
+        purchase.delete()
+
+        self.user.balance = Decimal('70')
+        self.user.save()
+        for action, deposits in (('approve_deposits', approved), ('reject_deposits', [rejected])):
+            self.client.post(reverse('admin:transactions_deposit_changelist'), {
+                'action': action, '_selected_action': [deposit.pk for deposit in deposits],
+            })
+
+        counters, buckets = self.rollup_state()
+        self.assertIn(('pending_deposits', 1, Decimal('3')), counters)
+        self.assertIn(('user_balances', 3, Decimal('185')), counters)
+        self.assertIn(('signal_revenue', 1, Decimal('5')), counters)
+        self.assertEqual([bucket[1:] for bucket in buckets], [(2, Decimal('45'), Decimal('72'))])
+
+        rebuild_rollups()
+        self.assertEqual(self.rollup_state(), (counters, buckets))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = make_user('saver')
+        self.plan = InvestmentPlan.objects.create(
+            tier='starter', level='silver', daily_roi=Decimal('1.50'), min_deposit=Decimal('1'), max_deposit=Decimal('1000'), duration=60,
+        )
+        self.signal_plan = SignalPlan.objects.create(name='Pro', price=Decimal('5'), strength_level=3, duration_days=30)
+        self.hours = 0
+
+    def transaction(self, type, status, amount, days_ago=200):
+        tx = Transaction.objects.create(user=self.user, type=type, status=status, amount=Decimal(amount), currency='USDT')
+        # Interleave the live and archived rows in time
+        self.hours += 1
+        Transaction.objects.filter(pk=tx.pk).update(date=timezone.now() - timezone.timedelta(days=days_ago, hours=self.hours))
+        return tx
+
+    def rollup_state(self):
+        return (
+            sorted(DashboardCounter.objects.values_list('key', 'count', 'total')),
+            sorted(MaturityBucket.objects.values_list('date', 'count', 'principal', 'payout')),
+        )
+
+    def test_settled_transactions_move_to_the_archive(self):
+        deposit = self.transaction('deposit', 'successful', '100')
+        Deposit.objects.create(transaction=deposit, wallet_address='old-wallet', wallet_network='TRC20')
+        kept_pending = self.transaction('deposit', 'pending', '40')
+        Deposit.objects.create(transaction=kept_pending, wallet_address='pending-wallet')
+        withdrawal = self.transaction('withdrawal', 'successful', '30')
+        Withdrawal.objects.create(transaction=withdrawal, withdrawal_address='old-address')
+        kept_investment = self.transaction('investment', 'successful', '20')
+        Investment.objects.create(
+            user=self.user, plan=self.plan, transaction=kept_investment, amount=Decimal('20'),
+            end_date=timezone.now() + timezone.timedelta(days=1),
+        )
+        failed = self.transaction('deposit', 'failed', '500')
+        kept_purchase = self.transaction('signal_purchase', 'successful', '5')
+        SignalPurchaseHistory.objects.create(user=self.user, plan=self.signal_plan, amount=Decimal('5'), transaction=kept_purchase)
+        unlinked_purchase = self.transaction('signal_purchase', 'successful', '5')
+        kept_recent = self.transaction('deposit', 'successful', '10', days_ago=1)
+        rollups_before = self.rollup_state()
+        wallets_before = list(WalletBalance.objects.values_list('currency', 'amount_minor'))
+        history_before = [item['id'] for item in get_user_transaction_history(self.user)]
+
+        self.assertEqual(archive_settled_transactions(older_than_days=180, chunk_size=2), 4)
+
+        archived = {deposit.pk, withdrawal.pk, failed.pk, unlinked_purchase.pk}
+        self.assertEqual(set(ArchivedTransaction.objects.values_list('id', flat=True)), archived)
+        self.assertEqual(
+            set(Transaction.objects.values_list('id', flat=True)),
+            {kept_pending.pk, kept_investment.pk, kept_purchase.pk, kept_recent.pk},
+        )
+        self.assertEqual(list(Deposit.objects.values_list('wallet_address', flat=True)), ['pending-wallet'])
+        self.assertFalse(Withdrawal.objects.exists())
+        self.assertEqual(ArchivedTransaction.objects.get(pk=deposit.pk).deposit_details['wallet_address'], 'old-wallet')
+        self.assertEqual(ArchivedTransaction.objects.get(pk=withdrawal.pk).withdrawal_details['withdrawal_address'], 'old-address')
+
+        # The history reads both tables, still newest first
+        history = get_user_transaction_history(self.user)
+        self.assertEqual([item['id'] for item in history], history_before)
+        self.assertEqual([item['date'] for item in history], sorted((item['date'] for item in history), reverse=True))
+
+        # Archiving moves no money and keeps signal revenue counted
+        self.assertEqual(list(WalletBalance.objects.values_list('currency', 'amount_minor')), wallets_before)
+        self.assertEqual(self.rollup_state(), rollups_before)
+        rebuild_rollups()
+        self.assertEqual(self.rollup_state(), rollups_before)
+
+
+class TransactionQueryPlanTests(QueryRegressionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('owner')
+
+    def test_wallet_valuation(self):
+        self.assertQueryPlan(
+            WalletBalance.objects.filter(user=self.user).order_by('currency').values_list('currency', 'amount_minor'),
+            [('SEARCH', 'transactions_walletbalance', 'transactions_walletbalance_user_id_currency_becfcce9_uniq')],
+        )
+
+    def test_history(self):
+        self.assertQueryPlan(
+            Transaction.objects.filter(user=self.user).select_related('deposit_details', 'withdrawal_details'),
+            [
+                ('SEARCH', 'transactions_transaction', 'transaction_user_id_741359_idx'),
+                ('SEARCH', 'transactions_deposit', 'sqlite_autoindex_transactions_deposit_1'),
+                ('SEARCH', 'transactions_withdrawal', 'sqlite_autoindex_transactions_withdrawal_1'),
+            ],
+        )
+
+    def test_filtered_history(self):
+        self.assertQueryPlan(
+            Transaction.objects.filter(user=self.user, type='deposit', status='pending'),
+            [('SEARCH', 'transactions_transaction', 'transaction_user_id_741359_idx')],
+        )
+
+    def test_archived_history(self):
+        self.assertQueryPlan(
+            ArchivedTransaction.objects.filter(user=self.user, type='deposit'),
+            [('SEARCH', 'transactions_archivedtransaction', 'transaction_user_id_c698ba_idx')],
+        )
+
+    def test_pending_deposits(self):
+        pending = Transaction.objects.filter(type='deposit', status='pending')
+        self.assertQueryPlan(
+            Deposit.objects.filter(transaction__in=pending).select_related('transaction', 'transaction__user'),
+            [
+                ('SEARCH', 'transactions_transaction', 'sqlite_autoindex_transactions_transaction_1'),
+                ('SEARCH', 'U0', 'transaction_type_983c49_idx'),
+                ('SEARCH', 'transactions_deposit', 'sqlite_autoindex_transactions_deposit_1'),
+                ('SEARCH', 'accounts_user', 'pk'),
+            ],
+        )
+
+    def test_user_investments(self):
+        self.assertQueryPlan(
+            Investment.objects.filter(user=self.user).select_related('plan').with_progress(),
+            [
+                ('SEARCH', 'accounts_user', 'pk'),
+                ('SEARCH', 'transactions_investment', 'transactions_investment_user_id_f339e6b3'),
+                ('SEARCH', 'transactions_investmentplan', 'pk'),
+            ],
+        )
+
+    def test_active_investments(self):
+        self.assertQueryPlan(
+            Investment.objects.filter(status__in=['ongoing', 'halfway']),
+            [('SEARCH', 'transactions_investment', 'transaction_status_3b33c1_idx')],
+        )
+
+    def test_archivable_transactions(self):
+        self.assertQueryPlan(
+            archivable_transactions(timezone.now()).order_by('date')[:500],
+            [
+                ('SEARCH', 'transactions_transaction', 'transaction_status_3358ab_idx'),
+                ('SEARCH', 'transactions_investment', 'sqlite_autoindex_transactions_investment_1'),
+                ('SEARCH', 'accounts_signalpurchasehistory', 'accounts_signalpurchasehistory_transaction_id_44689d15'),
+                # Two statuses are read from the index, so they are merged by date
+                ('SORT', 'ORDER BY', None),
+            ],
+        )
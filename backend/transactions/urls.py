@@ -16,4 +16,5 @@ urlpatterns = [
     
     path('admin/pending-deposits/', views.admin_pending_deposits, name='admin_pending_deposits'),
     path('admin/update-deposit/<uuid:transaction_id>/', views.admin_update_deposit_status, name='admin_update_deposit'),
+    path('admin/dashboard/', views.admin_operations_dashboard, name='admin_operations_dashboard'),
 ] 
\ No newline at end of file
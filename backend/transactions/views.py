@@ -1,27 +1,50 @@
+import logging
 from django.shortcuts import render, redirect, get_object_or_404
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+from accounts.models import User
 from .models import Transaction, Deposit, Withdrawal, Investment, InvestmentPlan
+from . import money, wallets
 from .serializers import TransactionSerializer, DepositSerializer, InvestmentSerializer, InvestmentPlanSerializer
+from .archive import get_user_transaction_history, get_user_transaction
+from .rollups import dashboard_snapshot
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.db import transaction as db_transaction
 from decimal import Decimal
 import os
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.http import HttpResponseRedirect
+from backend.routers import use_replica
+from api.throttling import MoneyRateThrottle
+from api.idempotency import idempotent
+from api.mail import send_mail_async
+
+logger = logging.getLogger(__name__)
+
+
+def precision_error(amount, currency):
+    """A 400 response if `amount` is finer than the currency's minor unit, which would not be stored exactly"""
+    if money.fits(amount, currency):
+        return None
+    return Response(
+        {'error': f'{currency} amounts can have at most {money.exponent(currency)} decimal places'},
+        status=status.HTTP_400_BAD_REQUEST
+    )
 
 # Create your views here.
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([MoneyRateThrottle])
+@idempotent
 def create_deposit(request):
     """Create a new deposit transaction"""
     user = request.user
@@ -36,12 +59,29 @@ def create_deposit(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    # Parse and validate amount
+    try:
+        amount = Decimal(str(data['amount']))
+        if amount <= 0:
+            return Response(
+                {'error': 'Amount must be greater than zero'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    except (ArithmeticError, ValueError, TypeError):
+        return Response(
+            {'error': 'Invalid amount format'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    error = precision_error(amount, data['currency'])
+    if error:
+        return error
+    
     # Create transaction first
     transaction = Transaction.objects.create(
         user=user,
         type='deposit',
         status='pending',
-        amount=data['amount'],
+        amount=amount,
         currency=data['currency'],
         description=data.get('description', f"Deposit of {data['amount']} {data['currency']}")
     )
@@ -69,18 +109,10 @@ def create_deposit(request):
     })
     plain_message = strip_tags(html_message)
     
-    try:
-        send_mail(
-            subject,
-            plain_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [settings.ADMIN_EMAIL],
-            html_message=html_message,
-            fail_silently=False,
-        )
-    except Exception as e:
-        # Log the error but don't fail the request
-        print(f"Failed to send email notification: {str(e)}")
+    send_mail_async(
+        subject, plain_message, settings.DEFAULT_FROM_EMAIL, [settings.ADMIN_EMAIL],
+        kind='deposit_alert', html_message=html_message,
+    )
     
     # Return the created transaction
     serializer = TransactionSerializer(transaction)
@@ -88,41 +120,37 @@ def create_deposit(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@use_replica
 def get_user_transactions(request):
     """Get all transactions for the current user"""
     user = request.user
-    transactions = Transaction.objects.filter(user=user)
     
-    # Filter by type if provided
-    transaction_type = request.query_params.get('type')
-    if transaction_type:
-        transactions = transactions.filter(type=transaction_type)
-    
-    # Filter by status if provided
-    status_filter = request.query_params.get('status')
-    if status_filter:
-        transactions = transactions.filter(status=status_filter)
-    
-    serializer = TransactionSerializer(transactions, many=True)
-    return Response(serializer.data)
+    # Served from both the live and archive tables, optionally filtered by type and status
+    transactions = get_user_transaction_history(
+        user,
+        transaction_type=request.query_params.get('type'),
+        status_filter=request.query_params.get('status'),
+    )
+    return Response(transactions)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@use_replica
 def get_transaction_detail(request, transaction_id):
     """Get details of a specific transaction"""
-    try:
-        transaction = Transaction.objects.get(id=transaction_id, user=request.user)
-    except Transaction.DoesNotExist:
+    transaction = get_user_transaction(request.user, transaction_id)
+    if transaction is None:
         return Response(
             {'error': 'Transaction not found'},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    serializer = TransactionSerializer(transaction, context={'request': request})
-    return Response(serializer.data)
+    return Response(transaction)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([MoneyRateThrottle])
+@idempotent
 def create_withdrawal(request):
     """Process an immediate withdrawal for the user"""
     user = request.user
@@ -139,7 +167,7 @@ def create_withdrawal(request):
     
     # Parse and validate amount
     try:
-        amount = Decimal(data['amount'])
+        amount = Decimal(str(data['amount']))
         if amount <= 0:
             return Response(
                 {'error': 'Amount must be greater than zero'},
@@ -150,16 +178,32 @@ def create_withdrawal(request):
             {'error': 'Invalid amount format'},
             status=status.HTTP_400_BAD_REQUEST
         )
-    
-    # Check if user has sufficient balance
-    if user.balance < amount:
-        return Response(
-            {'error': 'Insufficient balance for this withdrawal'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    error = precision_error(amount, data['currency'])
+    if error:
+        return error
     
     # Execute withdrawal within a transaction to ensure atomicity
     with db_transaction.atomic():
+        # request.user may come from the auth cache, which holds no PIN,
+        # so check the PIN and the balance on the locked row
+        user = User.objects.select_for_update().get(pk=user.pk)
+        if not user.transaction_pin or not constant_time_compare(str(data['transaction_pin']), user.transaction_pin):
+            return Response(
+                {'error': 'Invalid transaction PIN'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if user.balance < amount:
+            return Response(
+                {'error': 'Insufficient balance for this withdrawal'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # The transaction debits the wallet of its own currency
+        if wallets.balance(user.pk, data['currency']) < money.Money.of(amount, data['currency']):
+            return Response(
+                {'error': f"Insufficient {data['currency']} balance for this withdrawal"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         # Deduct from user balance
         user.balance -= amount
         user.save()
@@ -188,6 +232,8 @@ def create_withdrawal(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([MoneyRateThrottle])
+@idempotent
 def create_investment(request):
     """Create a new investment from user balance"""
     user = request.user
@@ -213,7 +259,7 @@ def create_investment(request):
     
     # Parse and validate amount
     try:
-        amount = Decimal(data['amount'])
+        amount = Decimal(str(data['amount']))
         if amount <= 0:
             return Response(
                 {'error': 'Amount must be greater than zero'},
@@ -224,6 +270,9 @@ def create_investment(request):
             {'error': 'Invalid amount format'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    error = precision_error(amount, data['currency'])
+    if error:
+        return error
     
     # Validate investment amount is within plan limits
     if amount < plan.min_deposit:
@@ -238,15 +287,23 @@ def create_investment(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Check if user has sufficient balance
-    if user.balance < amount:
-        return Response(
-            {'error': 'Insufficient balance for this investment'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
     # Execute investment within a transaction to ensure atomicity
     with db_transaction.atomic():
+        # request.user may come from the auth cache, so check the balance
+        # on the locked row
+        user = User.objects.select_for_update().get(pk=user.pk)
+        if user.balance < amount:
+            return Response(
+                {'error': 'Insufficient balance for this investment'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # The transaction debits the wallet of its own currency
+        if wallets.balance(user.pk, data['currency']) < money.Money.of(amount, data['currency']):
+            return Response(
+                {'error': f"Insufficient {data['currency']} balance for this investment"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         # Deduct from user balance
         user.balance -= amount
         user.save()
@@ -282,8 +339,8 @@ def get_user_investments(request):
     """Get all investments for the current user"""
     user = request.user
     investments = Investment.objects.filter(user=user)
-    # Process payout to update status if needed
-    for investment in investments:
+    # Process payout to update status if needed (only ongoing investments can pay out)
+    for investment in investments.filter(status='ongoing').select_related('plan', 'user'):
         investment.process_payout()
     
     # Filter by status if provided
@@ -291,6 +348,7 @@ def get_user_investments(request):
     if status_filter:
         investments = investments.filter(status=status_filter)
     
+    investments = investments.select_related('plan').with_progress()
     serializer = InvestmentSerializer(investments, many=True)
     return Response(serializer.data)
 
@@ -314,6 +372,7 @@ def get_investment_detail(request, investment_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@use_replica
 def get_investment_plans(request):
     """Get all available investment plans"""
     plans = InvestmentPlan.objects.filter(is_active=True)
@@ -359,18 +418,10 @@ def approve_deposit(request, transaction_id):
         })
         plain_message = strip_tags(html_message)
         
-        try:
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-        except Exception as e:
-            # Log the error but don't fail the request
-            print(f"Failed to send email notification: {str(e)}")
+        send_mail_async(
+            subject, plain_message, settings.DEFAULT_FROM_EMAIL, [user.email],
+            kind='deposit_review', html_message=html_message,
+        )
         
         return Response({
             'status': 'success', 
@@ -505,18 +556,10 @@ def update_deposit_status(request, transaction_id):
         })
         plain_message = strip_tags(html_message)
         
-        try:
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [transaction.user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-        except Exception as e:
-            # Log the error but don't fail the request
-            print(f"Failed to send email notification: {str(e)}")
+        send_mail_async(
+            subject, plain_message, settings.DEFAULT_FROM_EMAIL, [transaction.user.email],
+            kind='deposit_review', html_message=html_message,
+        )
         
         return Response({
             'status': 'success',
@@ -625,19 +668,10 @@ def admin_update_deposit_status(request, transaction_id):
         })
         plain_message = strip_tags(html_message)
         
-        try:
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [transaction.user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-        except Exception as e:
-            # Log the error but don't fail the request
-            print(f"Failed to send email notification: {str(e)}")
-            messages.warning(request, f"Action completed but email delivery failed: {str(e)}")
+        send_mail_async(
+            subject, plain_message, settings.DEFAULT_FROM_EMAIL, [transaction.user.email],
+            kind='deposit_review', html_message=html_message,
+        )
         
         messages.success(request, f'Deposit marked as {new_status} successfully')
         return redirect('admin_pending_deposits')
@@ -650,3 +684,18 @@ def admin_update_deposit_status(request, transaction_id):
     }
     
     return render(request, 'admin/transactions/update_deposit.html', context)
+
+@staff_member_required
+def admin_operations_dashboard(request):
+    """
+    Django view with platform totals for the ops team.
+    Reads only the rollup tables, so it stays fast however big the ledger gets.
+    """
+    now = timezone.now()
+    context = dashboard_snapshot(now.date())
+    context.update({
+        'now': now,
+        'title': 'Operations Dashboard'
+    })
+    
+    return render(request, 'admin/transactions/dashboard.html', context)
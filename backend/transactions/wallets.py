@@ -0,0 +1,174 @@
+"""
+Per-currency wallet balances.
+
+`User.balance` is one number however many currencies a user moves, so each
+user also has a `WalletBalance` row per currency, in that currency's minor
+units. A transaction's effect on its owner's wallet follows from its type
+and status (WALLET_EFFECTS, mirroring when the views move `User.balance`);
+on save the effect of the loaded state is diffed against the new one and the
+difference applied with one upsert, like the dashboard rollups. Deleting or
+archiving a transaction leaves the balance alone, as it does
+`User.balance`. `rebuild_wallet_balances` recomputes every row.
+
+The views that spend money check the wallet of the currency they debit
+(`balance`, `pay_from`) inside the transaction that locks the user, so a
+wallet never goes below zero. `valuation` prices a user's wallets in memory
+with the cached exchange rates (see transactions.rates) after one indexed
+query.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_CEILING
+from django.db import connection, transaction as db_transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+from .models import Transaction, ArchivedTransaction, WalletBalance
+from .money import Money, exponent
+from .rates import rates
+
+# type -> (sign, statuses in which the amount has moved)
+WALLET_EFFECTS = {
+    'deposit': (1, ('successful',)),
+    'withdrawal': (-1, ('pending', 'successful')),
+    'investment': (-1, ('pending', 'successful')),
+    'investment_return': (1, ('successful',)),
+    'investment_completed': (1, ('successful',)),
+    'signal_purchase': (-1, ('successful',)),
+}
+
+TRACKED_FIELDS = ('user_id', 'type', 'status', 'amount', 'currency')
+
+
+def effect(values):
+    """{(user_id, currency): signed minor units} a transaction in this state has moved"""
+    if values is None:
+        return {}
+    sign, statuses = WALLET_EFFECTS.get(values['type'], (0, ()))
+    if values['status'] not in statuses:
+        return {}
+    return {(values['user_id'], values['currency']): sign * Money.of(values['amount'], values['currency']).minor}
+
+
+def current_values(instance):
+    return {name: getattr(instance, name) for name in TRACKED_FIELDS}
+
+
+def _loaded_values(instance, created):
+    if created:
+        return None
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(name in loaded for name in TRACKED_FIELDS):
+        return {name: loaded[name] for name in TRACKED_FIELDS}
+    return Transaction.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+
+
+def apply(deltas):
+    """Add {(user_id, currency): minor units} to the wallet rows in one statement"""
+    rows = [(user_id, currency, minor) for (user_id, currency), minor in deltas.items() if minor]
+    if not rows:
+        return
+    table = connection.ops.quote_name(WalletBalance._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (user_id, currency, amount_minor, updated_at) VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT (user_id, currency) DO UPDATE SET '
+            f'amount_minor = {table}.amount_minor + excluded.amount_minor, updated_at = excluded.updated_at',
+            [(user_id, currency, minor, now) for user_id, currency, minor in rows],
+        )
+
+
+def track_save(instance, created):
+    old = effect(_loaded_values(instance, created))
+    new = effect(current_values(instance))
+    if old != new:
+        deltas = defaultdict(int)
+        for key, minor in new.items():
+            deltas[key] += minor
+        for key, minor in old.items():
+            deltas[key] -= minor
+        apply(deltas)
+
+
+def _effect_expression():
+    whens = [
+        When(Q(type=kind, status__in=statuses), then=F('amount_minor') * sign)
+        for kind, (sign, statuses) in WALLET_EFFECTS.items()
+    ]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def rebuild_wallet_balances():
+    """Recompute every wallet from the live and archived transactions; returns the number of rows"""
+    totals = defaultdict(int)
+    for model in (Transaction, ArchivedTransaction):
+        rows = (
+            model.objects.order_by()
+            .filter(type__in=WALLET_EFFECTS)
+            .values_list('user_id', 'currency')
+            .annotate(total=Sum(_effect_expression()))
+        )
+        for user_id, currency, total in rows:
+            totals[user_id, currency] += total
+
+    with db_transaction.atomic():
+        WalletBalance.objects.all().delete()
+        WalletBalance.objects.bulk_create(
+            [WalletBalance(user_id=user_id, currency=currency, amount_minor=minor) for (user_id, currency), minor in totals.items()],
+            batch_size=2000,
+        )
+    return len(totals)
+
+
+def balance(user_id, currency):
+    """The user's wallet in `currency`; read it in the transaction that debits it"""
+    minor = WalletBalance.objects.filter(user_id=user_id, currency=currency).values_list('amount_minor', flat=True).first()
+    return Money(minor or 0, currency)
+
+
+def price_in(amount, currency):
+    """
+    An amount in the rate provider's base currency converted to `currency`
+    at the cached rate and rounded up to its minor unit, or None without a rate.
+    """
+    rate = rates.current()[1].get(currency)
+    if not rate:
+        return None
+    minor = (Decimal(amount) / rate).scaleb(exponent(currency)).to_integral_value(rounding=ROUND_CEILING)
+    return Money(minor, currency)
+
+
+def pay_from(user_id, amount, currency=None):
+    """
+    What to debit to pay `amount`, priced in the base currency, from one of the
+    user's wallets: the `currency` one if given, else the first that covers it,
+    trying the base currency's first. None if no wallet can. One query.
+    """
+    base = rates.current()[0]
+    wallets = WalletBalance.objects.filter(user_id=user_id, amount_minor__gt=0)
+    if currency is not None:
+        wallets = wallets.filter(currency=currency)
+    for code, minor in sorted(wallets.values_list('currency', 'amount_minor'), key=lambda row: (row[0] != base, row[0])):
+        cost = price_in(amount, code)
+        if cost is not None and cost.minor <= minor:
+            return cost
+    return None
+
+
+def valuation(user_id):
+    """
+    The user's wallets priced in the rate provider's base currency:
+    {'currency', 'wallets': [{'currency', 'amount', 'rate', 'value'}], 'total'}.
+    Wallets in a currency without a rate have no value and are left out of the total.
+    """
+    base, prices = rates.current()
+    total = Money.zero(base)
+    wallets = []
+    for currency, minor in WalletBalance.objects.filter(user_id=user_id).order_by('currency').values_list('currency', 'amount_minor'):
+        amount = Money(minor, currency).amount
+        rate = prices.get(currency)
+        value = None
+        if rate is not None:
+            value = Money.of(amount * rate, base)
+            total += value
+        wallets.append({'currency': currency, 'amount': amount, 'rate': rate, 'value': None if value is None else value.amount})
+    return {'currency': base, 'wallets': wallets, 'total': total.amount}